@@ -1,8 +1,12 @@
 import datetime
 import os
 from fnmatch import fnmatch
+import matplotlib.pyplot as plt
+import pandas as pd
 from ACSObjects.abstract_class import AbstractLevel
 from ACSObjects.Mission import Mission
+from ACSObjects.concurrency import AloftProfile
+from ACSObjects.parallel import call_method
 import string
 
 
@@ -25,7 +29,11 @@ class Event(AbstractLevel):
     pattern_dictionary['mission_folder'] = 'Mission*'
     pattern_dictionary['date_folder'] = '????-??-??'
 
-    def __init__(self, path=''):
+    def __init__(self, path='', processes=1, threads=True, lazy=True):
+        """Initialize this Event. Path specifies the path of the Event folder. The Sorties of each Mission are loaded
+        one after another by default, or in a pool of size processes, of threads or of processes, with their flight data
+        loaded at once or only when first used as set by lazy (see Mission.load_sorties).
+        """
         AbstractLevel.__init__(self)
         self.path = path
         '''Path to the Event folder'''
@@ -55,6 +63,9 @@ class Event(AbstractLevel):
         self.mission_list_date = {}
         '''Dictionary of dates, each date has a list of missions. There will be one key for every day the Event was happening'''
 
+        self.aloft_profile = None
+        '''AloftProfile of the number of UAVs aloft over all Missions and days of the Event'''
+
         self.mission_definition_csv = None
         if self.path != '':
             self.find_data()
@@ -62,7 +73,7 @@ class Event(AbstractLevel):
                 for date_path in self.path_dictionary['date_folder']:
                     for dir in os.listdir(date_path):
                         if fnmatch(dir,self.pattern_dictionary['mission_folder']):
-                            temp_mission = Mission(os.path.join(date_path,dir))
+                            temp_mission = Mission(os.path.join(date_path,dir), processes, threads, lazy)
                             self.mission_list_date.setdefault(temp_mission.date.strftime('%Y-%m-%d'), []).append(temp_mission)
 
         for date, mission_list in self.mission_list_date.iteritems():
@@ -89,25 +100,33 @@ class Event(AbstractLevel):
 
         return response_dict, response_list
 
-    def call_mission_function(self, method, arg_list):
+    def call_mission_function(self, method, arg_list=None, executor='serial', processes=None, timeout=None):
         """Calls the method specified as a string by 'method' for each mission in the event
-        Returns response_dict and response_list
+        Returns response_dict
 
-        response_dict is a dictionary of outputs from the called mission functions, with the key corresponding to the mission number.
+        The calls are run by executor: 'serial' one after another, 'thread' or 'process' in a pool of threads or
+        processes of size processes (None for one per CPU). Attributes computed by the Missions and their Sorties in
+        worker processes are copied back to the Missions of this Event. A call taking more than timeout seconds is
+        stopped (see parallel.call_method). With 'process', the flight data already loaded by the Sorties is published
+        to shared memory for the calls (see Mission.publish_flight_data), so it is not copied to every worker process.
 
-        response_list is a list of outputs from the called mission functions, in the order they were called.
-        Not reliably ordered, but more intuitive to loop through for operations where order doesn't matter.
+        response_dict is a dictionary of outputs from the called mission functions, with the key corresponding to the mission number.
+        If a call raised an exception or timed out, its output is the exception.
         """
-        response_dict = {}
-        for mission_num, mission in self.mission_list.iteritems():
-            built_method = getattr(mission, method)
-            try:
-                response = built_method(*arg_list)
-            except Exception as ex:
-                response = ex
-            response_dict[mission_num] = response
-
-        return response_dict
+        if arg_list is None:
+            arg_list = []
+        mission_nums = list(self.mission_list.keys())
+        missions = [self.mission_list[mission_num] for mission_num in mission_nums]
+        published = []
+        try:
+            if executor == 'process':
+                for mission in missions:
+                    published.append((mission, mission.publish_flight_data(loaded_only=True)))
+            responses = call_method(missions, method, arg_list, executor, processes, timeout)
+        finally:
+            for mission, shared in published:
+                mission.release_shared_data(shared.keys())
+        return dict(zip(mission_nums, responses))
 
     def get_num_sorties(self):
         """Gets the total number of sorties over the event"""
@@ -127,9 +146,10 @@ class Event(AbstractLevel):
         self.num_missions = len(self.mission_list)
         return self.num_missions
 
-    def analyze_missions(self):
-        """Makes all missions of the event execute their analysis methods"""
-        self.call_mission_function('analyze', [])
+    def analyze_missions(self, executor='serial', processes=None, timeout=None):
+        """Makes all missions of the event execute their analysis methods (see call_mission_function for the executor,
+        processes and timeout arguments)"""
+        return self.call_mission_function('analyze', [], executor, processes, timeout)
 
     def calculate_total_airtime(self):
         time_counter = datetime.timedelta(seconds=0)
@@ -156,11 +176,63 @@ class Event(AbstractLevel):
         self.mean_intersortie_time = time_counter
         return self.mean_intersortie_time
 
-    def analyze(self):
-        """Call all Event analysis methods"""
+    def get_aloft_profile(self):
+        """Returns the AloftProfile of the number of UAVs aloft over all Missions and days of the Event (see
+        concurrency), from the launch and landing times of every Sortie.
+        :return AloftProfile
+        """
+        launch_times = []
+        landing_times = []
+        for mission_num, mission in sorted(self.mission_list.items()):
+            try:
+                mission_launches, mission_landings = mission.get_launch_landing_times()
+            except Exception as ex:
+                print('Leaving Mission %s out of the aircraft aloft: %s' % (mission_num, ex))
+                continue
+            launch_times.extend(mission_launches)
+            landing_times.extend(mission_landings)
+        self.aloft_profile = AloftProfile(launch_times, landing_times)
+        return self.aloft_profile
+
+    def assess_concurrence(self, show_figure=True, save_figure=False):
+        """Generates a plot of number of UAVs aloft vs. time, with one panel per day of the Event. The step function of
+        the whole Event is only binned for each panel. Returns the AloftProfile of the Event."""
+        profile = self.get_aloft_profile()
+        days = profile.days()
+        if len(days) == 0:
+            print('No Sortie of the Event has a launch and landing time')
+            return profile
+        launches = pd.DatetimeIndex(profile.launch_times)
+        landings = pd.DatetimeIndex(profile.landing_times)
+        fig, axes = plt.subplots(len(days), 1, figsize=(11, 4 * len(days)), squeeze=False)
+        for ax, day in zip(axes[:, 0], days):
+            on_day = launches.date == day
+            start = launches[on_day].min() - pd.Timedelta(seconds=150)
+            end = landings[on_day].max() + pd.Timedelta(seconds=150)
+            plot_times, drones_aloft = profile.binned(start, end, bins=7000)
+            plot_times = plot_times.to_pydatetime()
+            width = ((plot_times[-1] - plot_times[0]).total_seconds())/(86400*len(plot_times))
+            ax.bar(plot_times, drones_aloft, width=width, linewidth=0)
+            ax.set_xlim(plot_times[0], plot_times[-1])
+            ax.set_ylabel('Number of Aircraft Aloft')
+            ax.set_title('Concurrent Sorties - %s-%s-%s' % (day.month, day.day, day.year))
+        axes[-1, 0].set_xlabel('Time of Day')
+        fig.tight_layout()
+        if save_figure:
+            save_path = os.path.join(self.path, 'FX%02d_concurrent_sorties.png' % self.find_numbering())
+            self.path_dictionary['concurrent_sorties'] = save_path
+            fig.savefig(save_path)
+
+        if show_figure:
+            plt.show()
+        return profile
+
+    def analyze(self, executor='serial', processes=None, timeout=None):
+        """Call all Event analysis methods. The Missions are analyzed by executor, e.g. executor='process' analyzes them
+        on all cores (see call_mission_function)."""
         self.find_numbering()
         print('Analyzing Event %d' % self.event_number)
-        self.analyze_missions()
+        self.analyze_missions(executor, processes, timeout)
         self.get_num_missions()
         self.get_num_sorties()
         # TODO: add other event analysis methods
@@ -1,13 +1,25 @@
 from ACSObjects.abstract_class import AbstractLevel
 from ACSObjects.Sortie import Sortie
+from ACSObjects.query import Query
+from ACSObjects import log_extract
+from ACSObjects.concurrency import AloftProfile
+from ACSObjects.time_grid import TimeGrid
+from ACSObjects.parallel import map_pool, call_method
 import datetime
 import os
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import numpy as np
+import pandas as pd
 import string
 from plot_funcs import div_plot_setup
 
+def _make_sortie(path_and_lazy):
+    """Pool task of Mission.load_sorties"""
+    sortie_path, lazy = path_and_lazy
+    return Sortie(sortie_path, lazy=lazy)
+
+
 class Mission(AbstractLevel):
     """Object to represent Mission level of hierarchy
 
@@ -27,7 +39,11 @@ class Mission(AbstractLevel):
     pattern_dictionary['sortie_folder'] = 'Sortie*'
     pattern_dictionary['concurrent_sorties'] = 'FX*concurrent_sorties.png'
 
-    def __init__(self, path=''):
+    def __init__(self, path='', processes=1, threads=True, lazy=True):
+        """Initialize this Mission. Path specifies the path of the Mission folder, whose Sortie folders are loaded with
+        Mission.load_sorties(processes, threads, lazy): by default one after another, with their flight data only loaded
+        when first used.
+        """
         AbstractLevel.__init__(self)
         self.path = path
         '''Path to the Mission folder'''
@@ -35,6 +51,9 @@ class Mission(AbstractLevel):
         self.sortie_list = {}
         '''A dictionary of sorties keyed by Sortie number. The object associated with Sortie 1 will be in sortie_list[1].'''
 
+        self.sortie_errors = {}
+        '''A dictionary of the exceptions raised while loading Sorties, keyed by the path of the Sortie folder'''
+
         self.uav_list = {}
         '''A dictionary of sorties keyed by UAV number. The object associated with Sortie2-UAV06 will be in uav_list[6].'''
 
@@ -68,16 +87,41 @@ class Mission(AbstractLevel):
         self.overlap_time = None
         '''The time from last launch to first landing'''
 
+        self.aloft_profile = None
+        '''AloftProfile of the number of UAVs aloft over the Mission'''
+
+        self.time_grid = None
+        '''TimeGrid of the flight data of all the Sorties on a common time grid, made by Mission.get_time_grid'''
+
         if self.path != '':
             self.find_data()
             if 'sortie_folder' in self.path_dictionary.keys():
-                for sortie_path in self.path_dictionary['sortie_folder']:
-                    temp_sortie = Sortie(sortie_path)
-                    self.sortie_list[temp_sortie.sortie_number] = temp_sortie
-                    self.num_sorties = len(self.sortie_list)
+                self.load_sorties(processes, threads, lazy)
 
             self.find_numbering()
 
+    def load_sorties(self, processes=1, threads=True, lazy=True):
+        """Makes the Sortie of every Sortie folder of the Mission into Mission.sortie_list, in a pool of threads (of
+        processes if threads is False, see parallel.map_pool). processes is the size of the pool, None uses one per CPU
+        and 1, the default, loads the Sorties one after another in this thread. If lazy is False, the flight data of each
+        Sortie is also loaded in the pool, which is where most of the time goes; otherwise it is loaded when first used.
+
+        A Sortie that fails to load does not stop the others: its exception is stored in Mission.sortie_errors, keyed
+        by the Sortie folder. Returns Mission.sortie_list.
+        """
+        sortie_paths = self.path_dictionary.get('sortie_folder', [])
+        self.sortie_errors = {}
+        for sortie_path, response in zip(sortie_paths, map_pool(_make_sortie, [(sortie_path, lazy)
+                                                                              for sortie_path in sortie_paths],
+                                                                processes, threads)):
+            if isinstance(response, Exception):
+                print('Could not load Sortie %s: %s' % (sortie_path, response))
+                self.sortie_errors[sortie_path] = response
+                continue
+            self.sortie_list[response.sortie_number] = response
+        self.num_sorties = len(self.sortie_list)
+        return self.sortie_list
+
     def find_numbering(self):
         """Identifies Mission/Event number and date from the path.
         Returns event number and mission number
@@ -114,41 +158,127 @@ class Mission(AbstractLevel):
         self.landing_time_list = landing_list
         return self.landing_time_dict, self.landing_time_list
 
-    def call_sortie_function(self, method, arg_list=None, skip_error=None):
+    def call_sortie_function(self, method, arg_list=None, skip_error=None, executor='serial', processes=None,
+                             timeout=None):
         """Calls the method specified as a string by 'method' for each sortie in the mission.
         The the arg_list variable will be fed as the argument to all Sortie methods.
 
         The optional skip_error argument will not call sorties who have a None value in the skip_error dict
 
+        The calls are run by executor: 'serial' one after another, 'thread' or 'process' in a pool of threads or
+        processes of size processes (None for one per CPU). Attributes computed by the Sorties in worker processes are
+        copied back to the Sorties of this Mission. A call taking more than timeout seconds is stopped (see
+        parallel.call_method). With 'process', the flight data already loaded by the Sorties is published to shared
+        memory for the calls (see Mission.publish_flight_data), so it is not copied to every worker process.
+        Figures drawn in this process are shown at the end.
+
         Returns response_dict and response_list
 
         response_dict is a dictionary of outputs from the called sortie functions, with the key corresponding to the Sortie number.
+        If a call raised an exception or timed out, its output is the exception.
 
         response_list is a list of outputs from the called sortie functions, in the order they were called.
         Not reliably ordered, but more intuitive to loop through for operations where order doesn't matter.
         """
         if arg_list is None:
             arg_list = []
+        sortie_nums = [sortie_num for sortie_num in self.sortie_list.keys()
+                       if skip_error is None or skip_error[sortie_num] is not None]
+        sorties = [self.sortie_list[sortie_num] for sortie_num in sortie_nums]
+        published = {}
+        if executor == 'process':
+            published = self.publish_flight_data(loaded_only=True, sortie_numbers=sortie_nums)
+        try:
+            responses = call_method(sorties, method, arg_list, executor, processes, timeout)
+        finally:
+            self.release_shared_data(published.keys())
         response_dict = {}
         response_list = []
-        for sortie_num, sortie in self.sortie_list.iteritems():
-            if skip_error is None or skip_error[sortie_num] is not None:
-                built_method = getattr(sortie, method)
-                try:
-                    response = built_method(*arg_list)
-                except Exception as ex:
-                    print(ex)
-                    response = ex
-                response_dict[sortie_num] = response
-                response_list.append(response)
-        plt.show()
+        for sortie_num, response in zip(sortie_nums, responses):
+            if isinstance(response, Exception):
+                print(response)
+            response_dict[sortie_num] = response
+            response_list.append(response)
+        if plt.get_fignums():
+            plt.show()
         return response_dict, response_list
 
+    def publish_flight_data(self, directory=None, loaded_only=False, sortie_numbers=None):
+        """Publishes the flight data of every Sortie (of the Sorties numbered sortie_numbers if given) to memory mapped
+        files that worker processes share without copying it (see Sortie.publish_flight_data). Returns a dictionary of
+        the shared_data.SharedFrame of each Sortie, keyed by Sortie number. Free the files with
+        Mission.release_shared_data.
+
+        If loaded_only is True, only the Sorties holding their flight data in memory and not published yet are
+        published, so no flight data is loaded, and only those are in the returned dictionary. This is what the process
+        executors of Mission.call_sortie_function and Event.call_mission_function do before a call, releasing them
+        after it.
+        """
+        if sortie_numbers is None:
+            sortie_numbers = self.sortie_list.keys()
+        published = {}
+        for sortie_num in sortie_numbers:
+            sortie = self.sortie_list[sortie_num]
+            if loaded_only and (sortie.shared_flight_data is not None or sortie.held_bytes() == 0):
+                continue
+            shared = sortie.publish_flight_data(directory)
+            if shared is not None or not loaded_only:
+                published[sortie_num] = shared
+        return published
+
+    def release_shared_data(self, sortie_numbers=None):
+        """Deletes the files of Mission.publish_flight_data, of every Sortie or of the Sorties numbered sortie_numbers"""
+        if sortie_numbers is None:
+            sortie_numbers = self.sortie_list.keys()
+        for sortie_num in sortie_numbers:
+            self.sortie_list[sortie_num].release_shared_data()
+
     def query_sorties(self,query):
-        """Calls the given query on all Sorties in the Mission. (see Sortie.query_data for information on query syntax"""
-        if isinstance(query[0], basestring):
+        """Calls the given query on all Sorties in the Mission. (see Sortie.query_data for information on query syntax
+        The queries are parsed once and the parsed queries are run on every Sortie.
+        Returns a dictionary of the queried Dataframes (Sortie.cut_data) keyed by Sortie number."""
+        if isinstance(query, Query) or isinstance(query[0], basestring):
             query = [query]
-        self.call_sortie_function('query_data',query)
+        parsed = [q if isinstance(q, Query) else Query(q) for q in query]
+        response_dict, response_list = self.call_sortie_function('query_data', parsed)
+        return response_dict
+
+    def get_phase_bounds(self, phase):
+        """Returns the bounds of the flight phase (one of flight_events.PHASES) in every Sortie as arrays, in Sortie
+        number order: sortie numbers, start rows, stop rows (-1 if the phase was not found), and the Timestamps of the
+        first and last rows of the phase (NaT if not found). The phase index of a Sortie is built if it does not have one.
+        :return numpy.array, numpy.array, numpy.array, numpy.array, numpy.array
+        """
+        sortie_numbers = sorted(self.sortie_list.keys())
+        starts = np.full(len(sortie_numbers), -1, dtype=np.int64)
+        stops = np.full(len(sortie_numbers), -1, dtype=np.int64)
+        start_times = np.full(len(sortie_numbers), np.datetime64('NaT'), dtype='datetime64[ns]')
+        end_times = np.full(len(sortie_numbers), np.datetime64('NaT'), dtype='datetime64[ns]')
+        for i, sortie_num in enumerate(sortie_numbers):
+            sortie = self.sortie_list[sortie_num]
+            if sortie.phase_bounds is None:
+                sortie.build_phase_index()
+            if sortie.phase_bounds[phase] is not None:
+                starts[i], stops[i] = sortie.phase_bounds[phase]
+                start_times[i] = np.datetime64(sortie.phase_times[phase][0])
+                end_times[i] = np.datetime64(sortie.phase_times[phase][1])
+        return np.array(sortie_numbers), starts, stops, start_times, end_times
+
+    def get_time_grid(self, fields, rate_hz=5, tolerance=None, refresh=False):
+        """Returns the values of fields (column names of Sortie.flight_data) of every Sortie on one time grid at rate_hz,
+        as a TimeGrid (see time_grid): TimeGrid.data is a (sortie, time, field) array with NaN where TimeGrid.valid is
+        False, along TimeGrid.sortie_numbers and TimeGrid.times. Each grid time takes the nearest sample of the Sortie
+        within tolerance (one grid period by default).
+
+        The grid is kept in Mission.time_grid and returned again for the same fields, rate_hz and tolerance. Use
+        refresh=True after changing the flight data of the Sorties.
+        :return TimeGrid
+        """
+        fields = [fields] if isinstance(fields, basestring) else list(fields)
+        if refresh or self.time_grid is None or not self.time_grid.same_grid(fields, rate_hz, tolerance):
+            frames = dict((sortie_num, sortie.flight_data) for sortie_num, sortie in self.sortie_list.items())
+            self.time_grid = TimeGrid(frames, fields, rate_hz, tolerance)
+        return self.time_grid
 
     def get_sortie_variable(self, variable):
         """Gets the instance variable specified by 'variable' for each sortie in the mission
@@ -324,19 +454,21 @@ class Mission(AbstractLevel):
         if show_figure:
             plt.show()
 
-    def analyze_sorties(self):
-        """Makes all the sorties in the Mission run their analysis methods"""
+    def analyze_sorties(self, executor='serial', processes=None, timeout=None):
+        """Makes all the sorties in the Mission run their analysis methods (see call_sortie_function for the executor,
+        processes and timeout arguments)"""
         print('Analyzing Mission %d' % self.mission_number)
         print('=============================')
-        responses = self.call_sortie_function('analyze',[])
+        responses = self.call_sortie_function('analyze', [], executor=executor, processes=processes, timeout=timeout)
         self.get_sortie_times()
 
-    def analyze(self,show_figures=False, save_figures=False):
+    def analyze(self,show_figures=False, save_figures=False, executor='serial', processes=None, timeout=None):
         """Calls all mission analysis methods
         If show_figure is True, it will show every graph that is generated. Not recommended unless there is a specific reason
+        The Sorties are analyzed by executor (see call_sortie_function).
         """
         # TODO: Add other analysis methods here
-        self.analyze_sorties()
+        self.analyze_sorties(executor, processes, timeout)
         self.get_sortie_times()
         self.assess_mission_times()
         self.num_sorties = len(self.sortie_list)
@@ -344,47 +476,77 @@ class Mission(AbstractLevel):
         if len(self.sortie_list) > 1:
             self.assess_launch_separation()
 
-    def make_wp_files(self):
-        """Makes the .wp files for each Sortie in the Mission"""
-        self.call_sortie_function('generate_mission_file')
+    def make_wp_files(self, processes=None):
+        """Makes the .wp files for each Sortie in the Mission (see make_log_files)"""
+        return self.make_log_files(parm=False, wp=True, processes=processes)
 
-    def make_parm_files(self):
-        """Makes the .parm files for each Sortie in the Mission"""
-        self.call_sortie_function('generate_parm')
-
-    def assess_concurrence(self, show_figure=True, save_figure=False):
-        """Generates a plot of number of UAVs aloft vs. time"""
+    def make_parm_files(self, processes=None):
+        """Makes the .parm files for each Sortie in the Mission (see make_log_files)"""
+        return self.make_log_files(parm=True, wp=False, processes=processes)
 
-        takeoff_times = self.launch_time_list
+    def make_log_files(self, parm=True, wp=True, processes=None):
+        """Extracts the .parm and/or .wp files of every Sortie with a .BIN file from its log, in one pass over each log,
+        with the logs spread over a pool of processes (see log_extract.extract_logs; processes=1 extracts them serially).
 
-        landing_times = self.landing_time_list
-
-        mat_takeoff_times = mdates.date2num(takeoff_times)
-        mat_landing_times = mdates.date2num(landing_times)
-
-        # Padding sets the whitespace before and after the histogram. Currently set to 5 minutes. mat_takeoff_times is a
-        # list of floats. Each float represents the takeoff time in days since 0001-01-01 00:00:00 UTC plus one.
-        padding = 1.0/(24*24.0)
+        Returns a dictionary keyed by Sortie number of (parm path, wp path), or the exception raised for the Sortie.
+        """
+        sortie_nums = [sortie_num for sortie_num, sortie in sorted(self.sortie_list.items())
+                       if 'bin' in sortie.path_dictionary]
+        tasks = []
+        for sortie_num in sortie_nums:
+            sortie = self.sortie_list[sortie_num]
+            tasks.append((sortie.path_dictionary['bin'][0], sortie.log_file_path('parm') if parm else None,
+                          sortie.log_file_path('wp') if wp else None))
+        response_dict = {}
+        for sortie_num, response in zip(sortie_nums, log_extract.extract_logs(tasks, processes)):
+            response_dict[sortie_num] = response
+            if isinstance(response, Exception):
+                print('Could not extract the log files of Sortie %d: %s' % (sortie_num, response))
+                continue
+            parm_path, wp_path = response
+            if parm_path is not None:
+                self.sortie_list[sortie_num].path_dictionary['params'] = parm_path
+            if wp_path is not None:
+                self.sortie_list[sortie_num].path_dictionary['waypoint_file'] = wp_path
+        return response_dict
+
+    def get_launch_landing_times(self):
+        """Returns lists of the launch and landing times of the Sorties, paired by Sortie. Sorties missing either time
+        have None for both. Uses the times found by get_sortie_times, which is called if they were not found yet."""
+        if self.launch_time_dict is None or self.landing_time_dict is None:
+            self.get_sortie_times()
+        launch_times = []
+        landing_times = []
+        for sortie_num in sorted(self.sortie_list.keys()):
+            launch_time = self.launch_time_dict.get(sortie_num)
+            landing_time = self.landing_time_dict.get(sortie_num)
+            if launch_time is None or landing_time is None:
+                launch_time = landing_time = None
+            launch_times.append(launch_time)
+            landing_times.append(landing_time)
+        return launch_times, landing_times
+
+    def get_aloft_profile(self):
+        """Returns the AloftProfile of the number of UAVs aloft over the Mission (see concurrency). It answers how many
+        UAVs were aloft at any time, the peak number and how long each number was aloft.
+        :return AloftProfile
+        """
+        launch_times, landing_times = self.get_launch_landing_times()
+        self.aloft_profile = AloftProfile(launch_times, landing_times)
+        return self.aloft_profile
 
-        times = np.linspace(min(mat_takeoff_times) - padding, max(mat_landing_times) + padding, 7000)
-        plot_times = mdates.num2date(times)
-        drones_aloft = np.zeros(len(times))
+    def assess_concurrence(self, show_figure=True, save_figure=False):
+        """Generates a plot of number of UAVs aloft vs. time. Returns the AloftProfile of the Mission (see
+        get_aloft_profile)."""
 
-        # These nested loops set up the graph.The concurrent sorties graph is built as a histogram with several thousand
-        # bins. Each bin has a value that corresponds to the number of UAVs flying at that time.
-        for time in mat_takeoff_times:
-            for jj in xrange(len(times)):
-                if times[jj] >= time:
-                    for ii in xrange(jj, len(drones_aloft)):
-                        drones_aloft[ii] = drones_aloft[ii] + 1
-                    break
+        profile = self.get_aloft_profile()
+        takeoff_times = pd.DatetimeIndex(profile.launch_times)
 
-        for time in mat_landing_times:
-            for jj in xrange(len(times)):
-                if times[jj] >= time:
-                    for ii in xrange(jj, len(drones_aloft)):
-                        drones_aloft[ii] = drones_aloft[ii] - 1
-                    break
+        # The concurrent sorties graph is built as a histogram with several thousand bins, drawn from the exact step
+        # function of the number of UAVs flying. The bins start and end 2.5 minutes before the first launch and after
+        # the last landing.
+        plot_times, drones_aloft = profile.binned(bins=7000)
+        plot_times = plot_times.to_pydatetime()
 
         # Calculate the width of each histogram bar
         width = ((plot_times[-1] - plot_times[0]).total_seconds())/(86400*len(plot_times))
@@ -402,6 +564,7 @@ class Mission(AbstractLevel):
 
         if show_figure:
             plt.show()
+        return profile
 
     def assess_launch_separation(self):
         """Calculates the mean time between launches. Returns timedelta object."""
@@ -4,10 +4,14 @@ import pandas as pd
 import numpy as np
 import os
 import string, re
+import time
+from collections import OrderedDict
 import matplotlib.pyplot as plt
 import statsmodels.formula.api as smf
 from ACSObjects.sdlog2_dump import SDLog2Parser
-import subprocess
+from ACSObjects import flight_cache, memory_cache, flight_events, geodesy, log_extract, shared_data
+from ACSObjects.live import follow_csv
+from ACSObjects.query import Query, MaskCache, apply_mask
 import helpers as hp
 
 class Sortie(AbstractLevel):
@@ -50,18 +54,51 @@ class Sortie(AbstractLevel):
     pattern_dictionary['waypoint_file'] = '*.wp'
     pattern_dictionary['all_png'] = '*.png'
 
+    csv_dtypes = {'GPS_TimeMS': np.float64, 'GPS_Week': np.float64, 'GPS_T': np.float64, 'GPS_Lat': np.float64,
+                  'GPS_Lng': np.float64, 'GPS_Alt': np.float64, 'GPS_Spd': np.float64, 'GPS_NSats': np.float64,
+                  'GPS_numSV': np.float64, 'GPS_HDop': np.float64, 'IMU_AccX': np.float32, 'IMU_AccY': np.float32,
+                  'IMU_AccZ': np.float32, 'CTUN_ThrOut': np.float64, 'BARO_Alt': np.float32, 'BARO_Press': np.float32,
+                  'ARSP_Airspeed': np.float32, 'ARSP_Temp': np.float64, 'CURR_Curr': np.float64,
+                  'CURR_Volt': np.float64, 'MODE_Mode': np.float64, 'NTUN_Arspd': np.float64, 'CMD_CNum': np.float64,
+                  'CMD_CId': np.float64}
+    """The dtypes of the known fields of the data .csv file, so pandas does not have to guess them.
+    Every field can have empty cells, so all are floats. Fields logged as single precision floats are float32.
+    Fields that are not listed here are still loaded with guessed types.
+    """
+
+    # shared_data.SharedFrame of Sortie.publish_flight_data, and chunks of Sortie.append_flight_data not yet added to
+    # the flight data, also set for Sorties pickled before they were added
+    _shared = None
+    _pending_chunks = ()
+
     # TODO: Make a 'units' or 'label' dict that will assign a certain axis label for each field in the flight_data dataframe
 
-    def __init__(self, path=''):
-        """Initialize this Sortie. Path specifies the path of the Sortie folder. It is strongly recommended to instantiate the Sortie class with a specified path."""
+    def __init__(self, path='', resample_rate=5, lazy=True):
+        """Initialize this Sortie. Path specifies the path of the Sortie folder. It is strongly recommended to instantiate the Sortie class with a specified path.
+
+        resample_rate is the rate (Hz) that data decoded from the .BIN file is resampled to. None keeps the native rate.
+        If lazy is True, the flight data is only loaded the first time Sortie.flight_data is used.
+        """
 
         AbstractLevel.__init__(self)
         print('Making Sortie for path %s' % path)
         if not (os.path.isdir(path) | (path == '')):
             path = os.path.split(str(path))[0]
 
-        self.flight_data = None
-        '''Pandas Dataframe that contains a variety of flight data. Read in from a .csv file.'''
+        self._flight_data = None
+        self._flight_data_loader = None
+        self._cut_data = None
+        self._query_mask = None
+        self._mask_cache = MaskCache()
+        self._shared = None
+        self._pending_chunks = []
+
+        self.resample_rate = resample_rate
+        '''Rate (Hz) that data decoded from the .BIN file is resampled to. None keeps every message at its native rate.'''
+
+        self.timezone = hp.DEFAULT_TZ
+        '''Time zone of the Timestamp index of the flight data (a pytz name such as 'US/Pacific', None for UTC).
+        Set it before the flight data is loaded.'''
 
         self.launch_time = None
         '''Time that the aircraft took off, determined by reaching speed threshold of 3 m/s.
@@ -120,6 +157,14 @@ class Sortie(AbstractLevel):
         self.log_end_time = None
         '''Last timestamp in the log file'''
 
+        self.phase_bounds = None
+        '''OrderedDict of the flight phases (flight_events.PHASES) and their (start, stop) row positions in flight_data,
+        None for the phases that were not found. Made by Sortie.find_event_times or the first Sortie.phase call.'''
+
+        self.phase_times = None
+        '''OrderedDict of the flight phases and the Timestamps of their first and last rows, None for the phases that were
+        not found'''
+
         # TODO: Maybe make these dictionaries loaded from an external .txt file?
 
         self.waypoint_dict = {'egress': [15, 19], 'pre-climbout': 2, 'pre-handoff': 3, 'auto_landing_sequence': {'A': [13, 15, 17], 'B': [19, 21, 23]}, 'land': [17, 23]}
@@ -148,7 +193,9 @@ class Sortie(AbstractLevel):
         self.fx_data = None
         '''Tuple of (Sortie.event_number,Sortie.mission_number,Sortie.sortie_number,Sortie.uav_number'''
 
-        self.cut_data = None
+        self.load_stats = None
+        '''Dictionary describing the last load of Sortie.flight_data: source ('csv', 'cache' or 'bin'), file path, file
+        bytes, rows, memory bytes of the Dataframe and seconds taken'''
 
         self.x_data = None
         self.x_label = ''
@@ -183,92 +230,303 @@ class Sortie(AbstractLevel):
         # and then load the data .csv file if it was found
         if path != '':
             self.set_path(path)
-            self.cut_data = self.flight_data.copy()
+            if not lazy:
+                self.flight_data
         else:
             self.path = path
             '''Path of the Sortie folder'''
 
     def extractFromDataFlash(self):
-        """Given the path to a .BIN file, generate the .csv and load the .csv into the Sortie object
+        """Given the path to a .BIN file, generate the .csv file of the Sortie, resampled to Sortie.resample_rate. Returns the path to the .csv file.
         NOTE: The current workflow does not utilize this method. In order for us to sort the .BIN files into the necessary
         file hierarchy, the .csv files need to already be generated. However, in theory this method would be useful in order
-        to make .csv files of unsorted .BIN files.
+        to make .csv files of unsorted .BIN files. Sortie.load_bin reads the .BIN file directly without writing a .csv.
         """
+        self.path_dictionary['data_csv'] = [os.path.join(self.path, 'FX%02d-M%02d-S%02d-UAV%02d.csv' % (
+            self.fx_data[0], self.fx_data[1], self.fx_data[2], self.fx_data[3]))]
+
+        # Use sdlog2_dump.py code to generate the desired CSV file
+        parser = self.make_log_parser()
+        parser.setFileName(self.path_dictionary['data_csv'][0])
+        try:
+            parser.process(self.path_dictionary['bin'][0])
+        finally:
+            parser.setFileName(None)
+
+        return self.path_dictionary['data_csv'][0]
+
+    def make_log_parser(self):
+        """Returns an SDLog2Parser set up to extract the messages and fields used by the Sortie from the .BIN file"""
         if self.event_number is None:
-            self.event_number = raw_input('Please enter event number for path %s' % self.path)
+            self.event_number = int(raw_input('Please enter event number for path %s' % self.path))
 
         if self.event_number == 22:
             sat_message = 'numSV'
         else:
             sat_message = 'NSats'
 
-            # Set sdlog2_dump.py parameters
-            debut_out = False
-            correct_errors = False
-            msg_filter = []
-            time_msg = ""
-            opt = None
-            csv_delim = ","
-            csv_null = ""
-
-            self.path_dictionary['data_csv'] = os.path.join(self.path, 'FX%02d-M%02d-S%02d-UAV%02d.csv' % (
-            self.fx_data[0], self.fx_data[1], self.fx_data[2], self.fx_data[3]))
-
-            # Specify messages to extract
-            msg_filter = [('GPS', ['TimeMS', 'Week', 'T', 'Lat', 'Lng', 'Alt', 'Spd', sat_message, 'HDop']),
-                          ('IMU', ['AccX', 'AccY', 'AccZ']),
-                          ('CTUN', ['ThrOut']),
-                          ('BARO', ['Alt', 'Press']),
-                          ('ARSP', ['Airspeed', 'Temp']),
-                          ('CURR', ['Curr', 'Volt']),
-                          ('MODE', ['Mode']),
-                          ('NTUN', ['Arspd']),
-                          ('CMD', ['CNum', 'CId'])]
-
-            # Use sdlog2_dump.py code to generate the desired CSV file
-            parser = SDLog2Parser()
-            parser.setCSVDelimiter(csv_delim)
-            parser.setCSVNull(csv_null)
-            parser.setMsgFilter(msg_filter)
-            parser.setTimeMsg(time_msg)
-            parser.setDebugOut(debut_out)
-            parser.setCorrectErrors(correct_errors)
-            parser.setFileName(self.path_dictionary['data_csv'])
-
-            parser.process(self.path_dictionary['bin'])
+        # Set sdlog2_dump.py parameters
+        debug_out = False
+        correct_errors = False
+        time_msg = None
+        csv_delim = ","
+        csv_null = ""
+
+        # Specify messages to extract
+        msg_filter = hp.sortie_msg_filter(sat_message)
+
+        parser = SDLog2Parser()
+        parser.setCSVDelimiter(csv_delim)
+        parser.setCSVNull(csv_null)
+        parser.setMsgFilter(msg_filter)
+        parser.setTimeMsg(time_msg)
+        parser.setDebugOut(debug_out)
+        parser.setCorrectErrors(correct_errors)
+        parser.setEngine(SDLog2Parser.ENGINE_NUMPY)
+        parser.setResampleRate(self.resample_rate)
+        return parser
 
     def set_path(self, path):
         """If Sortie was instantiated without a Path, this will add a path the the object.
+        The flight data is then loaded from the .csv file, or from the .BIN file if there is no .csv file, the first time
+        Sortie.flight_data is used.
 
         DO NOT use this method if you have already created the Sortie object with a path, because then the data contained within the class will be mixed
         """
         self.path = path
         self.find_data()
+        self.find_numbering()
         if 'data_csv' in self.path_dictionary.keys():
-            print('Loading Data CSV')
-            self.load_csv()
-        else:
-            self.extractFromDataFlash()
-        # TODO: An 'else' statement here could auto-generate the data .csvs with extractFromDataFlash, at the expense of waiting for the csv to be created.
+            self._flight_data_loader = ('load_csv', ())
+        elif 'bin' in self.path_dictionary.keys():
+            self._flight_data_loader = ('load_bin', ())
+
+    @property
+    def flight_data(self):
+        """Pandas Dataframe that contains a variety of flight data. Read in from a .csv file.
+
+        Data loaded from a file counts against the memory budget shared by all Sorties (see memory_cache). It may be
+        released when other Sorties need the memory, and is then loaded again from the file the next time it is used.
+        Data assigned directly is kept until it is replaced or Sortie.dump_data is called.
+        Data published with Sortie.publish_flight_data is mapped from the shared files instead, without a copy.
+        Chunks appended with Sortie.append_flight_data are added to the Dataframe here, all at once.
+        """
+        if len(self._pending_chunks) > 0:
+            frames = ([] if self._flight_data is None else [self._flight_data]) + self._pending_chunks
+            self._flight_data = pd.concat(frames) if len(frames) > 1 else frames[0]
+            self._pending_chunks = []
+        if self._flight_data is None and self._shared is not None and self._shared.exists():
+            self._flight_data = self._shared.frame()
+        elif self._flight_data is None and self._flight_data_loader is not None:
+            method, args = self._flight_data_loader
+            getattr(self, method)(*args)
+        elif self._flight_data_loader is not None and self._shared is None and not memory_cache.touch(self):
+            # unpickled Sortie holding its data
+            memory_cache.register(self, self.held_bytes())
+        return self._flight_data
+
+    @flight_data.setter
+    def flight_data(self, flight_data):
+        self.release_shared_data()
+        self._flight_data = flight_data
+        self._pending_chunks = []
+        self.phase_bounds = None
+        self.phase_times = None
+        self._flight_data_loader = None
+        memory_cache.forget(self)
+
+    @property
+    def cut_data(self):
+        """Pandas Dataframe holding the result of the queries made with Sortie.query_data. Until a query is made, or after
+        a reset, it is Sortie.flight_data itself. Rows selected by queries are kept as a mask of Sortie.flight_data, and
+        the Dataframe is only made from it when cut_data is used (a view of flight_data if the rows are contiguous).
+        """
+        if self._cut_data is None:
+            if self._query_mask is None:
+                return self.flight_data
+            self._cut_data = apply_mask(self.flight_data, self._query_mask)
+            self.update_held_bytes()
+        return self._cut_data
+
+    @cut_data.setter
+    def cut_data(self, cut_data):
+        self._cut_data = cut_data
+        self._query_mask = None
+        self.update_held_bytes()
+
+    def update_held_bytes(self):
+        """Updates the bytes recorded in memory_cache for the Dataframes of flight data loaded from a file"""
+        if self._flight_data_loader is not None and self._flight_data is not None and self._shared is None:
+            memory_cache.register(self, self.held_bytes())
+
+    def held_bytes(self):
+        """Returns the bytes of memory held by the flight_data and cut_data Dataframes"""
+        held = 0
+        for data in [self._flight_data, self._cut_data] + list(self._pending_chunks):
+            if data is not None:
+                held += int(data.memory_usage(index=True).sum())
+        return held
+
+    def keep_flight_data(self, flight_data, method, args=()):
+        """Stores flight_data loaded by the Sortie method called with args, which memory_cache calls again to reload it
+        after releasing it."""
+        self.release_shared_data()
+        self._flight_data = flight_data
+        self._cut_data = None
+        if self._query_mask is not None and len(self._query_mask) != len(flight_data):
+            self._query_mask = None
+        if (method, tuple(args)) != self._flight_data_loader:
+            # not a reload of the same rows
+            self.phase_bounds = None
+            self.phase_times = None
+        self._flight_data_loader = (method, tuple(args))
+        memory_cache.register(self, self.held_bytes())
+
+    def release_flight_data(self):
+        """Frees the flight_data and cut_data Dataframes. Data loaded from a file is loaded again the next time
+        Sortie.flight_data is used. The rows selected by Sortie.query_data are kept, but a Dataframe assigned to
+        Sortie.cut_data is lost."""
+        self._flight_data = None
+        self._pending_chunks = []
+        self._cut_data = None
+        self._mask_cache.clear()
+        memory_cache.forget(self)
+
+    def publish_flight_data(self, directory=None):
+        """Writes Sortie.flight_data once to memory mapped files (see shared_data.publish), loading it if needed. A copy
+        of this Sortie sent to a worker process (see parallel.call_method) then carries no Dataframe: it maps the
+        shared files the first time it uses Sortie.flight_data, and all the processes share the same memory.
+        Returns the shared_data.SharedFrame, None if the Sortie has no flight data. Free the files with
+        Sortie.release_shared_data; replacing or reloading the flight data also frees them.
+        """
+        if self._shared is not None and self._shared.exists():
+            return self._shared
+        flight_data = self.flight_data
+        if flight_data is None:
+            return None
+        self._shared = shared_data.publish(flight_data, directory, prefix='sortie%s-' % self.sortie_number)
+        return self._shared
+
+    @property
+    def shared_flight_data(self):
+        """shared_data.SharedFrame of the flight data published with Sortie.publish_flight_data, None if it is not"""
+        return self._shared
+
+    def release_shared_data(self):
+        """Deletes the files of Sortie.publish_flight_data, in the process that published them. A Sortie of a worker
+        process only forgets them."""
+        if self._shared is not None:
+            self._shared.release()
+            self._shared = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if state.get('_shared') is not None:
+            # the data is mapped again from the shared files
+            state['_flight_data'] = None
+            state['_cut_data'] = None
+        return state
+
+    event_attributes = [('launch', 'launch_time'), ('landing', 'landing_time'), ('climbout', 'climbout_time'),
+                        ('handoff', 'handoff_time'), ('egress', 'egress_time'), ('land_cmd', 'land_cmd_time'),
+                        ('last_land_cmd', 'last_land_cmd_time'), ('landbreak', 'landbreak_time')]
+    """Pairs of flight event names (see flight_events.EVENTS) and the Sortie attributes holding their Timestamps"""
+
+    def detect_events(self):
+        """Finds the times of all flight events in one pass over the GPS_Spd, CMD_CNum and CMD_CId columns, without
+        copying or querying Sortie.flight_data (see flight_events.detect_events for the criteria). Returns a dictionary
+        of event name to Timestamp, None for the events that did not happen.
+        :return dict
+        """
+        df = self.flight_data
+        positions = self.detect_event_positions()
+        return dict((name, None if position is None else df.index[position]) for name, position in positions.items())
 
-        self.find_numbering()
+    def detect_event_positions(self):
+        """Like Sortie.detect_events, but returns the row positions of the events in Sortie.flight_data
+        :return dict
+        """
+        df = self.flight_data
+        columns = [df[name].values if name in df.columns else None
+                   for name in ('GPS_Spd', 'CMD_CNum', 'CMD_CId', 'BARO_Alt')]
+        return flight_events.detect_events(columns[0], columns[1], columns[2], self.waypoint_dict, self.cid_list,
+                                           baro_alt=columns[3])
+
+    def build_phase_index(self, positions=None):
+        """Sets Sortie.phase_bounds and Sortie.phase_times from the event row positions of
+        Sortie.detect_event_positions (found again if not given). Returns Sortie.phase_bounds.
+        :return OrderedDict
+        """
+        if positions is None:
+            positions = self.detect_event_positions()
+        index = self.flight_data.index
+        self.phase_bounds = flight_events.phase_bounds(positions, len(index))
+        self.phase_times = OrderedDict((name, None if bounds is None else (index[bounds[0]], index[bounds[1] - 1]))
+                                       for name, bounds in self.phase_bounds.items())
+        return self.phase_bounds
+
+    def phase(self, name):
+        """Returns the rows of Sortie.flight_data in the flight phase name (one of flight_events.PHASES) as an iloc
+        slice, which shares the data of flight_data instead of copying it. Returns None if the phase was not found.
+        :return Pandas.Dataframe()
+        """
+        return self.phase_span(name, name)
+
+    def phase_span(self, first, last):
+        """Returns the rows of Sortie.flight_data from the start of phase first to the end of phase last as an iloc
+        slice, e.g. Sortie.phase_span('launch', 'landing') for the whole flight. Returns None if either phase was not found.
+        :return Pandas.Dataframe()
+        """
+        for name in (first, last):
+            if name not in flight_events.PHASES:
+                raise KeyError('%s is not a flight phase, phases are %s' % (name, ', '.join(flight_events.PHASES)))
+        if self.phase_bounds is None:
+            self.build_phase_index()
+        if self.phase_bounds[first] is None or self.phase_bounds[last] is None:
+            return None
+        return self.flight_data.iloc[self.phase_bounds[first][0]:self.phase_bounds[last][1]]
+
+    def find_event_times(self, do_everything=True):
+        """Sets the Timestamp attributes of all flight events (Sortie.event_attributes) from one Sortie.detect_events
+        pass. If do_everything is False, only the attributes that are still None are set. Returns the list of the
+        events that were not found.
+        :return list
+        """
+        positions = self.detect_event_positions()
+        index = self.flight_data.index
+        events = dict((name, None if position is None else index[position]) for name, position in positions.items())
+        self.build_phase_index(positions)
+        missing = []
+        for name, attribute in self.event_attributes:
+            if getattr(self, attribute) is None or do_everything:
+                if events[name] is None:
+                    missing.append(name)
+                else:
+                    setattr(self, attribute, events[name])
+        self.land_cmd = self.land_cmd_time
+        self.last_land_cmd = self.last_land_cmd_time
+        return missing
+
+    def find_event_time(self, name):
+        """Returns the Timestamp of the flight event name (see Sortie.detect_events). Raises IndexError if the event
+        did not happen."""
+        event_time = self.detect_events()[name]
+        if event_time is None:
+            raise IndexError('No %s found in the flight data of Sortie %s' % (name, self.sortie_number))
+        return event_time
 
     def find_launch_time(self):
         """Returns a Timestamp of launch time.
         Currently, this is based on GPS_Spd going over 5 m/s. A more robust approach would be to check that forward
         acceleration reached at least 20 m/s/s, but this simpler approach has not yet been erroneous.
         """
-        df = self.query_data(['GPS_Spd >= 5'])
-        self.query_data(['reset'])
-        self.launch_time = df.index[0]
+        self.launch_time = self.find_event_time('launch')
         return self.launch_time
 
     def find_landing_time(self):
         """Returns a Timestamp of landing time. TODO: Take into account deceleration so as to not include sliding on ground"""
         # TODO: Take into account deceleration so as to not include sliding on ground
-        df = self.query_data(['GPS_Spd > 3'])
-        self.query_data(['reset'])
-        self.landing_time = df.index[-1]
+        self.landing_time = self.find_event_time('landing')
         return self.landing_time
 
     def calculate_sortie_duration(self):
@@ -281,21 +539,13 @@ class Sortie(AbstractLevel):
 
     def find_land_cmd_time(self):
         """Returns the first time a landing command was issued to the UAV. """
-        self.query_data(['CMD_CNum == %d' % self.waypoint_dict['land'][0]])
-        for wp in range(1,len(self.waypoint_dict['land'])):
-            self.query_data(['or','CMD_CNum == %d' % self.waypoint_dict['land'][wp]])
-        self.land_cmd = self.cut_data.index[0]
-        self.query_data(['reset'])
-        return self.cut_data.index[0]
+        self.land_cmd_time = self.land_cmd = self.find_event_time('land_cmd')
+        return self.land_cmd_time
 
     def find_last_land_cmd_time(self):
         """Returns the last time a landing command was issued to the UAV. """
-        self.query_data(['CMD_CNum == %d' % self.waypoint_dict['land'][0]])
-        for wp in range(1,len(self.waypoint_dict['land'])):
-            self.query_data(['or','CMD_CNum == %d' % self.waypoint_dict[wp]])
-        self.query_data(['reset'])
-        self.last_land_cmd = self.cut_data[-1]
-        return self.cut_data[-1]
+        self.last_land_cmd_time = self.last_land_cmd = self.find_event_time('last_land_cmd')
+        return self.last_land_cmd_time
 
     def find_handoff_time(self):
         """Determine the (clock) time of when the sortie is considered to have reached handoff
@@ -304,12 +554,12 @@ class Sortie(AbstractLevel):
             to next waypoint
         :return: Timestamp
         """
-        self.handoff_time = self.flight_data.index[ self.flight_data.CMD_CNum == self.waypoint_dict['pre-handoff']][-1]
+        self.handoff_time = self.find_event_time('handoff')
         return self.handoff_time
 
     def find_climbout_time(self):
         """Determine the time that the UAV reached climbout"""
-        self.climbout_time = self.flight_data.index[self.flight_data.CMD_CNum == self.waypoint_dict['pre-climbout']][-1]
+        self.climbout_time = self.find_event_time('climbout')
         return self.climbout_time
 
     def find_egress_time(self):
@@ -317,12 +567,9 @@ class Sortie(AbstractLevel):
         and proceeds to landing
         :return Timestamp
     """
-        df = self.flight_data.copy()
-        for egress_wp in self.waypoint_dict['egress']:
-            cut_data = df.index[df.CMD_CNum == egress_wp]
-            if len(cut_data) > 0:
-                self.egress_time = cut_data[0]
-                break
+        egress_time = self.detect_events()['egress']
+        if egress_time is not None:
+            self.egress_time = egress_time
 
         return self.egress_time
 
@@ -331,8 +578,7 @@ class Sortie(AbstractLevel):
         - Measured when targeted waypoint transitions to landing waypoint (WP#17 or #23)
         :return Datetime
     """
-        df = self.flight_data.copy()
-        self.landbreak_time = df.index[df.CMD_CId == self.cid_list['land']][0] # index of first message with the 'land' command ID
+        self.landbreak_time = self.find_event_time('landbreak') # first message with the 'land' command ID
         return self.landbreak_time
 
     def checkIfAutoLand(self):
@@ -386,56 +632,206 @@ class Sortie(AbstractLevel):
         climbout_lng = df['GPS_Lng'][end_time]
 
         # Compute distance
-        self.climbout_distance = hp.distance_2GPS(launch_lat, launch_lng, climbout_lat, climbout_lng)
+        self.climbout_distance = float(geodesy.haversine(launch_lat, launch_lng, climbout_lat, climbout_lng))
 
         # Compute dAlt
         self.climbout_dAlt = df.GPS_Alt[end_time] - df.GPS_Alt[on_rails]
 
         return self.climbout_distance, self.climbout_dAlt
 
+    def get_track(self):
+        """Returns a Dataframe indexed like Sortie.flight_data describing the trajectory at every sample, computed on the
+        whole GPS columns at once (see geodesy): east, north and up in meters from the launch point (the first GPS fix if
+        the launch time is unknown), path_length travelled in meters, distance_from_launch and distance_to_target (the
+        target landing point) in meters.
+        :return Pandas.Dataframe()
+        """
+        df = self.flight_data
+        lat = df['GPS_Lat'].values
+        lng = df['GPS_Lng'].values
+        alt = df['GPS_Alt'].values
+        fixes = np.flatnonzero(np.isfinite(lat) & np.isfinite(lng))
+        if len(fixes) == 0:
+            raise IndexError('Sortie %s has no GPS fix' % self.sortie_number)
+        ref = fixes[0]
+        if self.launch_time is not None:
+            ref = fixes[min(np.searchsorted(fixes, df.index.searchsorted(self.launch_time)), len(fixes) - 1)]
+        east, north, up = geodesy.geodetic_to_enu(lat, lng, alt, lat[ref], lng[ref], alt[ref])
+        return pd.DataFrame({'east': east, 'north': north, 'up': up,
+                             'path_length': geodesy.path_length(lat, lng),
+                             'distance_from_launch': geodesy.haversine(lat, lng, lat[ref], lng[ref]),
+                             'distance_to_target': geodesy.haversine(lat, lng, self.target_landing_lat,
+                                                                     self.target_landing_lng)},
+                            index=df.index, columns=['east', 'north', 'up', 'path_length', 'distance_from_launch',
+                                                     'distance_to_target'])
+
+    def log_file_path(self, extension):
+        """Returns the path of the FX??-M??-S??-UAV??.extension file of this Sortie
+        :return str
+        """
+        return os.path.join(self.path, 'FX%02d-M%02d-S%02d-UAV%02d.%s' % (
+            self.event_number, self.mission_number, self.sortie_number, self.uav_number, extension))
+
     def generate_parm(self):
-        """Use mavparms.py to construct list of parameters for this Sortie from the dataflash log. Returns the path to the newly created file.
+        """Extracts the parameters of this Sortie from the dataflash log into a .parm file, in the format of mavparms.py
+        (see log_extract). Returns the path to the newly created file.
         :return str
         """
         print('Generating .parm file for %s' % self.path_dictionary['bin'][0])
-        proc = subprocess.Popen(["mavparms.py", self.path_dictionary['bin'][0]], stdout=subprocess.PIPE)
-        out, err = proc.communicate()
-
-        output_file = os.path.join(self.path, 'FX%02d-M%02d-S%02d-UAV%02d.parm' % (
-        self.fx_data[0], self.fx_data[1], self.fx_data[2], self.fx_data[3]))
-        with open(output_file, 'w') as open_output:
-            open_output.write(out)
+        output_file = log_extract.write_params(log_extract.extract_params(self.path_dictionary['bin'][0]),
+                                               self.log_file_path('parm'))
 
         self.path_dictionary['params'] = output_file
         return self.path_dictionary['params']
 
     def generate_mission_file(self):
-        """Use mavmission.py to generate the waypoint mission file for the Sortie"""
+        """Extracts the waypoint mission of this Sortie from the dataflash log into a .wp file, in the format of
+        mavmission.py (see log_extract). Returns the path to the newly created file.
+        :return str
+        """
         print('Generating mission file for %s' % self.path_dictionary['bin'])
+        output_file = log_extract.write_mission(log_extract.extract_mission(self.path_dictionary['bin'][0]),
+                                                self.log_file_path('wp'))
 
-        # Call 'mavmission.py' tool to extract mission, with designated output file
-        optionStr = "--output=" + os.path.join(self.path,'FX%02d-M%02d-S%02d-UAV%02d.wp' % (self.event_number, self.mission_number, self.sortie_number, self.uav_number))
-        subprocess.Popen(["mavmission.py", self.path_dictionary['bin'][0], optionStr], stdout=subprocess.PIPE)
-
-        self.path_dictionary['waypoint_file'] = os.path.join(self.path,'FX%02d-M%02d-S%02d-UAV%02d.wp' % (self.event_number, self.mission_number, self.sortie_number, self.uav_number))
+        self.path_dictionary['waypoint_file'] = output_file
+        return self.path_dictionary['waypoint_file']
 
-    def load_csv(self):
+    def load_csv(self, columns=None, use_cache=True):
         """Loads the .csv data from the FX??-M??-S??.csv file into the Sortie.flight_data variable. Returns pandas Dataframe.
 
         The GPS_TimeMS and GPS_Week fields are used to generate a new Timestamp index for the Dataframe. Any CSVs that
         have fields in the form of GPS_GMS or GPS_GWk are also supported and turned into this Timestamp index format.
+
+        If use_cache is True, the Dataframe is read from the binary cache next to the .csv file (see flight_cache), which
+        is made on the first load and remade whenever the .csv file changes. columns optionally restricts the
+        Dataframe to the listed fields. Without the cache, only those fields are parsed from the .csv file.
+        The time taken and size of the load are stored in Sortie.load_stats.
+        :return Pandas.Dataframe()
+        """
+        start = time.time()
+        csv_path = self.path_dictionary['data_csv'][0]
+        flight_data = None
+        source = 'cache'
+        if use_cache:
+            flight_data = flight_cache.read_cache(csv_path, columns, self.timezone)
+        if flight_data is None:
+            print('Reading %s' % self.path_dictionary['data_csv'])
+            source = 'csv'
+            # the cache holds every field, so only project the .csv read when there is no cache to write
+            flight_data = self.index_flight_data(self.read_flight_csv(csv_path, None if use_cache else columns),
+                                                 self.timezone)
+            if use_cache:
+                flight_cache.write_cache(csv_path, flight_data, self.timezone)
+            if columns is not None:
+                flight_data = flight_data[[name for name in flight_data.columns if name in columns]]
+        else:
+            print('Reading cache of %s' % self.path_dictionary['data_csv'])
+        self.keep_flight_data(flight_data, 'load_csv', (columns, use_cache))
+        self.record_load_stats(source, csv_path, start)
+        return self.flight_data
+
+    csv_renames = {'GPS_GMS': 'GPS_TimeMS', 'GPS_GWk': 'GPS_Week'}
+    """Old names of fields of data .csv files, and the names they are renamed to"""
+
+    @classmethod
+    def csv_column_dtypes(cls, header):
+        """Returns the dtypes of Sortie.csv_dtypes for the columns named in header (a list of .csv column names, old
+        names included), as a dictionary by column name for pandas.read_csv"""
+        return dict((name, cls.csv_dtypes[cls.csv_renames.get(name, name)]) for name in header
+                    if cls.csv_renames.get(name, name) in cls.csv_dtypes)
+
+    @classmethod
+    def read_flight_csv(cls, csv_path, columns=None):
+        """Reads a data .csv file into a Dataframe with the dtypes of Sortie.csv_dtypes, without indexing it.
+        columns optionally restricts the Dataframe to the listed fields, plus the GPS time fields needed for the index.
+        Old GPS_GMS and GPS_GWk fields are renamed to GPS_TimeMS and GPS_Week.
         :return Pandas.Dataframe()
         """
-        print('Reading %s' % self.path_dictionary['data_csv'])
-        self.flight_data = pd.read_csv(self.path_dictionary['data_csv'][0])
-        if 'GPS_GMS' in self.flight_data.columns:
-            self.flight_data.rename(columns={'GPS_GMS':'GPS_TimeMS','GPS_GWk': 'GPS_Week'}, inplace=True)
-        self.flight_data = self.flight_data[np.isfinite(self.flight_data['GPS_TimeMS'])]
-        datetime_list = hp.convertSeriesGPSTime(self.flight_data.GPS_TimeMS/1000., self.flight_data.GPS_Week)
-        pd.DatetimeIndex([i.replace(tzinfo=None) for i in datetime_list])
-        self.flight_data.index = datetime_list
+        with open(csv_path, 'r') as csv_file:
+            header = csv_file.readline().strip().split(',')
+        renames = cls.csv_renames
+        usecols = None
+        if columns is not None:
+            wanted = set(columns) | set(['GPS_TimeMS', 'GPS_Week'])
+            usecols = [name for name in header if renames.get(name, name) in wanted]
+        flight_data = pd.read_csv(csv_path, usecols=usecols, dtype=cls.csv_column_dtypes(usecols or header))
+        return flight_data.rename(columns=renames)
+
+    def record_load_stats(self, source, path, start):
+        """Stores the size and time taken of a load of Sortie.flight_data from path, started at time start, in
+        Sortie.load_stats and prints them.
+        """
+        self.load_stats = {'source': source, 'path': path, 'bytes': os.path.getsize(path),
+                           'rows': len(self.flight_data),
+                           'memory': int(self.flight_data.memory_usage(index=True).sum()),
+                           'seconds': time.time() - start}
+        print('Loaded %d rows from %s (%.1f MB file, %.1f MB in memory) in %.2f s' % (
+            self.load_stats['rows'], source, self.load_stats['bytes'] / 1e6, self.load_stats['memory'] / 1e6,
+            self.load_stats['seconds']))
+
+    def load_bin(self):
+        """Decodes the .BIN file straight into the Sortie.flight_data variable, without writing or parsing a .csv file.
+        The Dataframe has the same columns, dtypes and index as the one made by Sortie.load_csv. Returns pandas Dataframe.
+        :return Pandas.Dataframe()
+        """
+        start = time.time()
+        print('Decoding %s' % self.path_dictionary['bin'])
+        parser = self.make_log_parser()
+        flight_data = parser.processDataFrame(self.path_dictionary['bin'][0])
+        dtypes = dict((name, dtype) for name, dtype in self.csv_dtypes.items() if name in flight_data.columns)
+        self.keep_flight_data(self.index_flight_data(flight_data.astype(dtypes), self.timezone), 'load_bin')
+        self.record_load_stats('bin', self.path_dictionary['bin'][0], start)
         return self.flight_data
 
+    def append_flight_data(self, chunk):
+        """Indexes a Dataframe chunk of new .csv or .BIN rows like Sortie.load_csv does and appends it to
+        Sortie.flight_data. Returns the indexed chunk.
+
+        The chunks are kept aside and added to the Dataframe the next time Sortie.flight_data is used, so appending
+        does not copy the rows received so far every time.
+        :return Pandas.Dataframe()
+        """
+        chunk = self.index_flight_data(chunk, self.timezone)
+        if len(self._pending_chunks) == 0:
+            # the data is now assigned rather than loaded from a file
+            self.flight_data = self.flight_data
+        self._pending_chunks.append(chunk)
+        return chunk
+
+    def follow(self, poll_interval=1.0, idle_timeout=None):
+        """Generator for watching a live Sortie. Rebuilds Sortie.flight_data from the .csv file, or from the .BIN file if
+        there is no .csv file, and keeps appending the rows written to it as the file grows, without reloading it.
+        Yields each appended chunk as an indexed Dataframe.
+
+        The file is polled every poll_interval seconds, and following stops after idle_timeout seconds without new data
+        (None follows until the generator is closed). Rows decoded from a .BIN file are not resampled.
+        :return generator of Pandas.Dataframe()
+        """
+        if 'data_csv' in self.path_dictionary:
+            print('Following %s' % self.path_dictionary['data_csv'])
+            chunks = follow_csv(self.path_dictionary['data_csv'][0], poll_interval, idle_timeout,
+                                self.csv_column_dtypes)
+        else:
+            print('Following %s' % self.path_dictionary['bin'])
+            parser = self.make_log_parser()
+            chunks = parser.followDataFrame(self.path_dictionary['bin'][0], poll_interval, idle_timeout)
+        self.flight_data = None
+        for chunk in chunks:
+            yield self.append_flight_data(chunk)
+
+    @staticmethod
+    def index_flight_data(flight_data, tz=hp.DEFAULT_TZ):
+        """Drops rows without GPS time and indexes the Dataframe by the Timestamp made from GPS_TimeMS and GPS_Week, in
+        time zone tz (see helpers.convertArrayGPSTime).
+        :return Pandas.Dataframe()
+        """
+        if 'GPS_GMS' in flight_data.columns:
+            flight_data.rename(columns={'GPS_GMS':'GPS_TimeMS','GPS_GWk': 'GPS_Week'}, inplace=True)
+        flight_data = flight_data[np.isfinite(flight_data['GPS_TimeMS'].values) &
+                                  np.isfinite(flight_data['GPS_Week'].values)]
+        flight_data.index = hp.convertArrayGPSTime(flight_data['GPS_TimeMS'].values, flight_data['GPS_Week'].values, tz)
+        return flight_data
+
     def find_numbering(self):
         """Sets the event_number, mission_number, sortie_number, and uav_number fields based on directory structure. Returns tuple containing this data.
         Tuple form: event_number,mission_number,sortie_number,uav_number
@@ -481,7 +877,8 @@ class Sortie(AbstractLevel):
     def find_uav_number(self):
         """Returns the UAV Number of the Sortie. Note that the number may have already been determined by Sortie.find_numbering
 
-        Will attempt first to extract the number from the .BIN_summary.txt file, then with the mavparms.py tool.
+        Will attempt first to extract the number from the .BIN_summary.txt file, then from the SYSID_THISMAV parameter at
+        the start of the .BIN file.
         :return int
         """
         try:
@@ -505,11 +902,9 @@ class Sortie(AbstractLevel):
 
         if self.uav_number == -1:
             try:
-                proc = subprocess.Popen(["mavparms.py",self.path_dictionary['bin']], stdout=subprocess.PIPE)
-                out,err = proc.communicate()
-                matches = re.findall('SYSID_THISMAV\s*(\d*)',out)
-                if matches != []:
-                        return int(matches[0])
+                sysid = log_extract.find_sysid(self.path_dictionary['bin'][0])
+                if sysid is not None:
+                    self.uav_number = sysid
             except:
                 self.uav_number = -1
 
@@ -582,18 +977,12 @@ class Sortie(AbstractLevel):
             failure_list.append(('find_numbering()', ex.message))
 
         try:
-            if (self.launch_time is None) or do_everything:
-                self.find_launch_time()
-        except Exception as ex:
-            self.query_data(['reset'])
-            failure_list.append(('calculate_launch_time()', ex.message))
-
-        try:
-            if (self.landing_time is None) or do_everything:
-                self.find_landing_time()
+            # all event times come from one pass over the flight data
+            for name in self.find_event_times(do_everything):
+                if name not in ('egress', 'last_land_cmd'):
+                    failure_list.append(('find_%s_time()' % name, 'No %s found' % name))
         except Exception as ex:
-            self.query_data(['reset'])
-            failure_list.append(('calculate_landing_time()', ex.message))
+            failure_list.append(('find_event_times()', ex.message))
 
         try:
             if (self.flight_time is None) or do_everything:
@@ -616,42 +1005,6 @@ class Sortie(AbstractLevel):
             self.query_data(['reset'])
             failure_list.append(('calculate_climbout_data()', ex.message))
 
-        try:
-            if (self.egress_time is None) or do_everything:
-                self.find_egress_time()
-        except Exception as ex:
-            self.query_data(['reset'])
-            failure_list.append(('get_egress_time()', ex.message))
-
-        try:
-            if (self.landbreak_time is None) or do_everything:
-                self.find_landbreak_time()
-        except Exception as ex:
-            print('Cannot get landbreak time')
-            self.query_data(['reset'])
-            failure_list.append(('get_landbreak_time()', ex.message))
-
-        try:
-            if (self.land_cmd_time is None) or do_everything:
-                self.find_land_cmd_time()
-        except Exception as ex:
-            self.query_data(['reset'])
-            failure_list.append(('find_land_cmd_time()', ex.message))
-
-        try:
-            if (self.climbout_time is None) or do_everything:
-                self.find_climbout_time()
-        except Exception as ex:
-            self.query_data(['reset'])
-            failure_list.append(('find_climbout_time()',ex.message))
-
-        try:
-            if (self.handoff_time is None) or do_everything:
-                self.find_handoff_time()
-        except Exception as ex:
-            self.query_data(['reset'])
-            failure_list.append(('find_handoff_time()',ex.message))
-
         print('- - - - - - - - - - - - - -')
 
         return failure_list
@@ -714,7 +1067,7 @@ class Sortie(AbstractLevel):
         th3 = np.arctan(delta_lng / delta_lat)
         th = th2 - th3
 
-        dist = hp.distance_2GPS(land_lat, land_lng, targlat, targlng)
+        dist = float(geodesy.haversine(land_lat, land_lng, targlat, targlng))
         vert = dist * np.cos(th)
         horiz = dist * np.sin(th)
 
@@ -810,11 +1163,13 @@ class Sortie(AbstractLevel):
         Note in these examples anything in all caps needs to be replaced with actual syntax. Choose only 1 operator per query.
 
         Three fields:
-        ['FLIGHT_DATA FIELD', > / < / == , NUMBER]
+        ['FLIGHT_DATA FIELD', > / < / == / >= / <= / != , NUMBER]
 
         Combined into one:
         ['FLIGHT_DATA FIELD < / > / == NUMBER]
 
+        The combined form can join comparisons with and, or, not and parentheses, e.g. ['GPS_Spd > 3 and BARO_Alt < 50'].
+
         Specifying multiple queryies in this way functions as an 'AND' query.
         Appending 'or' as the first field in either of the above lists will combine with previous queries as an 'OR' join.
         e.g.:
@@ -826,50 +1181,37 @@ class Sortie(AbstractLevel):
 
         Calling Sortie.query_data(['reset']) will clear any previously called queries.
 
+        Queries can also be given as query.Query objects, which are parsed once and can be reused across Sorties.
+        They are evaluated as boolean masks over the flight data arrays (see the query module), never with eval.
+        Raises query.QueryError for a query that cannot be parsed or names a missing field.
+
         The queried Dataframe resides in Sortie.cut_data
 
         """
-        # TODO: Sanitize input -- This function uses eval
-        full_query = None
-        query_list = []
         for query_txt in args:
-            if query_txt[0] == 'reset':
-                self.cut_data = self.flight_data.copy()
+            parsed = query_txt if isinstance(query_txt, Query) else Query(query_txt)
+            if parsed.combine == 'reset':
+                self.cut_data = None
                 return self.cut_data
 
-            if query_txt[0] == 'or':
-                if len(query_txt) == 4:
-                    fq = 'self.flight_data[self.flight_data.%s %s %s]' % (query_txt[1], query_txt[2], query_txt[2])
-                if len(query_txt) == 2:
-                    fq = 'self.flight_data[self.flight_data.%s]' % query_txt[1]
-                else:
-                    print("'Or' Query with length %d is not supported" % len(query_txt))
-
-                new_cut = eval(fq)
-                combined_df = self.cut_data.copy()
-                combined_df.append(new_cut)
-                combined_df["index"] = combined_df.index
-                combined_df.drop_duplicates(cols='index', take_last=True, inplace=True)
-                del combined_df["index"]
-
-                self.cut_data = combined_df.sort_index()
+            if self._query_mask is None and self._cut_data is not None and parsed.combine != 'or':
+                # narrow a Dataframe assigned to cut_data directly
+                self._cut_data = apply_mask(self._cut_data, parsed.mask(self._cut_data, self))
                 continue
 
-            if query_txt[0] == 'index':
-                if len(query_txt) == 3:
-                    selection_range = 'self.%s:self.%s' % (query_txt[1], query_txt[2])
-                full_query = 'self.cut_data[%s]' % selection_range
-            elif len(query_txt) == 3:
-                full_query = 'self.cut_data[self.cut_data.%s %s %f ]' % (query_txt[0], query_txt[1], query_txt[2])
-            elif len(query_txt) == 1:
-                full_query = 'self.cut_data[self.cut_data.%s ]' % query_txt[0]
-            else:
-                print('Cannot Execute Query. Query specifications must be 1 or 3 strings long. This query has %d strings' % len(query_txt))
-                return None
-            if full_query is not None:
-                cut_data = eval(full_query)
-                full_query = None
-            self.cut_data = cut_data
+            flight_data = self.flight_data
+            mask = parsed.mask(flight_data, self, self._mask_cache)
+            current = self._query_mask
+            if current is None and self._cut_data is not None:
+                # rows of a Dataframe assigned to cut_data
+                current = flight_data.index.isin(self._cut_data.index)
+            if parsed.combine == 'or':
+                # or with all rows selected still selects all rows
+                mask = None if current is None else current | mask
+            elif current is not None:
+                mask = current & mask
+            self._query_mask = mask
+            self._cut_data = None
 
         return self.cut_data
 
@@ -1087,7 +1429,9 @@ class Sortie(AbstractLevel):
     def dump_data(self):
         """In case it is decided that holding all the .csv files in memory requires too much memory, this will delete
         the flight_data and cut_data Dataframes. After using this, the Sortie object will no longer have any raw data
-        but the existing fields will remain valid
+        but the existing fields will remain valid. To free the memory but load the data again when it is next used,
+        use Sortie.release_flight_data, or set a budget with memory_cache.set_budget.
         """
-        self.flight_data = None
-        self.cut_data = None
+        self._flight_data_loader = None
+        self._query_mask = None
+        self.release_flight_data()
@@ -5,6 +5,23 @@ import matplotlib.pyplot as plt
 import matplotlib.image as img
 import shutil
 
+class _LevelStates(dict):
+    """worker_state of each object of a dictionary of Sortie, Mission or Event objects, by the same keys"""
+
+
+def _holds_levels(value):
+    """True if value is a Sortie, Mission or Event object, or a list or dictionary holding some (directly or in lists)"""
+    if isinstance(value, AbstractLevel):
+        return True
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        return any(isinstance(item, AbstractLevel) or
+                   (isinstance(item, (list, tuple)) and any(isinstance(i, AbstractLevel) for i in item))
+                   for item in value)
+    return False
+
+
 class AbstractLevel(object):
     """Defines attributes and methods common to Sortie, Mission, and Event classes"""
 
@@ -28,6 +45,36 @@ class AbstractLevel(object):
     def analyze(self):
         return False
 
+    def worker_state(self):
+        """Returns the public attributes of the object, to send back to the parent process after a method call in a
+        worker process (see parallel.call_method). Dictionaries of lower levels (such as Mission.sortie_list) are sent as
+        the worker_state of each of their objects. Other attributes holding Sortie, Mission or Event objects are left
+        out, so the objects of the parent are kept.
+        """
+        state = {}
+        attributes = vars(self)
+        for name, value in attributes.items():
+            if name.startswith('_') or value is attributes:
+                continue
+            if (isinstance(value, dict) and len(value) > 0 and
+                    all(isinstance(level, AbstractLevel) for level in value.values())):
+                state[name] = _LevelStates((key, level.worker_state()) for key, level in value.items())
+            elif not _holds_levels(value):
+                state[name] = value
+        return state
+
+    def merge_worker_state(self, state):
+        """Sets the attributes of a worker_state of this object. The states of lower level objects are merged into the
+        objects with the same keys."""
+        for name, value in state.items():
+            if isinstance(value, _LevelStates):
+                levels = getattr(self, name, {})
+                for key, level_state in value.items():
+                    if key in levels:
+                        levels[key].merge_worker_state(level_state)
+            else:
+                setattr(self, name, value)
+
     def find_data(self):
         """Finds all files that match the object's pattern_dictionary and adds their paths to path_dictionary"""
         self.path_dictionary = {}
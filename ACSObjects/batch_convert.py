@@ -0,0 +1,167 @@
+"""Batch conversion of the .BIN files of an Event tree to the Sortie .csv files.
+
+convert_event walks an Event folder laid out as described in the README (Event#/YYYY-MM-DD/Mission#/Sortie#-UAV#) and
+converts every .BIN file whose .csv file is missing or stale, in a pool of processes. The conversions are recorded in
+a manifest in the Event folder, holding the SHA-1 hash of every converted .BIN file, so a rerun only converts new or
+changed logs.
+
+Usage: python -m ACSObjects.batch_convert <event folder> [processes]
+"""
+import hashlib
+import json
+import os
+import sys
+from fnmatch import fnmatch
+from ACSObjects.Event import Event
+from ACSObjects.Mission import Mission
+from ACSObjects.Sortie import Sortie
+from ACSObjects.helpers import atomic_write
+from ACSObjects.parallel import map_pool
+
+MANIFEST_NAME = 'conversion_manifest.json'
+
+
+def file_hash(path, block_size=1 << 20):
+    """Returns the SHA-1 hex digest of the file at path"""
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as file_obj:
+        block = file_obj.read(block_size)
+        while block:
+            sha1.update(block)
+            block = file_obj.read(block_size)
+    return sha1.hexdigest()
+
+
+def load_manifest(event_path):
+    """Returns the conversion manifest of the Event folder, a dictionary keyed by .BIN path relative to the folder"""
+    try:
+        with open(os.path.join(event_path, MANIFEST_NAME), 'r') as manifest_file:
+            return json.load(manifest_file)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_manifest(event_path, manifest):
+    """Writes the conversion manifest of the Event folder"""
+    with atomic_write(os.path.join(event_path, MANIFEST_NAME)) as temp_path:
+        with open(temp_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+
+
+def find_sortie_folders(event_path):
+    """Returns the paths of all Sortie folders of the Event folder, using the Event and Mission folder patterns"""
+    sortie_folders = []
+    for date_dir in sorted(os.listdir(event_path)):
+        date_path = os.path.join(event_path, date_dir)
+        if not (os.path.isdir(date_path) and fnmatch(date_dir, Event.pattern_dictionary['date_folder'])):
+            continue
+        for mission_dir in sorted(os.listdir(date_path)):
+            mission_path = os.path.join(date_path, mission_dir)
+            if not (os.path.isdir(mission_path) and fnmatch(mission_dir, Event.pattern_dictionary['mission_folder'])):
+                continue
+            for sortie_dir in sorted(os.listdir(mission_path)):
+                sortie_path = os.path.join(mission_path, sortie_dir)
+                if os.path.isdir(sortie_path) and fnmatch(sortie_dir, Mission.pattern_dictionary['sortie_folder']):
+                    sortie_folders.append(sortie_path)
+    return sortie_folders
+
+
+def _stat_entry(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime
+
+
+def is_up_to_date(entry, bin_path, csv_path, resample_rate):
+    """Returns True if the .csv file of bin_path does not need to be made again.
+
+    With a manifest entry, the .csv must be the one recorded and the .BIN file must have the recorded hash (only
+    hashed again if its size or modification time changed) and resample rate. Without an entry, a .csv file newer than
+    the .BIN file was made by hand and is kept.
+    """
+    if not os.path.isfile(csv_path):
+        return False
+    if entry is None:
+        return os.path.getmtime(csv_path) >= os.path.getmtime(bin_path)
+    if entry['resample_rate'] != resample_rate or [entry['csv_size'], entry['csv_mtime']] != list(_stat_entry(csv_path)):
+        return False
+    if [entry['bin_size'], entry['bin_mtime']] == list(_stat_entry(bin_path)):
+        return True
+    if file_hash(bin_path) != entry['bin_sha1']:
+        return False
+    # the .BIN file was only touched
+    entry['bin_size'], entry['bin_mtime'] = _stat_entry(bin_path)
+    return True
+
+
+def convert_sortie(task):
+    """Converts the .BIN file of one Sortie to its .csv file as Sortie.extractFromDataFlash does. Returns the manifest
+    entry of the conversion. This is the process pool task of convert_event."""
+    bin_path, csv_path, event_number, resample_rate = task
+    sortie = Sortie(resample_rate=resample_rate)
+    sortie.path = os.path.dirname(bin_path)
+    sortie.event_number = event_number
+    parser = sortie.make_log_parser()
+    # an interrupted conversion never leaves a partial .csv file
+    with atomic_write(csv_path) as temp_path:
+        parser.setFileName(temp_path)
+        try:
+            parser.process(bin_path)
+        finally:
+            parser.setFileName(None)
+    bin_size, bin_mtime = _stat_entry(bin_path)
+    csv_size, csv_mtime = _stat_entry(csv_path)
+    return {'bin_sha1': file_hash(bin_path), 'bin_size': bin_size, 'bin_mtime': bin_mtime,
+            'csv': os.path.basename(csv_path), 'csv_size': csv_size, 'csv_mtime': csv_mtime,
+            'resample_rate': resample_rate}
+
+
+def convert_event(event_path, processes=None, resample_rate=5, force=False):
+    """Converts every .BIN file of the Event folder without an up to date .csv file (see is_up_to_date), or every one
+    if force is True, in a pool of processes (None uses one per CPU).
+
+    Returns a dictionary keyed by .BIN path of the converted .csv paths, or of the exception raised by a failed
+    conversion. The manifest is updated with the successful conversions.
+    """
+    manifest = load_manifest(event_path)
+    tasks = []
+    for sortie_path in find_sortie_folders(event_path):
+        sortie = Sortie()
+        sortie.path = sortie_path
+        sortie.find_data()
+        if 'bin' not in sortie.path_dictionary:
+            continue
+        sortie.find_numbering()
+        bin_path = sortie.path_dictionary['bin'][0]
+        if sortie.event_number is None:
+            print('Skipping %s, its folders do not give the Event number' % bin_path)
+            continue
+        if 'data_csv' in sortie.path_dictionary:
+            csv_path = sortie.path_dictionary['data_csv'][0]
+        elif None in sortie.fx_data:
+            print('Skipping %s, its folders do not give the Mission, Sortie and UAV numbers' % bin_path)
+            continue
+        else:
+            csv_path = os.path.join(sortie_path, 'FX%02d-M%02d-S%02d-UAV%02d.csv' % sortie.fx_data)
+        key = os.path.relpath(bin_path, event_path)
+        if force or not is_up_to_date(manifest.get(key), bin_path, csv_path, resample_rate):
+            tasks.append((bin_path, csv_path, sortie.event_number, resample_rate))
+
+    print('Converting %d .BIN files' % len(tasks))
+    results = {}
+    for task, entry in zip(tasks, map_pool(convert_sortie, tasks, processes)):
+        bin_path, csv_path = task[:2]
+        if isinstance(entry, Exception):
+            print('Could not convert %s: %s' % (bin_path, entry))
+            results[bin_path] = entry
+        else:
+            manifest[os.path.relpath(bin_path, event_path)] = entry
+            results[bin_path] = csv_path
+    save_manifest(event_path, manifest)
+    return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+    else:
+        convert_event(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else None)
@@ -0,0 +1,116 @@
+"""Benchmark of the SDLog2Parser modes on synthetic logs (see synthetic_log).
+
+run_benchmark decodes every log with every parser mode and reports the throughput in MB/s and messages/s, with the
+Sortie message filter and with all messages. The modes cover the engines and input modes, parallel scanning, rows
+grouped by a time message, resampling, decoding into a Dataframe (processDataFrame, as Sortie.load_bin does) instead of
+CSV, and decoding a time window through the sidecar index. The CSV output is written to os.devnull, so the figures
+include the CSV formatting but not the disk.
+
+Usage: python -m ACSObjects.benchmark [duration in seconds of each log] [corrupt regions]
+"""
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from ACSObjects.helpers import sortie_msg_filter
+from ACSObjects.sdlog2_dump import SDLog2Parser
+from ACSObjects.synthetic_log import write_log, GPS_EPOCH_UNIX
+
+SORTIE_FILTER = sortie_msg_filter()
+"""Message filter of Sortie.make_log_parser"""
+
+START_TIME = 1436800000.0
+"""Unix time at which the synthetic logs start"""
+
+STRUCT = SDLog2Parser.ENGINE_STRUCT
+NUMPY = SDLog2Parser.ENGINE_NUMPY
+STREAM = SDLog2Parser.INPUT_STREAM
+MMAP = SDLog2Parser.INPUT_MMAP
+
+MODES = [
+    # (name, time_parser settings), a window is given as the fractions of the log duration it starts and ends at
+    ('struct stream', {'engine': STRUCT, 'input_mode': STREAM}),
+    ('struct mmap', {'engine': STRUCT, 'input_mode': MMAP}),
+    ('numpy stream', {'engine': NUMPY, 'input_mode': STREAM}),
+    ('numpy mmap', {'engine': NUMPY, 'input_mode': MMAP}),
+    ('numpy parallel', {'engine': NUMPY, 'input_mode': STREAM, 'processes': multiprocessing.cpu_count()}),
+    ('struct time msg', {'engine': STRUCT, 'input_mode': STREAM, 'time_msg': 'GPS'}),
+    ('numpy time msg', {'engine': NUMPY, 'input_mode': STREAM, 'time_msg': 'GPS'}),
+    ('numpy resample', {'engine': NUMPY, 'input_mode': STREAM, 'resample_rate': 5}),
+    ('numpy dataframe', {'engine': NUMPY, 'input_mode': STREAM, 'output': 'dataframe'}),
+    ('numpy resample df', {'engine': NUMPY, 'input_mode': STREAM, 'resample_rate': 5, 'output': 'dataframe'}),
+    ('index window 10%', {'engine': NUMPY, 'input_mode': STREAM, 'window': (0.45, 0.55)}),
+]
+
+
+def time_parser(log_path, engine=STRUCT, input_mode=STREAM, processes=None, msg_filter=None, time_msg=None,
+                correct_errors=False, resample_rate=None, window=None, output='csv', repeat=3):
+    """Returns the best time in seconds of repeat decodes of log_path with the given parser settings. window is the
+    (start, end) GPS time in ms since the GPS epoch to decode through the sidecar index, None for the whole log. output
+    is 'csv' to write CSV, or 'dataframe' to decode with processDataFrame."""
+    best = None
+    for i in range(repeat):
+        parser = SDLog2Parser()
+        parser.setMsgFilter(list(msg_filter or []))
+        parser.setTimeMsg(time_msg)
+        parser.setCorrectErrors(correct_errors)
+        parser.setEngine(engine)
+        parser.setInputMode(input_mode)
+        parser.setProcesses(processes)
+        parser.setResampleRate(resample_rate)
+        if window is not None:
+            parser.setUseIndex(True)
+            parser.setTimeWindow(*window)
+        start = time.time()
+        if output == 'dataframe':
+            parser.processDataFrame(log_path)
+        else:
+            parser.setFileName(os.devnull)
+            try:
+                parser.process(log_path)
+            finally:
+                parser.setFileName(None)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def run_benchmark(durations=(600.0,), corrupt_regions=0, repeat=3, modes=MODES):
+    """Writes a synthetic log for every duration (seconds) and times every mode on it, with the Sortie message filter
+    and with all messages. The sidecar index of the log is built before the modes using it are timed. Prints and returns
+    a list of result dictionaries."""
+    results = []
+    folder = tempfile.mkdtemp()
+    try:
+        for duration in durations:
+            log_path = os.path.join(folder, 'synthetic-%d.BIN' % duration)
+            msg_count = write_log(log_path, duration, start_time=START_TIME, corrupt_regions=corrupt_regions, seed=1)
+            size_mb = os.path.getsize(log_path) / 1e6
+            if any('window' in settings for name, settings in modes):
+                SDLog2Parser().buildIndex(log_path)
+            start_ms = (START_TIME - GPS_EPOCH_UNIX) * 1000
+            for filter_name, msg_filter in (('sortie', SORTIE_FILTER), ('all', [])):
+                for name, settings in modes:
+                    settings = dict(settings)
+                    if 'window' in settings:
+                        settings['window'] = tuple(start_ms + fraction * duration * 1000
+                                                   for fraction in settings['window'])
+                    seconds = time_parser(log_path, msg_filter=msg_filter, correct_errors=corrupt_regions > 0,
+                                          repeat=repeat, **settings)
+                    result = {'duration': duration, 'size_mb': size_mb, 'messages': msg_count, 'filter': filter_name,
+                              'mode': name, 'seconds': seconds, 'mb_per_s': size_mb / seconds,
+                              'msgs_per_s': msg_count / seconds}
+                    print('%6ds %7.1f MB %-7s %-17s %7.3f s %7.2f MB/s %10.0f msgs/s' % (
+                        duration, size_mb, filter_name, name, seconds, result['mb_per_s'], result['msgs_per_s']))
+                    results.append(result)
+    finally:
+        shutil.rmtree(folder)
+    return results
+
+
+if __name__ == '__main__':
+    run_benchmark((float(sys.argv[1]) if len(sys.argv) > 1 else 600.0,),
+                  int(sys.argv[2]) if len(sys.argv) > 2 else 0)
@@ -0,0 +1,114 @@
+"""Number of aircraft aloft over time, computed with a sweep line over the launch and landing times of the Sorties.
+
+Every launch adds one aircraft and every landing removes one. The events are sorted once and summed, which gives the
+exact step function of the number of aircraft aloft: AloftProfile.counts[i] aircraft are aloft from
+AloftProfile.times[i] until AloftProfile.times[i + 1]. Point queries, peak and duration statistics are computed from
+the step function. Sampling it into bins (AloftProfile.binned) is only done to draw it.
+
+The sorties can come from one Mission or from all the Missions and days of an Event.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _datetimes(times):
+    """Returns the times (Timestamps, datetimes or None) as a datetime64[ns] array with NaT for None"""
+    if getattr(times, 'dtype', None) is not None and np.dtype(times.dtype).kind == 'M':
+        return np.asarray(times, dtype='datetime64[ns]')
+    return pd.DatetimeIndex([pd.NaT if time is None else time for time in times]).values
+
+
+class AloftProfile(object):
+    """Step function of the number of aircraft aloft, from the launch and landing times of each sortie"""
+
+    def __init__(self, launch_times, landing_times):
+        """launch_times and landing_times are sequences of the launch and landing time of each sortie, in the same order.
+        Sorties missing either time (None or NaT), or landing before launching, are left out."""
+        launches = _datetimes(launch_times)
+        landings = _datetimes(landing_times)
+        if len(launches) != len(landings):
+            raise ValueError('%d launch times for %d landing times' % (len(launches), len(landings)))
+        valid = ~np.isnat(launches) & ~np.isnat(landings)
+        valid[valid] = landings[valid] >= launches[valid]
+        if not valid.all():
+            print('Leaving %d sorties without a launch and landing time out of the aircraft aloft' % (~valid).sum())
+
+        self.launch_times = launches[valid]
+        '''Launch times of the sorties counted, as datetime64[ns]'''
+        self.landing_times = landings[valid]
+        '''Landing times of the sorties counted, as datetime64[ns]'''
+
+        # the sweep: sort the +1 and -1 events once, and sum the changes at each distinct time
+        events = np.concatenate((self.launch_times, self.landing_times))
+        changes = np.concatenate((np.ones(len(self.launch_times), dtype=np.int64),
+                                  -np.ones(len(self.landing_times), dtype=np.int64)))
+        order = np.argsort(events, kind='mergesort')
+        events = events[order]
+        changes = changes[order]
+        if len(events) > 0:
+            first = np.concatenate(([True], events[1:] != events[:-1]))
+            self.times = events[first]
+            '''Times at which the number of aircraft aloft changes, as datetime64[ns]'''
+            self.counts = np.cumsum(np.add.reduceat(changes, np.flatnonzero(first)))
+            '''Number of aircraft aloft from each time in times until the next one (0 before the first time)'''
+        else:
+            self.times = events
+            self.counts = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.launch_times)
+
+    def count_at(self, times):
+        """Returns the number of aircraft aloft at each of times (a Timestamp or a sequence of them). Aircraft launching
+        at a time are counted as aloft at that time, and aircraft landing at a time are not."""
+        scalar = np.ndim(times) == 0
+        positions = np.searchsorted(self.times, _datetimes(np.atleast_1d(times)), side='right') - 1
+        counts = np.where(positions >= 0, self.counts[np.maximum(positions, 0)] if len(self.counts) else 0, 0)
+        return int(counts[0]) if scalar else counts
+
+    def durations(self):
+        """Returns a pandas Series of the total time (Timedelta) spent with each number of aircraft aloft, indexed by the
+        number of aircraft, between the first launch and the last landing"""
+        if len(self.times) < 2:
+            return pd.Series([], dtype='timedelta64[ns]')
+        spans = np.diff(self.times)
+        totals = pd.Series(spans, index=self.counts[:-1]).groupby(level=0).sum()
+        return totals.sort_index()
+
+    def duration_at_least(self, count):
+        """Returns the total time (Timedelta) with at least count aircraft aloft"""
+        durations = self.durations()
+        return pd.Timedelta(durations[durations.index >= count].sum())
+
+    def peak(self):
+        """Returns the largest number of aircraft aloft at once, the first time it was reached and how long it lasted in
+        total (Timedelta). The time is None if no sortie was counted."""
+        if len(self.counts) == 0:
+            return 0, None, pd.Timedelta(0)
+        peak = int(self.counts.max())
+        return peak, pd.Timestamp(self.times[np.argmax(self.counts)]), self.duration_at_least(peak)
+
+    def mean_aloft(self):
+        """Returns the time weighted mean number of aircraft aloft between the first launch and the last landing"""
+        if len(self.times) < 2:
+            return 0.0
+        spans = np.diff(self.times).astype(np.int64)
+        return float(np.dot(self.counts[:-1], spans)) / spans.sum()
+
+    def binned(self, start=None, end=None, bins=7000):
+        """Samples the step function at bins evenly spaced times from start to end (by default 2.5 minutes before the
+        first launch to 2.5 minutes after the last landing), for drawing. Returns the times as a DatetimeIndex and the
+        number of aircraft aloft at each one."""
+        padding = pd.Timedelta(seconds=150)
+        if start is None:
+            start = pd.Timestamp(self.times[0]) - padding
+        if end is None:
+            end = pd.Timestamp(self.times[-1]) + padding
+        start = pd.Timestamp(start).value
+        end = pd.Timestamp(end).value
+        times = pd.DatetimeIndex(np.linspace(start, end, bins).astype(np.int64).view('datetime64[ns]'))
+        return times, self.count_at(times)
+
+    def days(self):
+        """Returns the dates (datetime.date) with at least one sortie launched, for drawing one day at a time"""
+        return sorted(set(pd.DatetimeIndex(self.launch_times).date))
@@ -0,0 +1,95 @@
+"""Binary columnar cache of Sortie flight data.
+
+The cache of FX01-M01-S01-UAV04.csv is FX01-M01-S01-UAV04.cache.npz in the same folder. It holds every column with its
+dtype plus the Timestamp index, so loading it skips parsing the .csv text and converting the GPS time. A cache is only
+used while the size and modification time of the .csv file match the ones it was made from, and the index is in the
+time zone asked for.
+"""
+import os
+import numpy as np
+import pandas as pd
+from ACSObjects.helpers import atomic_write
+
+CACHE_SUFFIX = '.cache.npz'
+CACHE_VERSION = 3
+
+
+def cache_path(csv_path):
+    """Returns the path of the cache file of csv_path"""
+    return os.path.splitext(csv_path)[0] + CACHE_SUFFIX
+
+
+def _csv_signature(csv_path):
+    stat = os.stat(csv_path)
+    return np.array([CACHE_VERSION, stat.st_size, stat.st_mtime], dtype=np.float64)
+
+
+def read_cache(csv_path, columns=None, timezone=None):
+    """Returns the cached Dataframe of csv_path, or None if there is no cache, it is out of date or its index is not in
+    timezone (see helpers.convertArrayGPSTime, None for UTC).
+
+    If columns is given, only those columns are read from the cache (in their .csv order).
+    """
+    path = cache_path(csv_path)
+    if not os.path.isfile(path):
+        return None
+    try:
+        npz = np.load(path, allow_pickle=False)
+    except (IOError, ValueError):
+        return None
+    try:
+        return _read_npz(npz, csv_path, columns, timezone)
+    except (KeyError, ValueError):
+        # unreadable or written by another version, the caller falls back to the .csv file
+        return None
+    finally:
+        npz.close()
+
+
+def _read_npz(npz, csv_path, columns, timezone):
+    if not np.array_equal(npz['__signature__'], _csv_signature(csv_path)):
+        return None
+    if str(npz['__timezone__'][0]) != str(timezone):
+        return None
+    names = [str(name) for name in npz['__columns__']]
+    if columns is not None:
+        names = [name for name in names if name in columns]
+    data = {}
+    for name in names:
+        values = npz['c:' + name]
+        if 'm:' + name in npz.files:
+            # text column, restore the empty cells
+            values = values.astype(object)
+            values[npz['m:' + name]] = np.nan
+        data[name] = values
+    index = pd.DatetimeIndex(npz['__index__'].view('datetime64[ns]'))
+    return pd.DataFrame(data, index=index, columns=names)
+
+
+def write_cache(csv_path, flight_data, timezone=None):
+    """Writes the cache of csv_path from its flight_data Dataframe, indexed in timezone. Returns the cache path, or None
+    if it could not be written."""
+    arrays = {'__signature__': _csv_signature(csv_path),
+              '__timezone__': np.array([u'%s' % timezone]),
+              '__columns__': np.array([str(name) for name in flight_data.columns]),
+              '__index__': flight_data.index.values.view(np.int64)}
+    for name in flight_data.columns:
+        values = flight_data[name].values
+        if values.dtype.kind not in 'biufcM':
+            # text column, stored as fixed width unicode plus a mask of the empty cells
+            values = np.asarray(values, dtype=object)
+            missing = pd.isnull(values)
+            values = np.array([u'' if empty else u'%s' % value for value, empty in zip(values, missing)],
+                              dtype='U')
+            arrays['m:' + name] = missing
+        arrays['c:' + name] = values
+
+    path = cache_path(csv_path)
+    try:
+        with atomic_write(path) as temp_path:
+            with open(temp_path, 'wb') as cache_file:
+                np.savez(cache_file, **arrays)
+    except (IOError, OSError) as ex:
+        print('Could not write cache %s: %s' % (path, ex))
+        return None
+    return path
@@ -0,0 +1,129 @@
+"""Detection of the flight events of a Sortie (launch, climbout, handoff, egress, landbreak, landing commands, touchdown
+and landing) in one pass over its flight data arrays, and the flight phases between them.
+
+The waypoint number (CMD_CNum) and command ID (CMD_CId) columns change rarely, so they are first reduced to runs of
+equal values. Every waypoint event is then looked up in those few runs instead of comparing the whole column once per
+event. Positions are row positions in the arrays, None when the event did not happen.
+"""
+from collections import OrderedDict
+import numpy as np
+
+EVENTS = ('launch', 'landing', 'climbout_start', 'climbout', 'handoff', 'egress', 'land_cmd', 'last_land_cmd',
+          'landbreak', 'touchdown')
+
+PHASES = ('preflight', 'launch', 'climbout', 'handoff', 'swarm', 'egress', 'landbreak', 'landing', 'postflight')
+"""Flight phases in the order they happen"""
+
+
+def value_runs(values):
+    """Returns the start positions, end positions (inclusive) and values of the runs of equal consecutive values.
+    Consecutive NaN values form one run."""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, values
+    missing = np.isnan(values)
+    changed = (values[1:] != values[:-1]) & ~(missing[1:] & missing[:-1])
+    starts = np.concatenate(([0], np.flatnonzero(changed) + 1))
+    ends = np.append(starts[1:], len(values)) - 1
+    return starts, ends, values[starts]
+
+
+def first_true(mask):
+    """Returns the position of the first True value of mask, None if there is none"""
+    if mask is None or len(mask) == 0:
+        return None
+    position = int(np.argmax(mask))
+    return position if mask[position] else None
+
+
+def last_true(mask):
+    """Returns the position of the last True value of mask, None if there is none"""
+    position = first_true(mask[::-1]) if mask is not None else None
+    return None if position is None else len(mask) - 1 - position
+
+
+def detect_events(gps_spd, cmd_cnum, cmd_cid, waypoint_dict, cid_list, launch_speed=5, landing_speed=3, baro_alt=None,
+                  touchdown_alt=2.0):
+    """Returns a dictionary of the row position of every event in EVENTS, None for the events that did not happen or
+    whose column is missing (None).
+
+    launch is the first row with GPS_Spd >= launch_speed, and landing the last row with GPS_Spd > landing_speed.
+    climbout_start is the first row at the 'pre-climbout' waypoint of waypoint_dict, climbout and handoff the last rows
+    at the 'pre-climbout' and 'pre-handoff' waypoints. egress is the first row at the first 'egress' waypoint that was
+    reached. land_cmd and last_land_cmd are the first and last rows at any 'land' waypoint, and landbreak the first row
+    with the 'land' command ID of cid_list. touchdown is the first row from landbreak to landing with a BARO_Alt no more
+    than touchdown_alt above the one at launch.
+    """
+    events = dict((name, None) for name in EVENTS)
+    with np.errstate(invalid='ignore'):
+        if gps_spd is not None:
+            gps_spd = np.asarray(gps_spd)
+            events['launch'] = first_true(gps_spd >= launch_speed)
+            events['landing'] = last_true(gps_spd > landing_speed)
+
+        if cmd_cnum is not None:
+            starts, ends, numbers = value_runs(cmd_cnum)
+            climbout_run = last_true(numbers == waypoint_dict['pre-climbout'])
+            handoff_run = last_true(numbers == waypoint_dict['pre-handoff'])
+            climbout_start_run = first_true(numbers == waypoint_dict['pre-climbout'])
+            events['climbout_start'] = None if climbout_start_run is None else int(starts[climbout_start_run])
+            events['climbout'] = None if climbout_run is None else int(ends[climbout_run])
+            events['handoff'] = None if handoff_run is None else int(ends[handoff_run])
+            for egress_wp in waypoint_dict['egress']:
+                egress_run = first_true(numbers == egress_wp)
+                if egress_run is not None:
+                    events['egress'] = int(starts[egress_run])
+                    break
+            land = np.isin(numbers, waypoint_dict['land'])
+            land_run = first_true(land)
+            last_land_run = last_true(land)
+            events['land_cmd'] = None if land_run is None else int(starts[land_run])
+            events['last_land_cmd'] = None if last_land_run is None else int(ends[last_land_run])
+
+        if cmd_cid is not None:
+            starts, ends, ids = value_runs(cmd_cid)
+            landbreak_run = first_true(ids == cid_list['land'])
+            events['landbreak'] = None if landbreak_run is None else int(starts[landbreak_run])
+
+        if baro_alt is not None and None not in (events['launch'], events['landbreak'], events['landing']):
+            baro_alt = np.asarray(baro_alt)
+            approach = baro_alt[events['landbreak']:events['landing'] + 1]
+            touchdown = first_true(approach <= baro_alt[events['launch']] + touchdown_alt)
+            events['touchdown'] = None if touchdown is None else events['landbreak'] + touchdown
+    return events
+
+
+def phase_bounds(events, length):
+    """Returns an OrderedDict of the (start, stop) row positions of every phase in PHASES, from the event positions of
+    detect_events and the number of rows. Phases are consecutive and never overlap: each one starts at its event and
+    stops where the next phase with a known start begins. A phase whose start event is unknown, comes before the start
+    of an earlier phase (events out of order), or which would be empty, is None.
+
+    preflight: log start to launch, launch: to the climbout waypoint, climbout: at the climbout waypoint,
+    handoff: to the end of the handoff waypoint, swarm: to egress, egress: to landbreak, landbreak: final approach to
+    touchdown, landing: touchdown to the last row above the landing speed, postflight: to the log end.
+    """
+    def after(position):
+        return None if position is None else position + 1
+
+    starts = [0, events['launch'], events['climbout_start'], after(events['climbout']), after(events['handoff']),
+              events['egress'], events['landbreak'], events['touchdown'], after(events['landing'])]
+    # events out of order (a phase starting before an earlier one) are ignored, so the known starts are increasing
+    previous = None
+    for i, start in enumerate(starts):
+        if start is None:
+            continue
+        if previous is not None and start < previous:
+            starts[i] = None
+        else:
+            previous = start
+    bounds = OrderedDict()
+    for i, name in enumerate(PHASES):
+        start = starts[i]
+        if start is None:
+            bounds[name] = None
+            continue
+        stop = min([later for later in starts[i + 1:] if later is not None] + [length])
+        bounds[name] = (start, stop) if start < stop else None
+    return bounds
@@ -0,0 +1,83 @@
+"""Vectorized geodesy for whole trajectories: great circle distances, bearings, path lengths and local East-North-Up
+(ENU) coordinates.
+
+Every function takes scalars, numpy arrays or pandas Series (such as flight_data.GPS_Lat) in decimal degrees and
+broadcasts them like numpy does, so a whole trajectory is computed at once instead of one sample at a time with
+helpers.distance_2GPS. Samples without a GPS fix (NaN) give NaN results.
+"""
+import numpy as np
+
+EARTH_RADIUS = 6371000.0
+"""Mean Earth radius in meters, as used by helpers.distance_2GPS"""
+
+WGS84_A = 6378137.0
+"""WGS84 semi-major axis in meters"""
+WGS84_E2 = 6.69437999014e-3
+"""WGS84 first eccentricity squared"""
+
+
+def _values(values):
+    """Returns values (scalar, list, array or pandas Series) as a float numpy array"""
+    return np.asarray(getattr(values, 'values', values), dtype=np.float64)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Returns the great circle distance in meters between the points (lat1, lon1) and (lat2, lon2)"""
+    lat1, lon1, lat2, lon2 = [np.radians(_values(v)) for v in (lat1, lon1, lat2, lon2)]
+    a = np.sin((lat2 - lat1) / 2.) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def bearing(lat1, lon1, lat2, lon2):
+    """Returns the initial bearing in degrees (0 to 360, clockwise from north) from (lat1, lon1) to (lat2, lon2)"""
+    lat1, lon1, lat2, lon2 = [np.radians(_values(v)) for v in (lat1, lon1, lat2, lon2)]
+    dlon = lon2 - lon1
+    y = np.sin(dlon) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return np.degrees(np.arctan2(y, x)) % 360.0
+
+
+def segment_lengths(lat, lon):
+    """Returns the distances in meters between consecutive samples of a trajectory (one fewer than the samples)"""
+    lat = _values(lat)
+    lon = _values(lon)
+    return haversine(lat[:-1], lon[:-1], lat[1:], lon[1:])
+
+
+def path_length(lat, lon):
+    """Returns the cumulative distance in meters travelled along a trajectory at every sample, starting at 0.
+    Segments to or from a sample without a fix count as 0."""
+    lengths = np.nan_to_num(segment_lengths(lat, lon))
+    return np.concatenate(([0.0], np.cumsum(lengths)))
+
+
+def geodetic_to_ecef(lat, lon, alt=0.0):
+    """Returns the WGS84 Earth-Centered Earth-Fixed (x, y, z) coordinates in meters of lat, lon and alt (meters above
+    the ellipsoid)"""
+    lat = np.radians(_values(lat))
+    lon = np.radians(_values(lon))
+    alt = _values(alt)
+    sin_lat = np.sin(lat)
+    n = WGS84_A / np.sqrt(1 - WGS84_E2 * sin_lat ** 2)
+    x = (n + alt) * np.cos(lat) * np.cos(lon)
+    y = (n + alt) * np.cos(lat) * np.sin(lon)
+    z = (n * (1 - WGS84_E2) + alt) * sin_lat
+    return x, y, z
+
+
+def geodetic_to_enu(lat, lon, alt, ref_lat, ref_lon, ref_alt=0.0):
+    """Returns the local (east, north, up) coordinates in meters of lat, lon and alt relative to the reference point
+    (ref_lat, ref_lon, ref_alt), e.g. the launch point of a Sortie. alt and ref_alt are in the same datum (GPS_Alt)."""
+    x, y, z = geodetic_to_ecef(lat, lon, alt)
+    ref_x, ref_y, ref_z = geodetic_to_ecef(ref_lat, ref_lon, ref_alt)
+    dx = x - ref_x
+    dy = y - ref_y
+    dz = z - ref_z
+    ref_lat = np.radians(_values(ref_lat))
+    ref_lon = np.radians(_values(ref_lon))
+    sin_lat, cos_lat = np.sin(ref_lat), np.cos(ref_lat)
+    sin_lon, cos_lon = np.sin(ref_lon), np.cos(ref_lon)
+    east = -sin_lon * dx + cos_lon * dy
+    north = -sin_lat * cos_lon * dx - sin_lat * sin_lon * dy + cos_lat * dz
+    up = cos_lat * cos_lon * dx + cos_lat * sin_lon * dy + sin_lat * dz
+    return east, north, up
@@ -1,13 +1,109 @@
+import numpy as np
 import pandas as pd
 import time, datetime
+import os
+import tempfile
+from contextlib import contextmanager
 from math import radians,cos,sin,sqrt,asin
 
-def convertSeriesGPSTime( TimeOfWeekSec, WeekNum ):
+GPS_EPOCH_UNIX = 86400*(10*365 + 2 + 1 + 6 - 2)
+"""Unix time of the GPS epoch, 1980-01-06 00:00:00 UTC"""
+
+MS_PER_WEEK = 86400*7*1000
+
+LEAP_SECONDS = [('1981-07-01', 1), ('1982-07-01', 2), ('1983-07-01', 3), ('1985-07-01', 4), ('1988-01-01', 5),
+                ('1990-01-01', 6), ('1991-01-01', 7), ('1992-07-01', 8), ('1993-07-01', 9), ('1994-07-01', 10),
+                ('1996-01-01', 11), ('1997-07-01', 12), ('1999-01-01', 13), ('2006-01-01', 14), ('2009-01-01', 15),
+                ('2012-07-01', 16), ('2015-07-01', 17), ('2017-01-01', 18)]
+"""UTC dates from which GPS time is ahead of UTC by the given number of leap seconds"""
+
+# GPS milliseconds since the GPS epoch at which each leap second offset starts
+_LEAP_GPS_MS = np.array([(pd.Timestamp(date).value // 1000000 - GPS_EPOCH_UNIX*1000) + leap*1000
+                         for date, leap in LEAP_SECONDS], dtype=np.int64)
+_LEAP_MS = np.array([0] + [leap*1000 for date, leap in LEAP_SECONDS], dtype=np.int64)
+
+GPS_MISSING = np.iinfo(np.int64).min
+"""gpsMilliseconds of the samples without a GPS time (NaN time or week), the int64 value of NaT"""
+
+DEFAULT_TZ = 'Etc/GMT+7'
+"""Time zone of the flight data timestamps, UTC-7 (US Pacific daylight time, where the field events are flown).
+Note the reversed sign of the Etc zone names. Use 'US/Pacific' to follow daylight saving time, or None for UTC."""
+
+
+def gpsMilliseconds( TimeMS, WeekNum ):
     """
-    Convert GPS time (measured in Time-of-Week [seconds] and Week number) to UTC time
-    # REF: mavlink/pymavlink/DFReader.py
-    # epoch = 86400*(10*365 + (1980-1969)/4 + 1 + 6 - 2)
-        return epoch + 86400*7*week + sec - 15
+    Returns the int64 milliseconds since the GPS epoch of GPS time in Time-of-Week [milliseconds] and Week number
+    arrays.
+
+    Week rollovers the week number missed (the time of week dropping by about a week while the week stays the same)
+    are corrected by adding the missing weeks. Week numbers below 1024 from a 10-bit week counter are not expected in
+    dataflash logs and are not changed. Samples with a NaN time or week (before the first GPS fix) are GPS_MISSING.
+    """
+    time_ms = np.asarray(TimeMS, dtype=np.float64)
+    week = np.asarray(WeekNum, dtype=np.float64)
+    valid = np.isfinite(time_ms) & np.isfinite(week)
+    gps_ms = (np.round(np.where(valid, week, 0)).astype(np.int64) * MS_PER_WEEK +
+              np.round(np.where(valid, time_ms, 0)).astype(np.int64))
+    if gps_ms.ndim == 1 and np.count_nonzero(valid) > 1:
+        valid_ms = gps_ms[valid]
+        missed = np.diff(valid_ms) < -MS_PER_WEEK // 2
+        if missed.any():
+            print('Correcting %d GPS week rollovers' % missed.sum())
+            valid_ms[1:] += np.cumsum(missed) * MS_PER_WEEK
+            gps_ms[valid] = valid_ms
+    if not np.all(valid):
+        gps_ms = np.where(valid, gps_ms, GPS_MISSING)
+    return gps_ms
+
+def checkGPSTime( TimeMS, WeekNum ):
+    """
+    Returns the positions of the GPS week rollovers that the week number missed and of the samples where GPS time goes
+    backwards (after correcting the rollovers) in Time-of-Week [milliseconds] and Week number arrays.
+
+    # Usage:
+    # Ex:   rollovers, backwards = acs.checkGPSTime( df['GPS_TimeMS'].values, df['GPS_Week'].values )
+    """
+    time_ms = np.asarray(TimeMS, dtype=np.float64)
+    week = np.asarray(WeekNum, dtype=np.float64)
+    # samples without a GPS time are skipped
+    positions = np.flatnonzero(np.isfinite(time_ms) & np.isfinite(week))
+    steps = np.diff(np.round(week[positions]).astype(np.int64) * MS_PER_WEEK +
+                    np.round(time_ms[positions]).astype(np.int64))
+    rollovers = positions[1:][steps < -MS_PER_WEEK // 2]
+    backwards = positions[1:][np.diff(gpsMilliseconds(TimeMS, WeekNum)[positions]) < 0]
+    return rollovers, backwards
+
+def convertArrayGPSTime( TimeMS, WeekNum, tz=DEFAULT_TZ ):
+    """
+    Convert GPS time (measured in Time-of-Week [milliseconds] and Week number arrays) to local time in time zone tz.
+    The conversion is done in int64 milliseconds, so there is no floating point rounding of the timestamps, and the
+    GPS-UTC leap seconds are looked up in LEAP_SECONDS for every sample. Missed week rollovers are corrected (see
+    gpsMilliseconds), and a warning is printed if the time goes backwards. Samples with a NaN time or week (before
+    the first GPS fix) are NaT.
+
+    # Usage:
+    # Ex:   acs.convertArrayGPSTime( df['GPS_TimeMS'].values, df['GPS_Week'].values )
+
+    Returns a DatetimeIndex of naive timestamps in time zone tz (UTC if tz is None)
+    """
+    gps_ms = np.atleast_1d(gpsMilliseconds(TimeMS, WeekNum))
+    valid = gps_ms != GPS_MISSING
+    if gps_ms.ndim == 1 and len(gps_ms) > 1:
+        backwards = np.count_nonzero(np.diff(gps_ms[valid]) < 0)
+        if backwards > 0:
+            print('GPS time goes backwards at %d samples' % backwards)
+    gps_ms = np.where(valid, gps_ms, 0)
+    utc_ms = gps_ms - _LEAP_MS[np.searchsorted(_LEAP_GPS_MS, gps_ms, side='right')] + GPS_EPOCH_UNIX*1000
+    utc_ns = np.where(valid, utc_ms * 1000000, GPS_MISSING)
+    clk_time = pd.DatetimeIndex(utc_ns.view('datetime64[ns]'))
+    if tz is not None:
+        clk_time = clk_time.tz_localize('UTC').tz_convert(tz).tz_localize(None)
+    return clk_time
+
+def convertSeriesGPSTime( TimeOfWeekSec, WeekNum, tz=DEFAULT_TZ ):
+    """
+    Convert GPS time (measured in Time-of-Week [seconds] and Week number) to local time in time zone tz
+    (see convertArrayGPSTime)
 
     # Usage:
     # Ex:   TimeOfWeekSec = df['GPS_TimeMS']/1000.
@@ -17,31 +113,59 @@ def convertSeriesGPSTime( TimeOfWeekSec, WeekNum ):
     Returns an object of type 'pandas.tseries.index.DatetimeIndex'
         - Can set the index of a given DataFrame to be this DatetimeIndex by df.index = dtix
     """
-    datum = 86400*(10*365 + (1980-1969)/4 + 1 + 6 - 2)
-    epoch_time = datum + 86400*7*WeekNum + (TimeOfWeekSec) - 15
-    clk_time = pd.to_datetime(epoch_time.values,unit='s')
-    clk_time_lcl = clk_time + pd.DateOffset(hours=-7)
-    #clk_time_utc = clk_time.tz_localize('UTC')
-    #clk_time_lcl = clk_time_utc.tz_convert('US/Pacific')
-    #for count in range(len(clk_time_lcl)):
-    #    clk_time_lcl[count] = pd.DatetimeIndex[clk_time_lcl[count].replace(tzinfo=None)]
-    #clk_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(epoch_time))
-    return clk_time_lcl
-
-def convertSingleGPSTime( TimeOfWeekSec, WeekNum ):
-    """
-    Convert GPS time (measured in Time-of-Week [seconds] and Week number) to UTC time
-    # REF: mavlink/pymavlink/DFReader.py
-    # epoch = 86400*(10*365 + (1980-1969)/4 + 1 + 6 - 2)
-        return epoch + 86400*7*week + sec - 15
-
-    # TODO: include try/catch for index not valid
+    return convertArrayGPSTime(np.asarray(TimeOfWeekSec, dtype=np.float64) * 1000, WeekNum, tz)
+
+def convertSingleGPSTime( TimeOfWeekSec, WeekNum, tz=DEFAULT_TZ ):
+    """
+    Convert GPS time (measured in Time-of-Week [seconds] and Week number) to a local time string in time zone tz
+    (see convertArrayGPSTime)
+
+    Returns a string in the format '%Y-%m-%d %H:%M:%S'
    """
-    datum = 86400*(10*365 + (1980-1969)/4 + 1 + 6 - 2)
-    epoch_time = datum + 86400*7*WeekNum + (TimeOfWeekSec) - 15
+    clk_time = convertArrayGPSTime(np.array([TimeOfWeekSec * 1000.]), np.array([WeekNum]), tz)[0]
+    return clk_time.strftime('%Y-%m-%d %H:%M:%S')
 
-    clk_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(epoch_time))
-    return clk_time
+# permissions of the files written by atomic_write, as open would create them (mkstemp makes them private)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+@contextmanager
+def atomic_write(path):
+    """Context manager giving the path of a new temporary file next to path to write, which replaces path once the
+    block completes, so a partly written or missing file is never read at path. Each call has its own temporary file,
+    so concurrent writers of the same path do not mix their data: the last one to complete wins. The temporary file is
+    deleted if the block raises."""
+    directory, name = os.path.split(path)
+    handle, temp_path = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=directory or '.')
+    os.close(handle)
+    try:
+        os.chmod(temp_path, 0o666 & ~_UMASK)
+        yield temp_path
+        if hasattr(os, 'replace'):
+            os.replace(temp_path, path)
+        else:
+            if os.name == 'nt' and os.path.exists(path):
+                # Python 2 cannot replace an existing file on Windows in one step
+                os.remove(path)
+            os.rename(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def sortie_msg_filter(sat_message='NSats'):
+    """Returns the message filter (see SDLog2Parser.setMsgFilter) of the messages and fields used by a Sortie (see
+    Sortie.make_log_parser). sat_message is the GPS field holding the number of satellites, numSV in the logs of
+    Event 22."""
+    return [('GPS', ['TimeMS', 'Week', 'T', 'Lat', 'Lng', 'Alt', 'Spd', sat_message, 'HDop']),
+            ('IMU', ['AccX', 'AccY', 'AccZ']),
+            ('CTUN', ['ThrOut']),
+            ('BARO', ['Alt', 'Press']),
+            ('ARSP', ['Airspeed', 'Temp']),
+            ('CURR', ['Curr', 'Volt']),
+            ('MODE', ['Mode']),
+            ('NTUN', ['Arspd']),
+            ('CMD', ['CNum', 'CId'])]
 
 def distance_2GPS( lat1, lon1, lat2, lon2 ):
     """
@@ -0,0 +1,43 @@
+"""Incremental reading of Sortie data files that are still being written, for watching live flights."""
+import io
+import time
+import pandas as pd
+
+
+def follow_csv(csv_path, poll_interval=1.0, idle_timeout=None, dtypes=None):
+    """Generator reading a .csv file as it grows. Yields a pandas Dataframe of the rows added since the previous chunk
+    each time it has caught up with the end of the file.
+
+    Only complete lines are parsed, a partly written last line waits for the next poll. The file is polled every
+    poll_interval seconds, and following stops after idle_timeout seconds without new data (None follows until the
+    generator is closed).
+
+    dtypes gives the dtypes of the columns, so every chunk has the same dtypes whatever its values: a dictionary by
+    column name, or a function of the list of columns of the header returning one (such as Sortie.csv_column_dtypes).
+    """
+    columns = None
+    column_dtypes = None
+    pending = b''
+    idle = 0.0
+    with open(csv_path, 'rb') as csv_file:
+        while True:
+            data = csv_file.read()
+            if len(data) > 0:
+                idle = 0.0
+                pending += data
+                complete = pending.rfind(b'\n') + 1
+                lines, pending = pending[:complete], pending[complete:]
+                if columns is None and len(lines) > 0:
+                    header_end = lines.index(b'\n') + 1
+                    columns = lines[:header_end].decode('ascii').strip().split(',')
+                    lines = lines[header_end:]
+                    column_dtypes = dtypes(columns) if callable(dtypes) else dtypes
+                if len(lines) > 0:
+                    yield pd.read_csv(io.BytesIO(lines), header=None, names=columns, dtype=column_dtypes)
+                continue
+            if idle_timeout is not None and idle >= idle_timeout:
+                break
+            time.sleep(poll_interval)
+            idle += poll_interval
+            # clear the end of file state so the next read sees new data
+            csv_file.seek(csv_file.tell())
@@ -0,0 +1,154 @@
+"""In-process extraction of the parameters (PARM messages) and mission (CMD messages) of dataflash .BIN logs, replacing
+the mavparms.py and mavmission.py tools run as subprocesses.
+
+Only the PARM and CMD messages are decoded (see SDLog2Parser.iterMessages), the others are skipped by length.
+find_sysid stops reading at the SYSID_THISMAV parameter, which is logged at the start of the log. The files written
+have the same format as the output of the tools: one "NAME VALUE" line per parameter in a .parm file, and a QGC WPL
+110 waypoint file. extract_logs extracts the files of many logs in a pool of processes.
+
+Usage: python -m ACSObjects.log_extract <log.BIN> [.parm file] [.wp file]
+"""
+import sys
+from collections import OrderedDict
+from ACSObjects.sdlog2_dump import SDLog2Parser
+from ACSObjects.parallel import map_pool
+
+MAV_FRAME_GLOBAL_RELATIVE_ALT = 3
+"""Frame of the waypoints, as assumed by mavmission.py for CMD messages without a Frame field"""
+
+
+def _make_parser():
+    parser = SDLog2Parser()
+    parser.setCorrectErrors(True)
+    return parser
+
+
+def extract_params(bin_path, names=None):
+    """Returns an OrderedDict of the parameters of the log at bin_path, by name in the order first logged, holding the
+    last value logged (parameters changed in flight are logged again).
+
+    If names is given, only those parameters are returned, with their first value, and the log is only read until all
+    of them are found.
+    """
+    params = OrderedDict()
+    wanted = None if names is None else set(names)
+    messages = _make_parser().iterMessages(bin_path, ['PARM'])
+    try:
+        for msg_name, values in messages:
+            name = values['Name']
+            if len(name) == 0:
+                continue
+            if wanted is None:
+                params[name] = values['Value']
+            elif name in wanted and name not in params:
+                params[name] = values['Value']
+                if len(params) == len(wanted):
+                    break
+    finally:
+        messages.close()
+    return params
+
+
+def find_sysid(bin_path):
+    """Returns the MAVLink system ID (SYSID_THISMAV parameter, the UAV number) of the log at bin_path, None if it is not
+    logged. Only the start of the log is read."""
+    params = extract_params(bin_path, ['SYSID_THISMAV'])
+    if 'SYSID_THISMAV' not in params:
+        return None
+    return int(round(params['SYSID_THISMAV']))
+
+
+def extract_mission(bin_path):
+    """Returns the mission uploaded in the log at bin_path as a list of waypoint dictionaries (seq, current, frame,
+    command, param1 to param4, x, y, z, autocontinue) in sequence order, built from its CMD messages like
+    mavmission.py does: a waypoint logged again replaces the earlier one, missing sequence numbers are filled with a
+    copy of the next waypoint and the mission is cut to the last number of commands (CTot) logged.
+    """
+    return _waypoints_from_cmds(values for msg_name, values in _make_parser().iterMessages(bin_path, ['CMD']))
+
+
+def _waypoints_from_cmds(cmd_values):
+    """Returns the waypoints of extract_mission from the field values of the CMD messages of a log"""
+    waypoints = []
+    num_wps = None
+    for values in cmd_values:
+        num_wps = int(values.get('CTot', 0))
+        waypoint = OrderedDict([('seq', int(values['CNum'])), ('current', 0),
+                                ('frame', int(values.get('Frame', MAV_FRAME_GLOBAL_RELATIVE_ALT))),
+                                ('command', int(values['CId'])), ('param1', values.get('Prm1', 0.0)),
+                                ('param2', values.get('Prm2', 0.0)), ('param3', values.get('Prm3', 0.0)),
+                                ('param4', values.get('Prm4', 0.0)), ('x', values.get('Lat', 0.0)),
+                                ('y', values.get('Lng', 0.0)), ('z', values.get('Alt', 0.0)), ('autocontinue', 1)])
+        while waypoint['seq'] > len(waypoints):
+            dummy = waypoint.copy()
+            dummy['seq'] = len(waypoints)
+            waypoints.append(dummy)
+        if waypoint['seq'] == len(waypoints):
+            waypoints.append(waypoint)
+        else:
+            waypoints[waypoint['seq']] = waypoint
+    if num_wps is not None:
+        del waypoints[num_wps:]
+    return waypoints
+
+
+def write_params(params, output_file):
+    """Writes the parameters dictionary to the .parm file output_file, sorted by name like mavparms.py"""
+    with open(output_file, 'w') as parm_file:
+        for name in sorted(params.keys()):
+            parm_file.write('%-15s %.6f\n' % (name, params[name]))
+    return output_file
+
+
+def write_mission(waypoints, output_file):
+    """Writes the waypoints of extract_mission to the QGC WPL 110 file output_file, like mavmission.py"""
+    with open(output_file, 'w') as wp_file:
+        wp_file.write('QGC WPL 110\n')
+        for w in waypoints:
+            wp_file.write('%u\t%u\t%u\t%u\t%f\t%f\t%f\t%f\t%f\t%f\t%f\t%u\n' % (
+                w['seq'], w['current'], w['frame'], w['command'], w['param1'], w['param2'], w['param3'], w['param4'],
+                w['x'], w['y'], w['z'], w['autocontinue']))
+    return output_file
+
+
+def extract_log(bin_path, parm_path=None, wp_path=None):
+    """Writes the .parm file parm_path and the .wp file wp_path (either None to skip it) of the log at bin_path, reading
+    the log once. Returns (parm_path, wp_path)."""
+    params = OrderedDict()
+    waypoints = None
+    if wp_path is None:
+        if parm_path is not None:
+            params = extract_params(bin_path)
+    else:
+        # one pass over the log for both message types
+        cmd_values = []
+        for msg_name, values in _make_parser().iterMessages(bin_path, ['PARM', 'CMD'] if parm_path else ['CMD']):
+            if msg_name == 'PARM':
+                if len(values['Name']) > 0:
+                    params[values['Name']] = values['Value']
+            else:
+                cmd_values.append(values)
+        waypoints = _waypoints_from_cmds(cmd_values)
+    if parm_path is not None:
+        write_params(params, parm_path)
+    if wp_path is not None:
+        write_mission(waypoints, wp_path)
+    return parm_path, wp_path
+
+
+def _extract_task(task):
+    """Pool task of extract_logs"""
+    return extract_log(*task)
+
+
+def extract_logs(tasks, processes=None):
+    """Calls extract_log for every (bin_path, parm_path, wp_path) task in a pool of processes (see parallel.map_pool).
+    Returns the results in the order of tasks, the exception raised for a log that could not be read."""
+    return map_pool(_extract_task, tasks, processes)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print(__doc__)
+    else:
+        extract_log(sys.argv[1], sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
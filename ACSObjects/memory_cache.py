@@ -0,0 +1,83 @@
+"""Memory budget shared by the flight data of all Sorties.
+
+Every Sortie whose flight data was loaded from a file registers it here with its size in bytes. When the total goes
+over the budget, the flight data of the least recently used Sorties is released, and those Sorties load it again from
+their files the next time it is used. The budget is unlimited until set_budget is called.
+"""
+import threading
+import weakref
+from collections import OrderedDict
+
+_lock = threading.RLock()
+_entries = OrderedDict()
+"""id of the Sortie -> (weak reference to the Sortie, bytes held), least recently used first"""
+_budget = None
+
+
+def set_budget(max_bytes):
+    """Sets the memory budget in bytes for the flight data of all Sorties (None for no limit) and releases data until
+    the total is within it"""
+    global _budget
+    with _lock:
+        _budget = max_bytes
+        _evict()
+
+
+def get_budget():
+    """Returns the memory budget in bytes, None if there is no limit"""
+    return _budget
+
+
+def used_bytes():
+    """Returns the bytes of flight data currently held by the registered Sorties"""
+    with _lock:
+        return sum(size for ref, size in _entries.values())
+
+
+def register(sortie, size):
+    """Records that sortie holds size bytes of flight data it can load again, marks it as the most recently used and
+    releases the data of the least recently used Sorties while the total is over the budget."""
+    key = id(sortie)
+    with _lock:
+        entry = _entries.pop(key, None)
+        ref = entry[0] if entry is not None else weakref.ref(sortie, lambda ref: _forget_key(key))
+        _entries[key] = (ref, size)
+        _evict(key)
+
+
+def touch(sortie):
+    """Marks the flight data of sortie as the most recently used. Returns False if sortie is not registered."""
+    key = id(sortie)
+    with _lock:
+        entry = _entries.pop(key, None)
+        if entry is None:
+            return False
+        _entries[key] = entry
+        return True
+
+
+def forget(sortie):
+    """Stops tracking the flight data of sortie, which is then never released to stay within the budget"""
+    _forget_key(id(sortie))
+
+
+def _forget_key(key):
+    with _lock:
+        _entries.pop(key, None)
+
+
+def _evict(keep=None):
+    """Releases the flight data of the least recently used Sorties, except keep, until the total is within budget"""
+    if _budget is None:
+        return
+    total = sum(size for ref, size in _entries.values())
+    for key in list(_entries.keys()):
+        if total <= _budget:
+            break
+        if key == keep:
+            continue
+        ref, size = _entries.pop(key)
+        sortie = ref()
+        if sortie is not None:
+            sortie.release_flight_data()
+        total -= size
@@ -0,0 +1,145 @@
+"""Helpers to spread independent pieces of work, such as one per Sortie, over a pool of processes or threads."""
+import multiprocessing
+import multiprocessing.pool
+import signal
+from contextlib import contextmanager
+
+EXECUTOR_SERIAL = 'serial'
+EXECUTOR_THREAD = 'thread'
+EXECUTOR_PROCESS = 'process'
+EXECUTORS = (EXECUTOR_SERIAL, EXECUTOR_THREAD, EXECUTOR_PROCESS)
+"""Ways call_method can run the calls: one after another in this process, in a pool of threads or of processes"""
+
+
+class CallTimeout(Exception):
+    """Result of a call that did not finish within its timeout"""
+
+
+def _call(function_and_item):
+    """Pool task: returns function(item), or the exception it raised so one failure does not stop the others"""
+    function, item = function_and_item
+    try:
+        return function(item)
+    except Exception as ex:
+        return ex
+
+
+def map_pool(function, items, processes=None, threads=False):
+    """Calls function on every item and returns the results in the order of items.
+
+    The calls are spread over a pool of processes (of threads if threads is True). processes is the size of the pool,
+    None uses one per CPU and 1 calls function serially in this process. function must be a module level function
+    for a process pool. Like call_sortie_function, the result of a call that raised an exception is the exception.
+    """
+    items = list(items)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(items))
+    if processes <= 1:
+        return [_call((function, item)) for item in items]
+    if threads:
+        pool = multiprocessing.pool.ThreadPool(processes)
+    else:
+        pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(_call, [(function, item) for item in items], chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+@contextmanager
+def _time_limit(timeout):
+    """Raises CallTimeout in the block if it runs longer than timeout seconds. Only enforced in the main thread of a
+    process on platforms with SIGALRM, a no-op elsewhere or if timeout is None."""
+    def expired(signum, frame):
+        raise CallTimeout('Call did not finish within %g s' % timeout)
+    limited = timeout is not None and hasattr(signal, 'setitimer')
+    if limited:
+        try:
+            previous = signal.signal(signal.SIGALRM, expired)
+        except ValueError:
+            # not in the main thread
+            limited = False
+    if not limited:
+        yield
+        return
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _call_method(task):
+    """Pool task of call_method: returns the response of the method call, or the exception it raised, and the
+    worker_state of the object if it is asked for"""
+    obj, method, arg_list, timeout, return_state = task
+    try:
+        with _time_limit(timeout):
+            response = getattr(obj, method)(*arg_list)
+    except Exception as ex:
+        response = ex
+    return response, obj.worker_state() if return_state else None
+
+
+def call_method(objects, method, arg_list=(), executor=EXECUTOR_SERIAL, processes=None, timeout=None):
+    """Calls the method named method with the arguments arg_list on every object and returns the responses in the order
+    of objects. The response of a call that raised an exception is the exception, and the response of a call that did
+    not finish within timeout seconds (None for no limit) is a CallTimeout.
+
+    executor is one of EXECUTORS, and processes the size of the thread or process pool (None for one per CPU). In a
+    process pool, each object is copied to a worker process. The attributes it has after the call are sent back with
+    its worker_state and merged into the object with merge_worker_state (see AbstractLevel). Figures drawn in a worker
+    process are not shown.
+
+    A call running in this process or a worker process is interrupted when it times out. A call in a thread cannot be
+    interrupted: it is left running and its result is ignored. Each call is given at least timeout seconds, counted
+    from when the call before it returned.
+    """
+    objects = list(objects)
+    arg_list = list(arg_list)
+    if executor not in EXECUTORS:
+        raise ValueError('Unknown executor %r, use one of %s' % (executor, ', '.join(EXECUTORS)))
+    if executor == EXECUTOR_SERIAL or len(objects) == 0:
+        return [_call_method((obj, method, arg_list, timeout, False))[0] for obj in objects]
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(objects)))
+    in_processes = executor == EXECUTOR_PROCESS
+    if in_processes:
+        pool = multiprocessing.Pool(processes)
+    else:
+        pool = multiprocessing.pool.ThreadPool(processes)
+    timed_out = False
+    try:
+        results = [pool.apply_async(_call_method, ((obj, method, arg_list, timeout if in_processes else None,
+                                                    in_processes),)) for obj in objects]
+        responses = []
+        for obj, result in zip(objects, results):
+            # a worker process interrupts its own call, so only wait longer than the call itself for it
+            wait = None if timeout is None else (timeout + 5 if in_processes else timeout)
+            try:
+                response, state = result.get(wait)
+            except multiprocessing.TimeoutError:
+                response, state = CallTimeout('Call did not finish within %g s' % timeout), None
+                timed_out = True
+            except Exception as ex:
+                # e.g. a response that cannot be sent back from the worker process
+                response, state = ex, None
+            if state is not None:
+                obj.merge_worker_state(state)
+            responses.append(response)
+    finally:
+        if timed_out and in_processes:
+            pool.terminate()
+            pool.join()
+        elif timed_out:
+            # threads still running timed out calls cannot be stopped, so do not wait for them
+            pool.close()
+        else:
+            pool.close()
+            pool.join()
+    return responses
@@ -0,0 +1,277 @@
+"""Parsed queries over the flight data of a Sortie (see Sortie.query_data for the query syntax).
+
+A query is parsed once into an expression tree of comparisons joined by and, or and not. It is evaluated as a
+boolean mask over the numpy arrays of the Dataframe columns, so no Python source is built or run. Field names must be
+columns of the Dataframe. The mask of every comparison is kept in a MaskCache, so a comparison used again on the same
+Dataframe is not evaluated again.
+
+Example: Query(['GPS_Spd > 3 and (BARO_Alt < 100 or not MODE_Mode == 10)'])
+"""
+import re
+import weakref
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+OPERATORS = {'<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal, '==': np.equal,
+             '!=': np.not_equal}
+
+_TOKEN = re.compile(r'\s*(?:(?P<number>[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)|(?P<name>[A-Za-z_]\w*)|'
+                    r'(?P<op><=|>=|==|!=|<|>)|(?P<symbol>[()&|~]))')
+_KEYWORDS = {'and': '&', 'or': '|', 'not': '~'}
+
+
+class QueryError(ValueError):
+    """Raised for a query that cannot be parsed or refers to a missing field"""
+
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise QueryError('Cannot parse query %r at %r' % (text, text[position:]))
+        position = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'number':
+            tokens.append(('value', float(value)))
+        elif kind == 'name' and value.lower() in _KEYWORDS:
+            tokens.append(('symbol', _KEYWORDS[value.lower()]))
+        elif kind == 'name':
+            tokens.append(('field', value))
+        else:
+            tokens.append((kind, value))
+    return tokens
+
+
+class _Parser(object):
+    """Recursive descent parser of: expr = term ('|' term)*, term = factor ('&' factor)*,
+    factor = '~' factor | '(' expr ')' | operand op operand"""
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = _tokenize(text)
+        self.position = 0
+
+    def parse(self):
+        node = self.expression()
+        if self.position != len(self.tokens):
+            raise QueryError('Unexpected %r in query %r' % (self.tokens[self.position][1], self.text))
+        return node
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        if token[0] is None:
+            raise QueryError('Query %r ends too early' % self.text)
+        self.position += 1
+        return token
+
+    def expression(self):
+        node = self.term()
+        while self.peek() == ('symbol', '|'):
+            self.take()
+            node = ('or', node, self.term())
+        return node
+
+    def term(self):
+        node = self.factor()
+        while self.peek() == ('symbol', '&'):
+            self.take()
+            node = ('and', node, self.factor())
+        return node
+
+    def factor(self):
+        if self.peek() == ('symbol', '~'):
+            self.take()
+            return ('not', self.factor())
+        if self.peek() == ('symbol', '('):
+            self.take()
+            node = self.expression()
+            if self.take() != ('symbol', ')'):
+                raise QueryError('Missing ) in query %r' % self.text)
+            return node
+        left = self.operand()
+        kind, op = self.take()
+        if kind != 'op':
+            raise QueryError('Expected a comparison operator in query %r, found %r' % (self.text, op))
+        return ('compare', left, op, self.operand())
+
+    def operand(self):
+        kind, value = self.take()
+        if kind not in ('field', 'value'):
+            raise QueryError('Expected a field or number in query %r, found %r' % (self.text, value))
+        return (kind, value)
+
+
+def _node_key(node):
+    """Returns the canonical text of an expression tree, used as its cache key"""
+    if node[0] == 'compare':
+        return '%s %s %s' % (_operand_key(node[1]), node[2], _operand_key(node[3]))
+    if node[0] == 'not':
+        return 'not (%s)' % _node_key(node[1])
+    return '(%s) %s (%s)' % (_node_key(node[1]), node[0], _node_key(node[2]))
+
+
+def _operand_key(operand):
+    return operand[1] if operand[0] == 'field' else repr(operand[1])
+
+
+class Query(object):
+    """One query of Sortie.query_data, parsed from its list form:
+
+    ['FIELD OP NUMBER'] or ['FIELD', 'OP', NUMBER]: rows matching the expression (and, or, not and parentheses can
+    join several comparisons in the one string form)
+    ['or', ...]: rows matching either the previous queries or this one
+    ['index', 'START_ATTRIBUTE', 'END_ATTRIBUTE']: rows between two Timestamp attributes of the Sortie
+    ['reset']: all rows
+    """
+
+    def __init__(self, query_list):
+        if isinstance(query_list, Query):
+            query_list = query_list.query_list
+        if isinstance(query_list, string_types) or not hasattr(query_list, '__len__'):
+            query_list = [query_list]
+        self.query_list = list(query_list)
+        '''The list form the query was parsed from'''
+        self.combine = 'and'
+        '''How the query joins the previous ones: 'and', 'or', 'reset' or 'index' (an 'and' on a time range)'''
+        self.node = None
+        '''Expression tree of the query'''
+
+        terms = self.query_list
+        if len(terms) > 0 and terms[0] == 'reset':
+            self.combine = 'reset'
+            return
+        if len(terms) > 0 and terms[0] == 'index':
+            if len(terms) != 3:
+                raise QueryError('Index queries need a start and an end attribute: %r' % (terms,))
+            self.combine = 'index'
+            self.node = ('index', terms[1], terms[2])
+            return
+        if len(terms) > 0 and terms[0] == 'or':
+            self.combine = 'or'
+            terms = terms[1:]
+        if len(terms) == 1:
+            self.node = _Parser(str(terms[0])).parse()
+        elif len(terms) == 3:
+            value = terms[2] if isinstance(terms[2], string_types) else '%.17g' % terms[2]
+            self.node = _Parser('%s %s %s' % (terms[0], terms[1], value)).parse()
+        else:
+            raise QueryError('Query specifications must be 1 or 3 items long. This query has %d items: %r' % (
+                len(terms), self.query_list))
+
+    def __repr__(self):
+        return 'Query(%r)' % (self.query_list,)
+
+    def key(self):
+        """Returns the canonical text of the query expression"""
+        if self.node is None or self.node[0] == 'index':
+            return repr(self.node)
+        return _node_key(self.node)
+
+    def mask(self, frame, namespace=None, cache=None):
+        """Returns the boolean mask of the rows of the Dataframe frame matching the query expression.
+        namespace is the object holding the Timestamp attributes of an index query (the Sortie), and cache an optional
+        MaskCache of frame."""
+        if self.node is None:
+            return np.ones(len(frame), dtype=bool)
+        return _evaluate(self.node, frame, namespace, cache)
+
+
+def _evaluate(node, frame, namespace, cache):
+    if node[0] == 'and':
+        return _evaluate(node[1], frame, namespace, cache) & _evaluate(node[2], frame, namespace, cache)
+    if node[0] == 'or':
+        return _evaluate(node[1], frame, namespace, cache) | _evaluate(node[2], frame, namespace, cache)
+    if node[0] == 'not':
+        return ~_evaluate(node[1], frame, namespace, cache)
+    if node[0] == 'index':
+        start = getattr(namespace, node[1])
+        end = getattr(namespace, node[2])
+        if start is None or end is None:
+            raise QueryError('%s and %s must both be set for an index query' % (node[1], node[2]))
+        key = 'index %s %s' % (start, end)
+        compute = lambda: _time_range_mask(frame.index, start, end)
+    else:
+        key = _node_key(node)
+        compute = lambda: _compare(node, frame)
+    if cache is None:
+        return compute()
+    return cache.get(frame, key, compute)
+
+
+def _operand_values(operand, frame):
+    if operand[0] == 'value':
+        return operand[1]
+    if operand[1] not in frame.columns:
+        raise QueryError('%s is not a field of the flight data' % operand[1])
+    return frame[operand[1]].values
+
+
+def _compare(node, frame):
+    with np.errstate(invalid='ignore'):
+        mask = OPERATORS[node[2]](_operand_values(node[1], frame), _operand_values(node[3], frame))
+    if np.ndim(mask) == 0:
+        # comparison of two numbers
+        mask = np.repeat(bool(mask), len(frame))
+    return mask
+
+
+def _time_range_mask(index, start, end):
+    times = index.values
+    return (times >= np.datetime64(pd.Timestamp(start))) & (times <= np.datetime64(pd.Timestamp(end)))
+
+
+def apply_mask(frame, mask):
+    """Returns the rows of frame selected by mask: a view of frame if they are contiguous, a copy otherwise"""
+    positions = np.flatnonzero(mask)
+    if len(positions) == 0:
+        return frame.iloc[0:0]
+    if positions[-1] - positions[0] + 1 == len(positions):
+        return frame.iloc[positions[0]:positions[-1] + 1]
+    return frame.iloc[positions]
+
+
+class MaskCache(object):
+    """Keeps the masks of the latest max_entries expressions evaluated on one Dataframe. The masks are dropped when
+    asked for another Dataframe, such as the flight data loaded again after being released."""
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._frame = None
+        self._masks = OrderedDict()
+
+    def get(self, frame, key, compute):
+        """Returns the cached mask of expression key on frame, calling compute to make it if it is not cached"""
+        if self._frame is None or self._frame() is not frame:
+            self._frame = weakref.ref(frame)
+            self._masks = OrderedDict()
+        mask = self._masks.pop(key, None)
+        if mask is None:
+            mask = compute()
+            while len(self._masks) >= self.max_entries:
+                self._masks.popitem(last=False)
+        self._masks[key] = mask
+        return mask
+
+    def clear(self):
+        self._frame = None
+        self._masks = OrderedDict()
+
+    def __getstate__(self):
+        # weak references cannot be pickled, and the masks are quick to make again
+        return {'max_entries': self.max_entries}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_entries'])
@@ -16,12 +16,31 @@ Usage: python sdlog2_dump.py <log.bin> [-v] [-e] [-d delimiter] [-n null] [-m MS
     
     -m MSG[.field1,field2,...]
         Dump only messages of specified type, and only specified fields.
-        Multiple -m options allowed."""
+        Multiple -m options allowed.
+
+    -x engine
+        Decode with "engine", "struct" (default) or "numpy".
+
+    -r rate
+        Resample rows to "rate" Hz of GPS time.
+
+    -i  Decode through the sidecar index of the log, building it on first use.
+
+    -w start,end
+        Decode only messages logged between "start" and "end" ms of GPS time (since the GPS epoch), using the
+        sidecar index."""
 
 __author__  = "Anton Babushkin"
 __version__ = "1.2"
 
-import struct, sys
+import struct, sys, os, re, mmap, time
+import multiprocessing
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 if sys.hexversion >= 0x030000F0:
     runningPython3 = True
@@ -32,6 +51,78 @@ else:
     def _parseCString(cstr):
         return str(cstr).split('\0')[0]
 
+def _parseCStringArray(cstrs):
+    """Vectorized _parseCString for a numpy array of fixed-width byte strings"""
+    width = cstrs.dtype.itemsize
+    chars = np.ascontiguousarray(cstrs).view(np.uint8).reshape(-1, width).copy()
+    # blank everything from the first NUL on, numpy drops trailing NULs itself
+    chars[np.cumsum(chars == 0, axis=1) > 0] = 0
+    cstrs = chars.view("S%i" % width).reshape(-1)
+    if runningPython3:
+        cstrs = np.char.decode(cstrs, 'ascii')
+    return cstrs
+
+def _columnArray(values):
+    """Convert a sequence of CSV values, None for empty cells, to a numpy array with NaN for empty cells"""
+    missing = [v is None for v in values]
+    present = [v for v in values if v is not None]
+    if len(present) > 0 and isinstance(present[0], str):
+        column = np.array(values, dtype=object)
+        column[np.array(missing)] = np.nan
+        return column
+    if any(missing):
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    return np.array(values)
+
+def _scanDataMsgs(buf, ptr, stop, msg_lengths):
+    """Walk the data messages of buf from ptr as the numpy engine scan does, until the first message at or after stop.
+
+    Returns the offsets and types of the messages, the final read pointer and None, or the reason the walk stopped
+    early at the read pointer: "format" for a FORMAT message, "header" for an invalid header, "type" for an unknown
+    message type. Corrupted logs are left to the serial scan, which recovers from errors.
+    """
+    head1, head2, type_format = SDLog2Parser.MSG_HEAD1, SDLog2Parser.MSG_HEAD2, SDLog2Parser.MSG_TYPE_FORMAT
+    buf_len = len(buf)
+    offsets = []
+    types = []
+    while ptr < stop and buf_len - ptr >= SDLog2Parser.MSG_HEADER_LEN:
+        if buf[ptr] != head1 or buf[ptr+1] != head2:
+            return offsets, types, ptr, "header"
+        msg_type = buf[ptr+2]
+        if msg_type == type_format:
+            return offsets, types, ptr, "format"
+        msg_length = msg_lengths[msg_type]
+        if msg_length == 0:
+            return offsets, types, ptr, "type"
+        if buf_len - ptr < msg_length:
+            break
+        offsets.append(ptr)
+        types.append(msg_type)
+        ptr += msg_length
+    return offsets, types, ptr, None
+
+def _scanChunk(args):
+    """Process pool task of the parallel scan: walk the messages of one chunk of a log file from its first sync point"""
+    fn, start, stop, msg_lengths = args
+    f = open(fn, "rb")
+    try:
+        f.seek(start)
+        # a message starting before stop ends at most 255 bytes after it
+        buf = bytearray(f.read(stop - start + 256))
+    finally:
+        f.close()
+    # the first header of a known data message type, which may be a false one inside a message
+    ptr = 0
+    while True:
+        ptr = buf.find(b"\xa3\x95", ptr)
+        if ptr < 0 or ptr + 2 >= len(buf) or msg_lengths[buf[ptr+2]] != 0:
+            break
+        ptr += 1
+    if ptr < 0 or ptr >= stop - start:
+        ptr = stop - start
+    offsets, types, ptr, stopped = _scanDataMsgs(buf, ptr, stop - start, msg_lengths)
+    return start + np.array(offsets, dtype=np.int64), np.array(types, dtype=np.uint8), start + ptr, stopped
+
 class SDLog2Parser:
     BLOCK_SIZE = 8192
     MSG_HEADER_LEN = 3
@@ -61,6 +152,14 @@ class SDLog2Parser:
         "q": ("q", None),
         "Q": ("Q", None),
     }
+    ENGINE_STRUCT = "struct"    # decode message by message with struct.unpack
+    ENGINE_NUMPY = "numpy"      # decode all messages of a type at once with np.frombuffer
+    INPUT_STREAM = "stream"     # read the file in BLOCK_SIZE chunks
+    INPUT_MMAP = "mmap"         # parse straight from a read-only memory map of the file
+    MS_PER_WEEK = 604800000
+    PARALLEL_MIN_CHUNK = 1 << 20    # smallest chunk of a log scanned by one process in parallel mode
+    INDEX_SUFFIX = ".idx.npz"   # the index of log.BIN is log.BIN.idx.npz
+    INDEX_VERSION = 1
     __csv_delim = ","
     __csv_null = ""
     __msg_filter = []
@@ -69,20 +168,45 @@ class SDLog2Parser:
     __correct_errors = False
     __file_name = None
     __file = None
+    __engine = ENGINE_STRUCT
+    __input_mode = INPUT_STREAM
+    __collect = False
+    __resample_rate = None
+    __resample_time_field = "GPS_TimeMS"
+    __resample_week_field = "GPS_Week"
+    __use_index = False
+    __window = None
+    __index_time_field = "GPS_TimeMS"
+    __index_week_field = "GPS_Week"
+    __index_checkpoint_every = 1000
+    __processes = None
     
     def __init__(self):
         return
     
     def reset(self):
         self.__msg_descrs = {}      # message descriptions by message type map
+        self.__msg_structs = {}     # precompiled struct.Struct by message type map
+        self.__msg_plans = [None] * 256 # CSV parsing plan by message type, see __msgPlan
         self.__msg_labels = {}      # message labels by message name map
         self.__msg_names = []       # message names in the same order as FORMAT messages
         self.__buffer = bytearray() # buffer for input binary data
+        self.__buffer_end = 0       # end of the data to parse in buffer
         self.__ptr = 0              # read pointer in buffer
+        self.__fmt_offsets = []     # offsets of FORMAT messages in the numpy engine scan
+        self.__mmap = None          # mapped input file in mmap input mode
+        self.__bytes_copied = 0     # input bytes copied in memory while parsing
+        self.__input = None         # input file, to look past the buffer while recovering from errors
+        self.__corrupt_start = None # offset in the file of the corrupted region being skipped
+        self.__corrupt_regions = [] # (offset, length) of the skipped corrupted regions
+        self.__rows = []            # collected CSV rows when returning columns instead of printing
+        self.__columns = OrderedDict()  # decoded columns by CSV column name
         self.__csv_columns = []     # CSV file columns in correct order in format "MSG.label"
         self.__csv_data = {}        # current values for all columns
         self.__csv_updated = False
         self.__msg_filter_map = {}  # filter in form of map, with '*" expanded to full list of fields
+        self.__msg_sink = None      # (name, values) of the decoded messages named in __sink_names, see iterMessages
+        self.__sink_names = set()
     
     def setCSVDelimiter(self, csv_delim):
         self.__csv_delim = csv_delim
@@ -100,9 +224,67 @@ class SDLog2Parser:
         self.__debug_out = debug_out
 
     def setCorrectErrors(self, correct_errors):
+        """Skip corrupted bytes, invalid headers and unknown message types, instead of raising an exception. Parsing
+        resumes at the next sync pair (0xA3 0x95) of a known message type that is followed, one message length later,
+        by another sync pair or the end of the log. The skipped bytes are reported by getCorruptRegions."""
         self.__correct_errors = correct_errors
 
+    def setEngine(self, engine):
+        if engine not in (self.ENGINE_STRUCT, self.ENGINE_NUMPY):
+            raise Exception("Unknown engine: %s" % engine)
+        if engine == self.ENGINE_NUMPY and np is None:
+            raise Exception("The %s engine requires numpy" % engine)
+        self.__engine = engine
+
+    def setInputMode(self, input_mode):
+        if input_mode not in (self.INPUT_STREAM, self.INPUT_MMAP):
+            raise Exception("Unknown input mode: %s" % input_mode)
+        self.__input_mode = input_mode
+
+    def setResampleRate(self, rate_hz, time_field="GPS_TimeMS", week_field="GPS_Week"):
+        """Snap the output rows to a grid of rate_hz rows per second of GPS time, using the latest value of every
+        column at each grid time. time_field and week_field are the CSV columns holding the GPS time of week in ms and
+        the GPS week (week_field may be None). None keeps every row at its native rate."""
+        if rate_hz != None and rate_hz <= 0:
+            raise Exception("Resample rate must be positive: %s" % rate_hz)
+        self.__resample_rate = rate_hz
+        self.__resample_time_field = time_field
+        self.__resample_week_field = week_field
+
+    def setUseIndex(self, use_index, checkpoint_every=1000):
+        """Decode through the sidecar index of the log (see buildIndex), reading only the messages of the types in the
+        message filter instead of scanning the whole file. The index is built and saved on first use, with a time
+        checkpoint every checkpoint_every messages. Indexed decoding always uses the numpy engine."""
+        if use_index and np is None:
+            raise Exception("The sidecar index requires numpy")
+        self.__use_index = use_index
+        self.__index_checkpoint_every = checkpoint_every
+
+    def setTimeWindow(self, start_ms, end_ms, time_field="GPS_TimeMS", week_field="GPS_Week"):
+        """Decode only the messages logged between start_ms and end_ms (inclusive) of GPS time, in ms since the GPS
+        epoch, or in ms of the week if week_field is None. A message is logged at the time of the latest time_field
+        message at or before it. Uses the sidecar index. None for start_ms and end_ms decodes the whole log."""
+        if start_ms == None and end_ms == None:
+            self.__window = None
+            return
+        if np is None:
+            raise Exception("The time window requires numpy")
+        self.__window = (-np.inf if start_ms == None else start_ms, np.inf if end_ms == None else end_ms)
+        self.__index_time_field = time_field
+        self.__index_week_field = week_field
+
+    def setProcesses(self, processes):
+        """Scan the messages of the numpy engine in this many processes, each walking a chunk of the log from its first
+        sync point. The chunks are joined where the message chain of one chunk meets the next, and any chunk that does
+        not meet is walked again serially, so the output is identical to serial decoding. None or 1 scans serially,
+        and logs smaller than PARALLEL_MIN_CHUNK per process are always scanned serially."""
+        if processes != None and processes < 1:
+            raise Exception("Process count must be positive: %s" % processes)
+        self.__processes = processes
+
     def setFileName(self, file_name):
+    	if self.__file != None:
+    		self.__file.close()
     	self.__file_name = file_name
     	if file_name != None:
     		self.__file = open(file_name, 'w+')
@@ -111,56 +293,817 @@ class SDLog2Parser:
 
     
     def process(self, fn):
+        if not self.__debug_out and (self.__use_index or self.__window != None):
+            self.__processIndexed(fn)
+            return
+        if self.__engine == self.ENGINE_NUMPY and not self.__debug_out:
+            self.__processNumpy(fn)
+            return
         self.reset()
         if self.__debug_out:
             # init __msg_filter_map
             for msg_name, show_fields in self.__msg_filter:
                 self.__msg_filter_map[msg_name] = show_fields
-        first_data_msg = True
+        self.__first_data_msg = True
         f = open(fn, "rb")
-        bytes_read = 0
-        while True:
-            chunk = f.read(self.BLOCK_SIZE)
-            if len(chunk) == 0:
-                break
-            self.__buffer = self.__buffer[self.__ptr:] + chunk
-            self.__ptr = 0
-            while self.__bytesLeft() >= self.MSG_HEADER_LEN:
-                head1 = self.__buffer[self.__ptr]
-                head2 = self.__buffer[self.__ptr+1]
-                if (head1 != self.MSG_HEAD1 or head2 != self.MSG_HEAD2):
-                    if self.__correct_errors:
-                        self.__ptr += 1
-                        continue
-                    else:
-                        raise Exception("Invalid header at %i (0x%X): %02X %02X, must be %02X %02X" % (bytes_read + self.__ptr, bytes_read + self.__ptr, head1, head2, self.MSG_HEAD1, self.MSG_HEAD2))
-                msg_type = self.__buffer[self.__ptr+2]
-                if msg_type == self.MSG_TYPE_FORMAT:
-                    # parse FORMAT message
-                    if self.__bytesLeft() < self.MSG_FORMAT_PACKET_LEN:
+        self.__input = f
+        try:
+            if self.__input_mode == self.INPUT_MMAP:
+                self.__openMmap(f)
+                buf_len = len(self.__buffer)
+                # parse in BLOCK_SIZE steps so rows are printed exactly as in stream mode
+                for block_end in range(self.BLOCK_SIZE, buf_len + self.BLOCK_SIZE, self.BLOCK_SIZE):
+                    self.__buffer_end = min(block_end, buf_len)
+                    self.__parseBuffer(0)
+                    if not self.__debug_out and self.__time_msg != None and self.__csv_updated:
+                        self.__printCSVRow()
+                self.__endCorruption(self.__ptr)
+            else:
+                bytes_read = 0
+                while True:
+                    chunk = f.read(self.BLOCK_SIZE)
+                    if len(chunk) == 0:
                         break
-                    self.__parseMsgDescr()
+                    bytes_read = self.__parseChunk(chunk, bytes_read)
+                self.__endCorruption(bytes_read)
+        finally:
+            self.__closeMmap()
+            self.__input = None
+            f.close()
+        if self.__bufferRows() and not self.__first_data_msg:
+            self.__output(self.__rowsToColumns(), len(self.__rows))
+            self.__rows = []
+
+    def __parseChunk(self, chunk, bytes_read):
+        """Append a chunk read from the file to the unparsed bytes and parse them. Returns the new file offset of the
+        start of the buffer."""
+        # the leftover bytes are copied by the slice and again with the chunk by the concatenation
+        self.__bytes_copied += 2 * self.__bytesLeft() + len(chunk)
+        self.__buffer = self.__buffer[self.__ptr:] + chunk
+        self.__buffer_end = len(self.__buffer)
+        self.__ptr = 0
+        self.__parseBuffer(bytes_read)
+        bytes_read += self.__ptr
+        if not self.__debug_out and self.__time_msg != None and self.__csv_updated:
+            self.__printCSVRow()
+        return bytes_read
+
+    def follow(self, fn, poll_interval=1.0, idle_timeout=None):
+        """Generator decoding a log that is still being written. Yields the rows decoded since the previous chunk as an
+        OrderedDict of numpy arrays, like processColumns, each time it has caught up with the end of the file.
+
+        The file is polled every poll_interval seconds and the parser state is kept between polls, so every byte is
+        decoded once. Following stops after idle_timeout seconds without new data (None follows until the generator
+        is closed). Rows are decoded by the struct engine in stream mode and are not resampled. The parser must not
+        be used for anything else while following.
+        """
+        self.reset()
+        self.__first_data_msg = True
+        self.__collect = True
+        f = open(fn, "rb")
+        self.__input = f
+        try:
+            bytes_read = 0
+            idle = 0.0
+            while True:
+                chunk = f.read(self.BLOCK_SIZE)
+                if len(chunk) > 0:
+                    bytes_read = self.__parseChunk(chunk, bytes_read)
+                    idle = 0.0
+                    continue
+                if len(self.__rows) > 0:
+                    yield self.__takeRows()
+                if idle_timeout != None and idle >= idle_timeout:
+                    break
+                time.sleep(poll_interval)
+                idle += poll_interval
+                # clear the end of file state so the next read sees new data
+                f.seek(f.tell())
+        finally:
+            self.__collect = False
+            self.__input = None
+            f.close()
+
+    def followDataFrame(self, fn, poll_interval=1.0, idle_timeout=None):
+        """Like follow, yielding pandas DataFrames with the same columns as the CSV output"""
+        import pandas as pd
+        for columns in self.follow(fn, poll_interval, idle_timeout):
+            yield pd.DataFrame(columns, columns=list(columns.keys()))
+
+    def __takeRows(self):
+        """Remove the buffered rows and return them as an OrderedDict of numpy arrays by CSV column"""
+        n_rows = len(self.__rows)
+        columns = self.__rowsToColumns()
+        self.__rows = []
+        return OrderedDict((full_label, self.__columnArray(columns.get(full_label), n_rows))
+                           for full_label in self.__csv_columns)
+
+    def processColumns(self, fn):
+        """Decode fn and return the CSV columns as an OrderedDict of numpy arrays keyed by "MSG_field", without
+        formatting any text. Empty CSV cells are NaN."""
+        self.__collect = True
+        try:
+            self.process(fn)
+        finally:
+            self.__collect = False
+        return self.__columns
+
+    def processDataFrame(self, fn):
+        """Decode fn into a pandas DataFrame with the same columns as the CSV output"""
+        import pandas as pd
+        columns = self.processColumns(fn)
+        return pd.DataFrame(columns, columns=list(columns.keys()))
+
+    def iterMessages(self, fn, msg_names):
+        """Generator decoding only the messages of fn named in msg_names. Yields (message name, OrderedDict of values by
+        field label) in log order, with strings and multipliers converted as in the CSV output.
+
+        The other messages are skipped by length without being unpacked, and the file is read in BLOCK_SIZE chunks as
+        the generator is consumed, so closing it early (e.g. once a parameter logged at the start is found) reads only
+        the start of the log. Errors are recovered from as set by setCorrectErrors.
+        """
+        self.reset()
+        self.__first_data_msg = True
+        self.__msg_sink = []
+        self.__sink_names = set(msg_names)
+        debug_out = self.__debug_out
+        self.__debug_out = False
+        f = open(fn, "rb")
+        self.__input = f
+        try:
+            bytes_read = 0
+            while True:
+                chunk = f.read(self.BLOCK_SIZE)
+                if len(chunk) == 0:
+                    break
+                bytes_read = self.__parseChunk(chunk, bytes_read)
+                msgs = self.__msg_sink
+                self.__msg_sink = []
+                for msg in msgs:
+                    yield msg
+            self.__endCorruption(bytes_read)
+        finally:
+            self.__msg_sink = None
+            self.__debug_out = debug_out
+            self.__input = None
+            f.close()
+
+    def __parseBuffer(self, bytes_read):
+        """Parse all complete messages between the read pointer and __buffer_end"""
+        while self.__bytesLeft() >= self.MSG_HEADER_LEN:
+            head1 = self.__buffer[self.__ptr]
+            head2 = self.__buffer[self.__ptr+1]
+            if (head1 != self.MSG_HEAD1 or head2 != self.MSG_HEAD2 or
+                    (self.__corrupt_start != None and not self.__isPlausibleMsg(self.__ptr, bytes_read))):
+                if self.__correct_errors:
+                    self.__skipCorruption(bytes_read)
+                    continue
                 else:
-                    # parse data message
-                    msg_descr = self.__msg_descrs[msg_type]
-                    if msg_descr == None:
-                        raise Exception("Unknown msg type: %i" % msg_type)
-                    msg_length = msg_descr[0]
-                    if self.__bytesLeft() < msg_length:
+                    raise Exception("Invalid header at %i (0x%X): %02X %02X, must be %02X %02X" % (bytes_read + self.__ptr, bytes_read + self.__ptr, head1, head2, self.MSG_HEAD1, self.MSG_HEAD2))
+            self.__endCorruption(bytes_read + self.__ptr)
+            msg_type = self.__buffer[self.__ptr+2]
+            if msg_type == self.MSG_TYPE_FORMAT:
+                # parse FORMAT message
+                if self.__bytesLeft() < self.MSG_FORMAT_PACKET_LEN:
+                    break
+                self.__parseMsgDescr()
+            else:
+                # parse data message
+                msg_plan = self.__msg_plans[msg_type]
+                if msg_plan != None:
+                    # known type after the first data message
+                    if self.__bytesLeft() < msg_plan[0]:
                         break
-                    if first_data_msg:
-                        # build CSV columns and init data map
-                        if not self.__debug_out:
-                            self.__initCSV()
-                        first_data_msg = False
+                    if msg_plan[1] == None and not msg_plan[2]:
+                        # filtered out, skip by length
+                        self.__ptr += msg_plan[0]
+                    else:
+                        self.__parseMsgPlan(msg_plan)
+                    continue
+                msg_descr = self.__msg_descrs.get(msg_type)
+                if msg_descr == None:
+                    if self.__correct_errors:
+                        self.__skipCorruption(bytes_read)
+                        continue
+                    raise Exception("Unknown msg type: %i" % msg_type)
+                msg_length = msg_descr[0]
+                if self.__bytesLeft() < msg_length:
+                    break
+                if self.__first_data_msg:
+                    # build CSV columns and init data map
+                    if not self.__debug_out and self.__msg_sink == None:
+                        self.__initCSV()
+                    self.__first_data_msg = False
+                if self.__debug_out:
                     self.__parseMsg(msg_descr)
-            bytes_read += self.__ptr
-            if not self.__debug_out and self.__time_msg != None and self.__csv_updated:
-                self.__printCSVRow()
-        f.close()
-    
+                else:
+                    # the message is parsed by its plan on the next pass of the loop
+                    self.__msg_plans[msg_type] = self.__msgPlan(msg_type)
+
+    def __skipCorruption(self, bytes_read):
+        """Move the read pointer from a corrupted header to the next sync pair, searching the buffer in bulk. If there is
+        none, keep the last bytes of the buffer since they may start one."""
+        if self.__corrupt_start == None:
+            self.__corrupt_start = bytes_read + self.__ptr
+        sync = self.__find(self.__ptr + 1, self.__buffer_end)
+        if sync < 0:
+            sync = self.__buffer_end - (self.MSG_HEADER_LEN - 1)
+        self.__ptr = sync
+
+    def __find(self, start, end):
+        """Offset of the first sync pair in the buffer between start and end, -1 if there is none"""
+        if self.__mmap != None:
+            return self.__mmap.find(b"\xa3\x95", start, end)
+        return self.__buffer.find(b"\xa3\x95", start, end)
+
+    def __isPlausibleMsg(self, ptr, bytes_read):
+        """True if the sync pair at ptr starts a message of a known type that is followed by another sync pair or the
+        end of the log"""
+        msg_type = self.__buffer[ptr+2]
+        if msg_type == self.MSG_TYPE_FORMAT:
+            msg_length = self.MSG_FORMAT_PACKET_LEN
+        elif msg_type in self.__msg_descrs:
+            msg_length = self.__msg_descrs[msg_type][0]
+        else:
+            return False
+        next_ptr = ptr + msg_length
+        if next_ptr + 2 <= len(self.__buffer):
+            head = self.__buffer[next_ptr:next_ptr+2]
+        elif self.__input == None:
+            # the whole log is in the buffer
+            return True
+        else:
+            # in stream mode the next message may not be read yet
+            position = self.__input.tell()
+            self.__input.seek(bytes_read + next_ptr)
+            head = bytearray(self.__input.read(2))
+            self.__input.seek(position)
+            if len(head) < 2:
+                return True
+        return head[0] == self.MSG_HEAD1 and head[1] == self.MSG_HEAD2
+
+    def __endCorruption(self, end):
+        """Record the corrupted region being skipped, if any, as ending at file offset end"""
+        if self.__corrupt_start != None:
+            if end > self.__corrupt_start:
+                self.__corrupt_regions.append((self.__corrupt_start, end - self.__corrupt_start))
+            self.__corrupt_start = None
+
+    def __openMmap(self, f):
+        """Map the whole file read-only and parse straight from it without copying"""
+        if os.fstat(f.fileno()).st_size == 0:
+            # empty files cannot be mapped
+            return
+        self.__mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if runningPython3:
+            self.__buffer = memoryview(self.__mmap)
+        elif np != None:
+            # Python 2 mmap objects index as str, a numpy view indexes as ints
+            self.__buffer = np.frombuffer(self.__mmap, dtype=np.uint8)
+        else:
+            raise Exception("The %s input mode requires numpy under Python 2" % self.INPUT_MMAP)
+        self.__buffer_end = len(self.__buffer)
+
+    def __closeMmap(self):
+        buf = self.__buffer
+        self.__buffer = bytearray()
+        self.__buffer_end = 0
+        if self.__mmap != None:
+            if runningPython3 and isinstance(buf, memoryview):
+                buf.release()
+            del buf
+            self.__mmap.close()
+            self.__mmap = None
+
+    def getCorruptRegions(self):
+        """Returns the (offset, length) in bytes of every corrupted region skipped by the last call to process()"""
+        return list(self.__corrupt_regions)
+
+    def getSkippedBytes(self):
+        """Returns the number of corrupted bytes skipped by the last call to process()"""
+        return sum(length for offset, length in self.__corrupt_regions)
+
+    def getBytesCopied(self):
+        """Returns the number of input bytes copied in memory by the last call to process()"""
+        return self.__bytes_copied
+
+    def __processNumpy(self, fn):
+        self.reset()
+        f = open(fn, "rb")
+        try:
+            self.__readBuffer(f)
+            offsets, types = None, None
+            if self.__processes != None and self.__processes > 1:
+                offsets, types = self.__scanMsgsParallel(fn)
+            if offsets is None:
+                offsets, types = self.__scanMsgs()
+            if len(offsets) == 0:
+                return
+            cutoffs = self.__rowCutoffs(offsets, types, self.__msgLengths()[types])
+            columns = self.__decodeColumns(offsets, types, cutoffs)
+        finally:
+            self.__closeMmap()
+            f.close()
+        self.__output(columns, len(cutoffs))
+
+    def __scanMsgsParallel(self, fn):
+        """Scan the messages after the leading FORMAT messages in a process pool, see setProcesses. Returns None, None if
+        the log must be scanned serially."""
+        buf = self.__buffer
+        buf_len = len(buf)
+        ptr = 0
+        while (buf_len - ptr >= self.MSG_FORMAT_PACKET_LEN and buf[ptr] == self.MSG_HEAD1 and
+               buf[ptr+1] == self.MSG_HEAD2 and buf[ptr+2] == self.MSG_TYPE_FORMAT):
+            self.__ptr = ptr
+            self.__fmt_offsets.append(ptr)
+            self.__parseMsgDescr()
+            ptr = self.__ptr
+        n_chunks = min(self.__processes, (buf_len - ptr) // self.PARALLEL_MIN_CHUNK)
+        if n_chunks > 1:
+            msg_lengths = [int(length) for length in self.__msgLengths()]
+            bounds = [ptr + (buf_len - ptr) * i // n_chunks for i in range(n_chunks + 1)]
+            tasks = [(fn, bounds[i], bounds[i+1], msg_lengths) for i in range(1, n_chunks)]
+            pool = multiprocessing.Pool(n_chunks - 1)
+            try:
+                # the first chunk is walked here while the pool walks the others
+                results = pool.map_async(_scanChunk, tasks)
+                offsets, types, ptr, stopped = _scanDataMsgs(buf, ptr, bounds[1], msg_lengths)
+                chunks = [(np.array(offsets, dtype=np.int64), np.array(types, dtype=np.uint8))]
+                for (chunk_offsets, chunk_types, chunk_ptr, chunk_stopped), task in zip(results.get(), tasks):
+                    if stopped != None:
+                        break
+                    stop = task[2]
+                    if ptr >= stop:
+                        continue
+                    # the walks agree from the first message both of them start at
+                    i = np.searchsorted(chunk_offsets, ptr)
+                    if i < len(chunk_offsets) and chunk_offsets[i] == ptr:
+                        chunks.append((chunk_offsets[i:], chunk_types[i:]))
+                        ptr, stopped = chunk_ptr, chunk_stopped
+                    else:
+                        offsets, types, ptr, stopped = _scanDataMsgs(buf, ptr, stop, msg_lengths)
+                        chunks.append((np.array(offsets, dtype=np.int64), np.array(types, dtype=np.uint8)))
+            finally:
+                pool.close()
+                pool.join()
+            if stopped == None:
+                offsets = np.concatenate([chunk[0] for chunk in chunks])
+                types = np.concatenate([chunk[1] for chunk in chunks])
+                if len(offsets) > 0:
+                    self.__initCSV()
+                self.__ptr = ptr
+                return offsets, types
+        # a small log, or a FORMAT message or an error after the data start, which the serial scan handles
+        self.__msg_descrs = {}
+        self.__msg_labels = {}
+        self.__msg_names = []
+        self.__fmt_offsets = []
+        return None, None
+
+    def __readBuffer(self, f):
+        """Map or read the whole file into the buffer, depending on the input mode"""
+        if self.__input_mode == self.INPUT_MMAP:
+            self.__openMmap(f)
+        else:
+            self.__buffer = bytearray(os.fstat(f.fileno()).st_size)
+            f.readinto(self.__buffer)
+            self.__buffer_end = len(self.__buffer)
+
+    def __msgLengths(self):
+        """Message length by message type, 0 for unknown types"""
+        msg_lengths = np.zeros(256, dtype=np.int64)
+        for msg_type, msg_descr in self.__msg_descrs.items():
+            msg_lengths[msg_type] = msg_descr[0]
+        return msg_lengths
+
+    def indexPath(self, fn):
+        """Returns the path of the sidecar index of log fn"""
+        return fn + self.INDEX_SUFFIX
+
+    def buildIndex(self, fn, checkpoint_every=1000):
+        """Scan log fn once and save its sidecar index next to it. Returns the index as a map of numpy arrays.
+
+        The index holds the offsets of the FORMAT messages, the offsets of the messages of every type and, every
+        checkpoint_every messages, the offset of the message and the latest GPS time logged at or before it (see
+        setTimeWindow), NaN before the first one.
+        """
+        if np is None:
+            raise Exception("The sidecar index requires numpy")
+        self.reset()
+        f = open(fn, "rb")
+        try:
+            self.__readBuffer(f)
+            offsets, types = self.__scanMsgs(init_csv=False)
+            stat = os.fstat(f.fileno())
+            index = {
+                "signature": np.array([self.INDEX_VERSION, stat.st_size, stat.st_mtime, checkpoint_every], dtype=np.float64),
+                "time_fields": np.array([self.__index_time_field, self.__index_week_field or ""]),
+                "formats": np.array(self.__fmt_offsets, dtype=np.int64),
+            }
+            for msg_type in np.unique(types):
+                index["o:%i" % msg_type] = offsets[types == msg_type]
+            checkpoints = np.arange(0, len(offsets), checkpoint_every)
+            index["checkpoint_msgs"] = checkpoints
+            index["checkpoint_offsets"] = offsets[checkpoints]
+            # logs without the time fields get an index without times, a time window is checked when used
+            time_offsets, clock = self.__msgClock(offsets, types, required=False)
+            latest = np.searchsorted(time_offsets, offsets[checkpoints], 'right') - 1
+            index["checkpoint_times"] = np.append(np.nan, clock)[latest + 1]
+        finally:
+            self.__closeMmap()
+            f.close()
+        self.__saveIndex(fn, index)
+        return index
+
+    def __saveIndex(self, fn, index):
+        # imported here as the parser is used without the rest of the package unless it writes an index
+        from ACSObjects.helpers import atomic_write
+        path = self.indexPath(fn)
+        try:
+            with atomic_write(path) as temp_path:
+                with open(temp_path, "wb") as index_file:
+                    np.savez(index_file, **index)
+        except (IOError, OSError) as ex:
+            print("Could not write index %s: %s" % (path, ex), file=sys.stderr)
+
+    def loadIndex(self, fn, checkpoint_every=1000):
+        """Returns the sidecar index of log fn, building it if it is missing or was made from another version of the
+        log, another checkpoint interval or other time fields"""
+        path = self.indexPath(fn)
+        if os.path.isfile(path):
+            stat = os.stat(fn)
+            signature = np.array([self.INDEX_VERSION, stat.st_size, stat.st_mtime, checkpoint_every], dtype=np.float64)
+            try:
+                npz = np.load(path, allow_pickle=False)
+                try:
+                    if (np.array_equal(npz["signature"], signature) and
+                            list(npz["time_fields"]) == [self.__index_time_field, self.__index_week_field or ""]):
+                        return dict((key, npz[key]) for key in npz.files)
+                finally:
+                    npz.close()
+            except (IOError, ValueError, KeyError):
+                pass
+        return self.buildIndex(fn, checkpoint_every)
+
+    def __processIndexed(self, fn):
+        """Decode with the numpy engine, reading only the indexed messages of the shown types that are within the
+        time window. The log is memory mapped so only the pages holding those messages are read."""
+        if np is None:
+            raise Exception("The sidecar index requires numpy")
+        index = self.loadIndex(fn, self.__index_checkpoint_every)
+        self.reset()
+        f = open(fn, "rb")
+        try:
+            self.__openMmap(f)
+            for fmt_offset in index["formats"]:
+                self.__ptr = int(fmt_offset)
+                self.__parseMsgDescr()
+            indexed_types = [msg_type for msg_type in self.__msg_descrs if "o:%i" % msg_type in index]
+            if len(indexed_types) == 0:
+                return
+            self.__initCSV()
+            time_name = self.__index_time_field.split("_", 1)[0]
+            selected = []
+            for msg_type in indexed_types:
+                msg_name = self.__msg_descrs[msg_type][1]
+                if (self.__filterMsg(msg_name) != None or msg_name == self.__time_msg or
+                        (self.__window != None and msg_name == time_name)):
+                    selected.append(msg_type)
+            offsets = np.concatenate([np.zeros(0, dtype=np.int64)] + [index["o:%i" % t] for t in selected])
+            types = np.concatenate([np.zeros(0, dtype=np.uint8)] +
+                                   [np.full(len(index["o:%i" % t]), t, dtype=np.uint8) for t in selected])
+            order = np.argsort(offsets, kind="mergesort")
+            offsets, types = offsets[order], types[order]
+            if self.__window != None:
+                offsets, types = self.__selectWindow(index, offsets, types)
+            cutoffs = self.__rowCutoffs(offsets, types, self.__msgLengths()[types])
+            columns = self.__decodeColumns(offsets, types, cutoffs)
+        finally:
+            self.__closeMmap()
+            f.close()
+        self.__output(columns, len(cutoffs))
+
+    def __selectWindow(self, index, offsets, types):
+        """Keep the messages logged within the time window. GPS time is assumed not to go backwards in the log."""
+        start, end = self.__window
+        checkpoint_times = index["checkpoint_times"]
+        checkpoint_times = np.where(np.isnan(checkpoint_times), -np.inf, checkpoint_times)
+        checkpoint_offsets = index["checkpoint_offsets"]
+        # only the messages from the last checkpoint before start to the first checkpoint after end can be in the
+        # window, so only their time messages are decoded
+        first = np.searchsorted(checkpoint_times, start, 'left') - 1
+        last = np.searchsorted(checkpoint_times, end, 'right')
+        lo = checkpoint_offsets[first] if first >= 0 else 0
+        hi = checkpoint_offsets[last] if last < len(checkpoint_offsets) else len(self.__buffer)
+        in_range = (offsets >= lo) & (offsets < hi)
+        offsets, types = offsets[in_range], types[in_range]
+        time_offsets, clock = self.__msgClock(offsets, types)
+        latest = np.searchsorted(time_offsets, offsets, 'right') - 1
+        msg_clock = np.append(np.nan, clock)[latest + 1]
+        with np.errstate(invalid="ignore"):
+            keep = (msg_clock >= start) & (msg_clock <= end)
+        return offsets[keep], types[keep]
+
+    def __msgClock(self, offsets, types, required=True):
+        """Returns the offsets of the messages holding the index time field and their GPS time in ms. Unless required,
+        messages without the time fields are left out instead of raising an exception."""
+        time_name, time_label = self.__index_time_field.split("_", 1)
+        week_label = None
+        if self.__index_week_field != None:
+            week_name, week_label = self.__index_week_field.split("_", 1)
+            if week_name != time_name:
+                raise Exception("%s and %s must be fields of the same message" % (self.__index_time_field, self.__index_week_field))
+        is_clock = np.zeros(256, dtype=bool)
+        for msg_type, msg_descr in self.__msg_descrs.items():
+            is_clock[msg_type] = msg_descr[1] == time_name and (required or (time_label in msg_descr[3] and
+                                                                            week_label in msg_descr[3] + [None]))
+        clock_types = types[is_clock[types]]
+        time_offsets = offsets[is_clock[types]]
+        clock = np.zeros(len(time_offsets))
+        for msg_type in np.unique(clock_types):
+            of_type = clock_types == msg_type
+            records = self.__decodeRecords(int(msg_type), time_offsets[of_type])
+            clock[of_type] = self.__recordField(records, int(msg_type), time_label)
+            if week_label != None:
+                clock[of_type] += self.__recordField(records, int(msg_type), week_label) * self.MS_PER_WEEK
+        return time_offsets, clock
+
+    def __scanMsgs(self, init_csv=True):
+        """Walk the buffer once, parsing FORMAT messages and recording the offset and type of every data message"""
+        buf = self.__buffer
+        buf_len = len(buf)
+        msg_lengths = [0] * 256
+        offsets = []
+        types = []
+        first_data_msg = True
+        ptr = 0
+        while buf_len - ptr >= self.MSG_HEADER_LEN:
+            head1 = buf[ptr]
+            head2 = buf[ptr+1]
+            if (head1 != self.MSG_HEAD1 or head2 != self.MSG_HEAD2 or
+                    (self.__corrupt_start != None and not self.__isPlausibleMsg(ptr, 0))):
+                if self.__correct_errors:
+                    self.__ptr = ptr
+                    self.__skipCorruption(0)
+                    ptr = self.__ptr
+                    continue
+                else:
+                    raise Exception("Invalid header at %i (0x%X): %02X %02X, must be %02X %02X" % (ptr, ptr, head1, head2, self.MSG_HEAD1, self.MSG_HEAD2))
+            self.__endCorruption(ptr)
+            msg_type = buf[ptr+2]
+            if msg_type == self.MSG_TYPE_FORMAT:
+                # parse FORMAT message
+                if buf_len - ptr < self.MSG_FORMAT_PACKET_LEN:
+                    break
+                self.__ptr = ptr
+                self.__fmt_offsets.append(ptr)
+                self.__parseMsgDescr()
+                msg_descr = self.__msg_descrs.get(buf[ptr+3])
+                if msg_descr != None:
+                    msg_lengths[buf[ptr+3]] = msg_descr[0]
+                ptr = self.__ptr
+            else:
+                msg_length = msg_lengths[msg_type]
+                if msg_length == 0:
+                    if self.__correct_errors:
+                        self.__ptr = ptr
+                        self.__skipCorruption(0)
+                        ptr = self.__ptr
+                        continue
+                    raise Exception("Unknown msg type: %i" % msg_type)
+                if buf_len - ptr < msg_length:
+                    break
+                if first_data_msg and init_csv:
+                    # build CSV columns and init data map
+                    self.__initCSV()
+                    first_data_msg = False
+                offsets.append(ptr)
+                types.append(msg_type)
+                ptr += msg_length
+        self.__ptr = ptr
+        self.__endCorruption(ptr)
+        return np.array(offsets, dtype=np.int64), np.array(types, dtype=np.uint8)
+
+    def __rowCutoffs(self, offsets, types, lengths):
+        """Returns the byte offsets at which the struct engine would print a CSV row.
+
+        A row printed at cutoff c holds the latest values of all messages starting before c.
+        """
+        is_shown = np.zeros(256, dtype=bool)
+        is_update = np.zeros(256, dtype=bool)
+        is_time = np.zeros(256, dtype=bool)
+        for msg_type, msg_descr in self.__msg_descrs.items():
+            msg_name = msg_descr[1]
+            show_fields = self.__filterMsg(msg_name)
+            if show_fields != None:
+                is_shown[msg_type] = True
+                is_update[msg_type] = msg_name != self.__time_msg and any(label in show_fields for label in msg_descr[3])
+            is_time[msg_type] = msg_name == self.__time_msg
+        if self.__time_msg == None:
+            # a row follows every shown message
+            return offsets[is_shown[types]] + 1
+        time_offsets = offsets[is_time[types]]
+        update_offsets = offsets[is_update[types]]
+        # a row is printed when a TIME message arrives and data was updated since the previous TIME message
+        prev_time = np.concatenate(([-1], time_offsets[:-1]))
+        time_rows = time_offsets[self.__updatedBetween(update_offsets, prev_time, time_offsets)]
+        # the struct engine also prints a row after every block it reads while data is updated
+        buf_len = len(self.__buffer)
+        limits = np.minimum(np.arange(1, (buf_len + self.BLOCK_SIZE - 1) // self.BLOCK_SIZE + 1) * self.BLOCK_SIZE, buf_len)
+        block_rows = np.append(offsets, buf_len)[np.searchsorted(offsets + lengths, limits, 'right')]
+        prev_time = np.append(-1, time_offsets)[np.searchsorted(time_offsets, block_rows, 'left')]
+        block_rows = block_rows[self.__updatedBetween(update_offsets, prev_time, block_rows)]
+        # block rows come first when both are printed at the same offset
+        cutoffs = np.concatenate((block_rows, time_rows))
+        order = np.lexsort((np.concatenate((np.zeros(len(block_rows)), np.ones(len(time_rows)))), cutoffs))
+        return cutoffs[order]
+
+    @staticmethod
+    def __updatedBetween(update_offsets, lo, hi):
+        return np.searchsorted(update_offsets, hi, 'left') - np.searchsorted(update_offsets, lo, 'right') > 0
+
+    def __msgDtype(self, msg_struct):
+        """Convert a struct.unpack format string to the equivalent packed numpy structured dtype"""
+        fields = []
+        for count, c in re.findall(r"(\d*)([a-zA-Z])", msg_struct):
+            if c == "s":
+                fields.append(("f%i" % len(fields), "S" + count))
+            else:
+                fields.append(("f%i" % len(fields), "<" + c))
+        return np.dtype(fields)
+
+    def __decodeColumns(self, offsets, types, cutoffs):
+        """Decode all shown fields, one np.frombuffer call per message type.
+
+        Returns a map from CSV column to (values, row_index) where values[row_index[r]] is the column value in
+        row r, or None if row_index[r] is negative.
+        """
+        sources = {}
+        for msg_type in np.unique(types):
+            msg_length, msg_name, msg_format, msg_labels, msg_struct, msg_mults = self.__msg_descrs[int(msg_type)]
+            show_fields = self.__filterMsg(msg_name)
+            if show_fields == None:
+                continue
+            shown = [(i, label) for i, label in enumerate(msg_labels) if label in show_fields]
+            if len(shown) == 0:
+                continue
+            msg_offsets = offsets[types == msg_type]
+            records = self.__decodeRecords(int(msg_type), msg_offsets)
+            row_index = np.searchsorted(msg_offsets, cutoffs, 'left') - 1
+            for i, label in shown:
+                values = self.__fieldValues(records["f%i" % i], msg_mults[i])
+                sources.setdefault(msg_name + "_" + label, []).append((msg_offsets, values, row_index))
+        columns = {}
+        for full_label, column_sources in sources.items():
+            if len(column_sources) == 1:
+                values, row_index = column_sources[0][1:]
+            else:
+                # several message types share a name, take the latest value of any of them
+                msg_offsets = np.concatenate([src[0] for src in column_sources])
+                order = np.argsort(msg_offsets, kind="mergesort")
+                values = np.concatenate([src[1] for src in column_sources])[order]
+                row_index = np.searchsorted(msg_offsets[order], cutoffs, 'left') - 1
+            columns[full_label] = (values, row_index)
+        return columns
+
+    def __decodeRecords(self, msg_type, msg_offsets):
+        """Decode the messages of msg_type at msg_offsets into a numpy record array with fields f0, f1, ..."""
+        msg_length, msg_name, msg_format, msg_labels, msg_struct, msg_mults = self.__msg_descrs[msg_type]
+        dtype = self.__msgDtype(msg_struct)
+        body_len = msg_length - self.MSG_HEADER_LEN
+        if dtype.itemsize != body_len:
+            raise Exception("Format %s of message %s does not match its length %i" % (msg_format, msg_name, msg_length))
+        data = np.frombuffer(self.__buffer, dtype=np.uint8)
+        # one (messages x body_len) byte matrix per type, viewed as records
+        bodies = np.lib.stride_tricks.as_strided(data, shape=(len(data) - body_len + 1, body_len), strides=(1, 1))
+        records = np.frombuffer(bodies[msg_offsets + self.MSG_HEADER_LEN], dtype=dtype)
+        self.__bytes_copied += records.nbytes
+        return records
+
+    @staticmethod
+    def __fieldValues(values, mult):
+        """Convert a record field to the values the struct engine would output"""
+        if values.dtype.kind == "S":
+            return _parseCStringArray(values)
+        if mult != None:
+            return values.astype(np.float64) * mult
+        if values.dtype.kind == "f":
+            return values.astype(np.float64)
+        return values
+
+    def __recordField(self, records, msg_type, label):
+        """Values of the field label of decoded records as float64"""
+        msg_labels, msg_mults = self.__msg_descrs[msg_type][3], self.__msg_descrs[msg_type][5]
+        if label not in msg_labels:
+            raise Exception("Message %s has no field %s" % (self.__msg_descrs[msg_type][1], label))
+        i = msg_labels.index(label)
+        return self.__fieldValues(records["f%i" % i], msg_mults[i]).astype(np.float64)
+
+    def __bufferRows(self):
+        """Rows are kept in memory instead of printed when returning columns or resampling"""
+        return not self.__debug_out and (self.__collect or self.__resample_rate != None)
+
+    def __rowsToColumns(self):
+        """Convert the buffered struct engine rows to the (values, row_index) columns of the numpy engine"""
+        columns = {}
+        n_rows = len(self.__rows)
+        for full_label, values in zip(self.__csv_columns, zip(*self.__rows)):
+            column = np.empty(n_rows, dtype=object)
+            column[:] = values
+            row_index = np.arange(n_rows)
+            row_index[np.array([v is None for v in values], dtype=bool)] = -1
+            columns[full_label] = (column, row_index)
+        return columns
+
+    def __output(self, columns, n_rows):
+        """Resample the decoded columns if requested, then print them as CSV or keep them for processColumns"""
+        if self.__resample_rate != None:
+            columns, n_rows = self.__resampleColumns(columns, n_rows)
+        if self.__collect:
+            for full_label in self.__csv_columns:
+                self.__columns[full_label] = self.__columnArray(columns.get(full_label), n_rows)
+        else:
+            self.__printCSVColumns(columns, n_rows)
+
+    def __rowTimes(self, column, n_rows):
+        """Value of a numeric column in every row as float64, NaN where the cell is empty"""
+        times = np.full(n_rows, np.nan)
+        if column != None and len(column[0]) > 0:
+            values, row_index = column
+            present = row_index >= 0
+            times[present] = values[row_index[present]].astype(np.float64)
+        return times
+
+    def __resampleColumns(self, columns, n_rows):
+        """Forward-fill every column onto a grid of __resample_rate rows per second of GPS time.
+
+        Rows without GPS time are dropped. Grid times are multiples of the sample period since the GPS epoch, so
+        logs resampled at the same rate share grid times. The time and week columns hold the grid time.
+        """
+        if self.__resample_time_field not in self.__csv_columns:
+            raise Exception("Cannot resample without the %s column" % self.__resample_time_field)
+        has_week = self.__resample_week_field != None and self.__resample_week_field in self.__csv_columns
+        clock = self.__rowTimes(columns.get(self.__resample_time_field), n_rows)
+        if has_week:
+            clock += self.__rowTimes(columns.get(self.__resample_week_field), n_rows) * self.MS_PER_WEEK
+        rows = np.flatnonzero(np.isfinite(clock))
+        rows = rows[np.argsort(clock[rows], kind="mergesort")]
+        clock = clock[rows]
+        period = 1000.0 / self.__resample_rate
+        if len(rows) > 0:
+            grid = np.arange(np.ceil(clock[0] / period), np.floor(clock[-1] / period) + 1) * period
+        else:
+            grid = np.zeros(0)
+        # latest row at or before each grid time
+        selected = rows[np.searchsorted(clock, grid, 'right') - 1]
+        resampled = {}
+        for full_label, (values, row_index) in columns.items():
+            resampled[full_label] = (values, row_index[selected])
+        grid_rows = np.arange(len(grid))
+        if has_week:
+            week = np.floor(grid / self.MS_PER_WEEK)
+            grid = grid - week * self.MS_PER_WEEK
+            resampled[self.__resample_week_field] = (week.astype(np.int64), grid_rows)
+        if np.all(grid == np.round(grid)):
+            grid = grid.astype(np.int64)
+        resampled[self.__resample_time_field] = (grid, grid_rows)
+        return resampled, len(grid)
+
+    @staticmethod
+    def __columnArray(column, n_rows):
+        """Expand a decoded (values, row_index) column to one value per row, NaN where the CSV cell would be empty"""
+        if column == None or len(column[0]) == 0:
+            return np.full(n_rows, np.nan)
+        values, row_index = column
+        missing = row_index < 0
+        values = values[np.maximum(row_index, 0)]
+        if values.dtype.kind == "O":
+            # buffered struct engine rows hold Python values
+            return _columnArray([None if m else v for v, m in zip(values.tolist(), missing.tolist())])
+        if values.dtype.kind in "SU":
+            values = values.astype(object)
+        elif values.dtype.kind in "iu" and values.dtype != np.uint64:
+            values = values.astype(np.int64)
+        if missing.any():
+            if values.dtype.kind != "O":
+                values = values.astype(np.float64)
+            values[missing] = np.nan
+        return values
+
+    def __printCSVColumns(self, columns, n_rows):
+        cells = []
+        for full_label in self.__csv_columns:
+            if full_label not in columns or len(columns[full_label][0]) == 0:
+                cells.append([self.__csv_null] * n_rows)
+                continue
+            values, row_index = columns[full_label]
+            values = values[np.maximum(row_index, 0)].tolist()
+            cells.append([str(v) if i >= 0 else self.__csv_null for v, i in zip(values, row_index.tolist())])
+        for s in zip(*cells):
+            self.__printLine(self.__csv_delim.join(s))
+
     def __bytesLeft(self):
-        return len(self.__buffer) - self.__ptr
+        return self.__buffer_end - self.__ptr
     
     def __filterMsg(self, msg_name):
         show_fields = "*"
@@ -180,12 +1123,13 @@ class SDLog2Parser:
                 full_label = msg_name + "_" + field
                 self.__csv_columns.append(full_label)
                 self.__csv_data[full_label] = None
-        if self.__file != None:
-            print(self.__csv_delim.join(self.__csv_columns), file=self.__file)
-        else:
-            print(self.__csv_delim.join(self.__csv_columns))
+        if not self.__collect:
+            self.__printLine(self.__csv_delim.join(self.__csv_columns))
 
     def __printCSVRow(self):
+        if self.__bufferRows():
+            self.__rows.append([self.__csv_data[full_label] for full_label in self.__csv_columns])
+            return
         s = []
         for full_label in self.__csv_columns:
             v = self.__csv_data[full_label]
@@ -194,17 +1138,16 @@ class SDLog2Parser:
             else:
                 v = str(v)
             s.append(v)
+        self.__printLine(self.__csv_delim.join(s))
 
+    def __printLine(self, line):
         if self.__file != None:
-            print(self.__csv_delim.join(s), file=self.__file)
+            print(line, file=self.__file)
         else:
-            print(self.__csv_delim.join(s))
+            print(line)
 
     def __parseMsgDescr(self):
-        if runningPython3:
-            data = struct.unpack(self.MSG_FORMAT_STRUCT, self.__buffer[self.__ptr + 3 : self.__ptr + self.MSG_FORMAT_PACKET_LEN])
-        else:
-            data = struct.unpack(self.MSG_FORMAT_STRUCT, str(self.__buffer[self.__ptr + 3 : self.__ptr + self.MSG_FORMAT_PACKET_LEN]))
+        data = struct.unpack_from(self.MSG_FORMAT_STRUCT, self.__buffer, self.__ptr + 3)
         msg_type = data[0]
         if msg_type != self.MSG_TYPE_FORMAT:
             msg_length = data[1]
@@ -223,6 +1166,8 @@ class SDLog2Parser:
                     raise Exception("Unsupported format char: %s in message %s (%i)" % (c, msg_name, msg_type))
             msg_struct = "<" + msg_struct   # force little-endian
             self.__msg_descrs[msg_type] = (msg_length, msg_name, msg_format, msg_labels, msg_struct, msg_mults)
+            self.__msg_structs[msg_type] = struct.Struct(msg_struct)
+            self.__msg_plans[msg_type] = None
             self.__msg_labels[msg_name] = msg_labels
             self.__msg_names.append(msg_name)
             if self.__debug_out:
@@ -231,6 +1176,65 @@ class SDLog2Parser:
                                 msg_type, msg_length, msg_name, msg_format, str(msg_labels), msg_struct, msg_mults))
         self.__ptr += self.MSG_FORMAT_PACKET_LEN
     
+    def __msgPlan(self, msg_type):
+        """Precompute how messages of msg_type update the CSV data, once the message filter is known.
+
+        The plan is (msg_length, struct or None if no field is shown, is the time message, [(field index, CSV column,
+        multiplier, is a string)] of the shown fields, sets __csv_updated, prints a row, message name or None). Types
+        that are neither shown nor the time message are skipped by length.
+
+        While iterMessages collects messages in __msg_sink, the plan of a type named in __sink_names has every field,
+        keyed by label, and its message name, so __parseMsgPlan hands the values to the sink instead of the CSV data.
+        The other types are skipped by length.
+        """
+        msg_length, msg_name, msg_format, msg_labels, msg_struct, msg_mults = self.__msg_descrs[msg_type]
+        if self.__msg_sink != None:
+            if msg_name not in self.__sink_names:
+                return (msg_length, None, False, [], False, False, None)
+            fields = [(i, label, msg_mults[i], self.FORMAT_TO_STRUCT[c][0].endswith("s"))
+                      for i, (label, c) in enumerate(zip(msg_labels, msg_format))]
+            return (msg_length, self.__msg_structs[msg_type], False, fields, False, False, msg_name)
+        show_fields = self.__filterMsg(msg_name)
+        is_time = self.__time_msg != None and msg_name == self.__time_msg
+        fields = []
+        if show_fields != None:
+            is_string = [self.FORMAT_TO_STRUCT[c][0].endswith("s") for c in msg_format]
+            for i, label in enumerate(msg_labels):
+                if label in show_fields:
+                    fields.append((i, msg_name + "_" + label, msg_mults[i], is_string[i]))
+        msg_struct = self.__msg_structs[msg_type] if len(fields) > 0 else None
+        updates = self.__time_msg != None and not is_time and len(fields) > 0
+        prints_row = self.__time_msg == None and show_fields != None
+        if msg_struct == None and prints_row:
+            # a shown message without shown fields still prints a row
+            msg_struct = self.__msg_structs[msg_type]
+        return (msg_length, msg_struct, is_time, fields, updates, prints_row, None)
+
+    def __parseMsgPlan(self, msg_plan):
+        """Update the CSV data from the message at the read pointer as __parseMsg does, following its precomputed plan,
+        or hand its values to __msg_sink"""
+        msg_length, msg_struct, is_time, fields, updates, prints_row, sink_name = msg_plan
+        if is_time and self.__csv_updated:
+            self.__printCSVRow()
+            self.__csv_updated = False
+        if msg_struct != None:
+            data = msg_struct.unpack_from(self.__buffer, self.__ptr + self.MSG_HEADER_LEN)
+            csv_data = self.__csv_data if sink_name == None else OrderedDict()
+            for i, full_label, mult, is_string in fields:
+                if is_string:
+                    csv_data[full_label] = _parseCString(data[i])
+                elif mult != None:
+                    csv_data[full_label] = data[i] * mult
+                else:
+                    csv_data[full_label] = data[i]
+            if sink_name != None:
+                self.__msg_sink.append((sink_name, csv_data))
+            if updates:
+                self.__csv_updated = True
+            if prints_row:
+                self.__printCSVRow()
+        self.__ptr += msg_length
+
     def __parseMsg(self, msg_descr):
         msg_length, msg_name, msg_format, msg_labels, msg_struct, msg_mults = msg_descr
         if not self.__debug_out and self.__time_msg != None and msg_name == self.__time_msg and self.__csv_updated:
@@ -238,12 +1242,9 @@ class SDLog2Parser:
             self.__csv_updated = False
         show_fields = self.__filterMsg(msg_name)
         if (show_fields != None):
-            if runningPython3:
-                data = list(struct.unpack(msg_struct, self.__buffer[self.__ptr+self.MSG_HEADER_LEN:self.__ptr+msg_length]))
-            else:
-                data = list(struct.unpack(msg_struct, str(self.__buffer[self.__ptr+self.MSG_HEADER_LEN:self.__ptr+msg_length])))
+            data = list(struct.unpack_from(msg_struct, self.__buffer, self.__ptr+self.MSG_HEADER_LEN))
             for i in range(len(data)):
-                if type(data[i]) is str:
+                if isinstance(data[i], bytes):
                     data[i] = _parseCString(data[i])
                 m = msg_mults[i]
                 if m != None:
@@ -277,6 +1278,10 @@ def _main():
         print("\t-m MSG[.field1,field2,...]\n\t\tDump only messages of specified type, and only specified fields.\n\t\tMultiple -m options allowed.")
         print("\t-t\tSpecify TIME message name to group data messages by time and significantly reduce duplicate output.\n")
         print("\t-fPrint to file instead of stdout")
+        print("\t-x\tDecode with \"struct\" (default) or \"numpy\" engine.\n")
+        print("\t-r\tResample rows to \"rate\" Hz of GPS time.\n")
+        print("\t-i\tDecode through the sidecar index of the log.\n")
+        print("\t-w start,end\n\t\tDecode only messages between \"start\" and \"end\" ms of GPS time.\n")
         return
     fn = sys.argv[1]
     debug_out = False
@@ -286,6 +1291,10 @@ def _main():
     csv_delim = ","
     time_msg = "TIME"
     file_name = None
+    engine = SDLog2Parser.ENGINE_STRUCT
+    resample_rate = None
+    use_index = False
+    window = (None, None)
     opt = None
     for arg in sys.argv[2:]:
         if opt != None:
@@ -297,6 +1306,12 @@ def _main():
                 time_msg = arg
             elif opt == "f":
             	file_name = arg
+            elif opt == "x":
+                engine = arg
+            elif opt == "r":
+                resample_rate = float(arg)
+            elif opt == "w":
+                window = tuple(float(t) if t != "" else None for t in arg.split(","))
             elif opt == "m":
                 show_fields = "*"
                 a = arg.split("_")
@@ -319,6 +1334,14 @@ def _main():
                 opt = "t"
             elif arg == "-f":
                 opt = "f"
+            elif arg == "-x":
+                opt = "x"
+            elif arg == "-r":
+                opt = "r"
+            elif arg == "-i":
+                use_index = True
+            elif arg == "-w":
+                opt = "w"
 
     if csv_delim == "\\t":
         csv_delim = "\t"
@@ -330,6 +1353,10 @@ def _main():
     parser.setFileName(file_name)
     parser.setDebugOut(debug_out)
     parser.setCorrectErrors(correct_errors)
+    parser.setEngine(engine)
+    parser.setResampleRate(resample_rate)
+    parser.setUseIndex(use_index)
+    parser.setTimeWindow(window[0], window[1])
     parser.process(fn)
 '''
 if __name__ == "__main__":
@@ -0,0 +1,140 @@
+"""Flight data shared with worker processes through memory-mapped files, instead of being pickled to each of them.
+
+publish writes the columns of a Dataframe once into a folder of .npy files, on the RAM backed /dev/shm where there is
+one. It returns a SharedFrame, a small handle naming the folder that pickles in a few bytes. A worker process attaches
+to it and gets numpy views (SharedFrame.column) or a Dataframe (SharedFrame.frame) over the memory mapped files, with
+no copy of the data: the operating system shares the pages between all the processes. Writes made by a worker stay
+private to it (copy on write). Text columns cannot be mapped and are pickled in the folder instead.
+
+The columns of each dtype are stored as one 2D block, which pandas wraps without copying it. The columns of the
+Dataframe are therefore grouped by dtype, in the published order within each dtype (SharedFrame.columns gives the
+published order; selecting the columns in that order makes a copy). SharedFrame.release deletes the folder once the
+workers are done; it is only deleted by the process that published it.
+"""
+import json
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+SHARED_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+"""Folder in which the data is published, None for the default temporary folder"""
+
+_MANIFEST = 'manifest.json'
+
+
+def _dtype_groups(frame):
+    """Returns the dtypes of the columns of frame, in order of first use, and the positions of the columns of each"""
+    groups = OrderedDict()
+    for position, dtype in enumerate(frame.dtypes):
+        groups.setdefault(dtype, []).append(position)
+    return groups.items()
+
+
+def publish(frame, directory=None, prefix='flight_data-'):
+    """Writes the columns and Timestamp index of the Dataframe frame to a new folder in directory (SHARED_DIR by
+    default) and returns its SharedFrame handle"""
+    path = tempfile.mkdtemp(prefix=prefix, dir=directory or SHARED_DIR)
+    try:
+        blocks = []
+        for dtype, positions in _dtype_groups(frame):
+            columns = frame.iloc[:, positions]
+            mapped = dtype.kind in 'biufcmM'
+            file_name = 'block%d.%s' % (len(blocks), 'npy' if mapped else 'pkl')
+            if mapped:
+                # stored transposed, so each column is contiguous like in a pandas block
+                np.save(os.path.join(path, file_name), np.ascontiguousarray(columns.values.T))
+            else:
+                pd.to_pickle(columns.reset_index(drop=True), os.path.join(path, file_name))
+            blocks.append({'file': file_name, 'columns': [str(name) for name in columns.columns], 'mapped': mapped})
+        np.save(os.path.join(path, 'index.npy'),
+                np.asarray(frame.index.values, dtype='datetime64[ns]').view(np.int64))
+        with open(os.path.join(path, _MANIFEST), 'w') as manifest_file:
+            json.dump({'rows': len(frame), 'columns': [str(name) for name in frame.columns], 'blocks': blocks},
+                      manifest_file)
+    except Exception:
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+    return SharedFrame(path, os.getpid())
+
+
+class SharedFrame(object):
+    """Handle of a Dataframe published with publish. Only the folder name is pickled, so sending a SharedFrame to a
+    worker process costs a few bytes whatever the size of the data."""
+
+    def __init__(self, path, owner=None):
+        self.path = path
+        '''Folder holding the published data'''
+        self.owner = owner
+        '''Process ID of the process that published the data, the only one that deletes it'''
+        self._manifest = None
+
+    def __getstate__(self):
+        return {'path': self.path, 'owner': self.owner}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['owner'])
+
+    def __repr__(self):
+        return 'SharedFrame(%r)' % self.path
+
+    @property
+    def manifest(self):
+        if self._manifest is None:
+            with open(os.path.join(self.path, _MANIFEST), 'r') as manifest_file:
+                self._manifest = json.load(manifest_file)
+        return self._manifest
+
+    def exists(self):
+        """True while the published data has not been released"""
+        return os.path.isfile(os.path.join(self.path, _MANIFEST))
+
+    def _load(self, file_name):
+        if file_name.endswith('.pkl'):
+            return pd.read_pickle(os.path.join(self.path, file_name))
+        return np.load(os.path.join(self.path, file_name), mmap_mode='c')
+
+    def columns(self):
+        """Returns the names of the published columns, in the published order"""
+        return [str(name) for name in self.manifest['columns']]
+
+    def column(self, name):
+        """Returns the values of the column name as a numpy array view of the mapped file (a copy for text columns)"""
+        for block in self.manifest['blocks']:
+            if name in block['columns']:
+                values = self._load(block['file'])
+                position = block['columns'].index(name)
+                if block['mapped']:
+                    return values[position]
+                return values.iloc[:, position].values
+        raise KeyError(name)
+
+    def index(self):
+        """Returns the Timestamp index of the published Dataframe"""
+        return pd.DatetimeIndex(self._load('index.npy').view('datetime64[ns]'))
+
+    def frame(self):
+        """Returns the published Dataframe, with the columns of the mapped files wrapped without copying them. The
+        columns are grouped by dtype."""
+        index = self.index()
+        parts = []
+        for block in self.manifest['blocks']:
+            if block['mapped']:
+                parts.append(pd.DataFrame(self._load(block['file']).T, columns=[str(name) for name in block['columns']],
+                                          copy=False))
+            else:
+                parts.append(self._load(block['file']))
+        if len(parts) == 0:
+            return pd.DataFrame(index=index)
+        frame = pd.concat(parts, axis=1, copy=False) if len(parts) > 1 else parts[0]
+        frame.index = index
+        return frame
+
+    def release(self):
+        """Deletes the published data if this process published it. Processes that already attached to it keep their
+        views."""
+        if self.owner == os.getpid():
+            shutil.rmtree(self.path, ignore_errors=True)
+        self._manifest = None
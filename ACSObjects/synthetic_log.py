@@ -0,0 +1,162 @@
+"""Synthetic APM dataflash (.BIN) logs for benchmarking and fuzzing the log parser without real flight logs.
+
+write_log writes a valid log of one UAV flight: FORMAT messages built from SDLog2Parser.FORMAT_TO_STRUCT, parameters,
+then GPS, IMU, BARO, CTUN, NTUN, ARSP, CURR streams at typical ArduPlane rates with MODE, CMD and MSG events, over a
+preflight, launch, climbout, loiter, landing and postflight profile. Corrupted byte regions can be injected to test
+error recovery.
+
+Usage: python -m ACSObjects.synthetic_log <log.BIN> [duration in seconds] [corrupt regions]
+"""
+import math
+import random
+import struct
+import sys
+from ACSObjects.sdlog2_dump import SDLog2Parser
+
+MESSAGE_FORMATS = [
+    # (type, name, format, labels, rate in Hz), rate None for messages only written on events
+    (129, 'PARM', 'Nf', 'Name,Value', None),
+    (130, 'GPS', 'BIHBcLLeeEefI', 'Status,TimeMS,Week,NSats,HDop,Lat,Lng,RelAlt,Alt,Spd,GCrs,VZ,T', 5),
+    (131, 'IMU', 'Iffffff', 'TimeMS,GyrX,GyrY,GyrZ,AccX,AccY,AccZ', 50),
+    (132, 'BARO', 'Iffcf', 'TimeMS,Alt,Press,Temp,CRt', 10),
+    (133, 'CTUN', 'Icccchhf', 'TimeMS,NavRoll,Roll,NavPitch,Pitch,ThrOut,RdrOut,AccY', 10),
+    (134, 'NTUN', 'ICfccccfI', 'TimeMS,Yaw,WpDist,TargBrg,NavBrg,AltErr,Arspd,Alt,GSpdCM', 10),
+    (135, 'ARSP', 'Iffcff', 'TimeMS,Airspeed,DiffPress,Temp,RawPress,Offset', 10),
+    (136, 'CURR', 'IhhhHfh', 'TimeMS,Throttle,Volt,Curr,Vcc,CurrTot,Volt2', 10),
+    (137, 'MODE', 'MB', 'Mode,ModeNum', None),
+    (138, 'CMD', 'IHHHfffffff', 'TimeMS,CTot,CNum,CId,Prm1,Prm2,Prm3,Prm4,Lat,Lng,Alt', None),
+    (139, 'MSG', 'Z', 'Message', None),
+]
+
+GPS_EPOCH_UNIX = 315964800  # 1980-01-06 in Unix time
+MS_PER_WEEK = SDLog2Parser.MS_PER_WEEK
+HOME_LAT = 35.7195358
+HOME_LNG = -120.7716904
+HOME_ALT = 240.0
+MODE_MANUAL, MODE_AUTO = 0, 10
+CID_WAYPOINT, CID_LAND = 16, 21
+
+
+class _LogWriter(object):
+    """Packs messages of the MESSAGE_FORMATS types"""
+
+    def __init__(self):
+        self.structs = {}
+        self.types = {}
+        self.data = bytearray()
+        self.msg_count = 0
+        for msg_type, name, msg_format, labels, rate in MESSAGE_FORMATS:
+            msg_struct = '<' + ''.join(SDLog2Parser.FORMAT_TO_STRUCT[c][0] for c in msg_format)
+            self.structs[name] = struct.Struct(msg_struct)
+            self.types[name] = msg_type
+            length = SDLog2Parser.MSG_HEADER_LEN + self.structs[name].size
+            self.data += struct.pack('<BBB' + SDLog2Parser.MSG_FORMAT_STRUCT, SDLog2Parser.MSG_HEAD1,
+                                     SDLog2Parser.MSG_HEAD2, SDLog2Parser.MSG_TYPE_FORMAT, msg_type, length,
+                                     name.encode('ascii'), msg_format.encode('ascii'), labels.encode('ascii'))
+
+    def write(self, name, *values):
+        self.data += struct.pack('<BBB', SDLog2Parser.MSG_HEAD1, SDLog2Parser.MSG_HEAD2, self.types[name])
+        self.data += self.structs[name].pack(*values)
+        self.msg_count += 1
+
+
+def _flight_state(t, duration):
+    """Returns (phase, altitude above home in m, ground speed in m/s, course in degrees, north and east of home in m)
+    t seconds into a flight of duration seconds"""
+    preflight = min(60.0, duration * 0.1)
+    postflight = min(60.0, duration * 0.1)
+    landing = min(120.0, duration * 0.15)
+    airborne = duration - preflight - postflight
+    climb = min(90.0, airborne * 0.2)
+    if t < preflight or airborne <= 0:
+        return 'preflight', 0.0, 0.0, 0.0, 0.0, 0.0
+    t_air = t - preflight
+    if t_air >= airborne:
+        return 'postflight', 0.0, 0.0, 0.0, -30.0, 0.0
+    if t_air < climb:
+        alt = 150.0 * t_air / climb
+        return 'climbout', alt, min(22.0, 4.0 + t_air * 2.0), 0.0, 20.0 * t_air, 0.0
+    if t_air > airborne - landing:
+        remaining = airborne - t_air
+        alt = 150.0 * remaining / landing
+        return 'landing', alt, 12.0 + 8.0 * remaining / landing, 180.0, 10.0 * remaining, 0.0
+    # loiter on a 400 m circle
+    angle = (t_air - climb) * 22.0 / 400.0
+    north = 20.0 * climb + 400.0 * math.sin(angle)
+    east = 400.0 * (1 - math.cos(angle))
+    return 'loiter', 150.0, 22.0, math.degrees(angle) % 360.0, north, east
+
+
+def make_log(duration=600.0, uav_number=1, start_time=1436800000.0, corrupt_regions=0, seed=None):
+    """Returns the bytes of a synthetic log of a flight lasting duration seconds, and the number of data messages.
+
+    start_time is the Unix time of the first message. corrupt_regions random byte regions (16 to 4096 bytes, some
+    holding fake sync pairs) are inserted between messages.
+    """
+    rng = random.Random(seed)
+    log = _LogWriter()
+    log.write('PARM', b'SYSID_THISMAV', float(uav_number))
+    log.write('PARM', b'ARSPD_FBW_MIN', 12.0)
+    log.write('PARM', b'TRIM_ARSPD_CM', 2200.0)
+    log.write('MSG', b'ArduPlane V3.3.0')
+    gps_ms = int(round((start_time - GPS_EPOCH_UNIX) * 1000))
+    boot_ms = 1000
+    period_ms = dict((name, 1000 // rate) for msg_type, name, msg_format, labels, rate in MESSAGE_FORMATS if rate)
+    corrupt_at = set(rng.randrange(int(duration * 1000)) // 20 * 20 for i in range(corrupt_regions))
+    phase = None
+    cnum = 0
+    m_per_lat = 111320.0
+    m_per_lng = 111320.0 * math.cos(math.radians(HOME_LAT))
+    for ms in range(0, int(duration * 1000), 20):
+        t = ms / 1000.0
+        new_phase, alt, spd, course, north, east = _flight_state(t, duration)
+        if new_phase != phase:
+            mode = {'preflight': MODE_MANUAL, 'postflight': MODE_MANUAL, 'landing': MODE_AUTO}.get(new_phase, MODE_AUTO)
+            log.write('MODE', mode, mode)
+            if new_phase in ('climbout', 'loiter', 'landing'):
+                cnum += 1
+                log.write('CMD', boot_ms + ms, 8, cnum, CID_LAND if new_phase == 'landing' else CID_WAYPOINT,
+                          0.0, 0.0, 0.0, 0.0, HOME_LAT, HOME_LNG, 150.0)
+            log.write('MSG', ('Phase %s' % new_phase).encode('ascii'))
+            phase = new_phase
+        time_ms = boot_ms + ms
+        airborne = phase not in ('preflight', 'postflight')
+        if ms % period_ms['IMU'] == 0:
+            noise = 2.0 if airborne else 0.05
+            log.write('IMU', time_ms, rng.gauss(0, 0.05), rng.gauss(0, 0.05), rng.gauss(0, 0.02),
+                      rng.gauss(0, noise), rng.gauss(0, noise), -9.81 + rng.gauss(0, noise))
+        if ms % period_ms['GPS'] == 0:
+            now = gps_ms + ms
+            lat = HOME_LAT + north / m_per_lat
+            lng = HOME_LNG + east / m_per_lng
+            log.write('GPS', 3, now % MS_PER_WEEK, now // MS_PER_WEEK, 10 + rng.randrange(3), 90 + rng.randrange(30),
+                      int(round(lat * 1e7)), int(round(lng * 1e7)), int(alt * 100), int((HOME_ALT + alt) * 100),
+                      int(spd * 100), int(course * 100), 0.0, now // 1000)
+        if ms % period_ms['BARO'] == 0:
+            log.write('BARO', time_ms, alt + rng.gauss(0, 0.3), 101325.0 - 12.0 * (HOME_ALT + alt), 2500, 0.0)
+            log.write('CTUN', time_ms, 0, 0, 0, 0, 60 if airborne else 0, 0, 0.0)
+            log.write('NTUN', time_ms, int(course * 100), 100.0, 0, 0, 0, int(spd * 100), alt, int(spd * 100))
+            log.write('ARSP', time_ms, spd + rng.gauss(0, 0.5), 10.0, 2500, 101325.0, 0.0)
+            log.write('CURR', time_ms, 60 if airborne else 0, 1500, 1500 if airborne else 100, 5000, t * 4.0, 0)
+        if ms in corrupt_at:
+            junk = bytearray(rng.randrange(256) for i in range(rng.randrange(16, 4096)))
+            for k in range(0, len(junk) - 3, 251):
+                junk[k:k+3] = bytearray([SDLog2Parser.MSG_HEAD1, SDLog2Parser.MSG_HEAD2, rng.randrange(256)])
+            log.data += junk
+    return bytes(log.data), log.msg_count
+
+
+def write_log(path, duration=600.0, uav_number=1, start_time=1436800000.0, corrupt_regions=0, seed=None):
+    """Writes a synthetic log to path, see make_log. Returns the number of data messages written."""
+    data, msg_count = make_log(duration, uav_number, start_time, corrupt_regions, seed)
+    with open(path, 'wb') as log_file:
+        log_file.write(data)
+    return msg_count
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+    else:
+        write_log(sys.argv[1], float(sys.argv[2]) if len(sys.argv) > 2 else 600.0,
+                  corrupt_regions=int(sys.argv[3]) if len(sys.argv) > 3 else 0)
@@ -0,0 +1,134 @@
+"""Flight data of all the Sorties of a Mission on one common time grid, as dense numpy arrays.
+
+Each Sortie logs at its own times. TimeGrid takes the sample of each Sortie nearest to every time of a grid at a fixed
+rate (5 Hz by default, the rate of the .csv files), so the data of all the Sorties is one (sortie x time x field) array
+and metrics over the whole swarm are numpy reductions over its axes instead of loops over the Sorties. The grid times
+are multiples of the grid period, so grids of different Missions line up.
+
+A value is valid where the Sortie has a sample within the tolerance (one grid period by default) of the grid time and
+the sample is not NaN. Invalid values are NaN, and TimeGrid.valid marks the valid ones.
+"""
+import numbers
+import numpy as np
+import pandas as pd
+
+
+def _nearest_rows(sample_times, grid_times, tolerance):
+    """Returns the row of the sample of sample_times (sorted, int64 ns) nearest to each time of grid_times (int64 ns),
+    and whether it is within tolerance ns of it"""
+    n_samples = len(sample_times)
+    right = np.searchsorted(sample_times, grid_times, side='left')
+    left = right - 1
+    right_rows = np.minimum(right, n_samples - 1)
+    left_rows = np.maximum(left, 0)
+    far = np.iinfo(np.int64).max
+    right_gap = np.where(right < n_samples, sample_times[right_rows] - grid_times, far)
+    left_gap = np.where(left >= 0, grid_times - sample_times[left_rows], far)
+    rows = np.where(left_gap <= right_gap, left_rows, right_rows)
+    return rows, np.minimum(left_gap, right_gap) <= tolerance
+
+
+def _tolerance_ns(rate_hz, tolerance):
+    """Returns tolerance (Timedelta, seconds or None for one grid period at rate_hz) in ns"""
+    if tolerance is None:
+        return int(round(1e9 / rate_hz))
+    if isinstance(tolerance, numbers.Number):
+        return int(round(tolerance * 1e9))
+    return pd.Timedelta(tolerance).value
+
+
+class TimeGrid(object):
+    """Values of fields of the flight data of several Sorties on a common time grid"""
+
+    def __init__(self, frames, fields, rate_hz=5, tolerance=None):
+        """frames is a dictionary of the flight data Dataframes (Timestamp indexed, None for a Sortie without data)
+        keyed by Sortie number, and fields the names of the columns to put on the grid. rate_hz is the rate of the grid and
+        tolerance (Timedelta or seconds, one grid period by default) the largest time from a grid time to the sample
+        taken for it. A field missing from a Dataframe is invalid for that Sortie."""
+        self.fields = list(fields)
+        '''Names of the fields, along the last axis of data'''
+        self.rate_hz = rate_hz
+        '''Rate of the grid (Hz)'''
+        self.sortie_numbers = np.array(sorted(frames.keys()), dtype=np.int64)
+        '''Sortie numbers, along the first axis of data'''
+
+        period = int(round(1e9 / rate_hz))
+        tolerance = _tolerance_ns(rate_hz, tolerance)
+        self.tolerance = pd.Timedelta(tolerance)
+        '''Largest time from a grid time to the sample taken for it'''
+
+        sample_times = {}
+        for sortie_num in self.sortie_numbers:
+            frame = frames[sortie_num]
+            if frame is not None and len(frame) > 0:
+                times = np.asarray(frame.index.values, dtype='datetime64[ns]').view(np.int64)
+                sample_times[sortie_num] = times
+        if len(sample_times) > 0:
+            start = min(times.min() for times in sample_times.values()) // period * period
+            end = -(-max(times.max() for times in sample_times.values()) // period) * period
+            grid = np.arange(start, end + period, period, dtype=np.int64)
+        else:
+            grid = np.zeros(0, dtype=np.int64)
+        self.times = pd.DatetimeIndex(grid.view('datetime64[ns]'))
+        '''Times of the grid, along the second axis of data'''
+
+        self.data = np.full((len(self.sortie_numbers), len(grid), len(self.fields)), np.nan)
+        '''Values of the fields, as a float array of shape (sorties, times, fields), NaN where not valid'''
+        for i, sortie_num in enumerate(self.sortie_numbers):
+            if sortie_num not in sample_times:
+                continue
+            frame = frames[sortie_num]
+            times = sample_times[sortie_num]
+            if np.any(times[1:] < times[:-1]):
+                order = np.argsort(times, kind='mergesort')
+                times = times[order]
+                frame = frame.iloc[order]
+            positions = [j for j, field in enumerate(self.fields) if field in frame.columns]
+            if len(positions) == 0:
+                continue
+            values = np.asarray(frame[[self.fields[j] for j in positions]].values, dtype=np.float64)
+            # only the grid times within the span of the Sortie
+            first = np.searchsorted(grid, times[0] - tolerance, side='left')
+            last = np.searchsorted(grid, times[-1] + tolerance, side='right')
+            rows, near = _nearest_rows(times, grid[first:last], tolerance)
+            sortie_data = self.data[i]
+            sortie_data[first:last, positions] = np.where(near[:, np.newaxis], values[rows], np.nan)
+
+        self.valid = ~np.isnan(self.data)
+        '''Boolean array of the shape of data, True where the value is valid'''
+
+    def __len__(self):
+        return len(self.times)
+
+    def same_grid(self, fields, rate_hz=5, tolerance=None):
+        """True if this grid was made with the arguments fields, rate_hz and tolerance"""
+        return (self.fields == list(fields) and self.rate_hz == rate_hz and
+                self.tolerance.value == _tolerance_ns(rate_hz, tolerance))
+
+    def field_index(self, field):
+        """Returns the position of field along the last axis of data"""
+        return self.fields.index(field)
+
+    def field(self, field):
+        """Returns the values of field as a (sorties, times) array, and the (sorties, times) validity mask"""
+        position = self.field_index(field)
+        return self.data[:, :, position], self.valid[:, :, position]
+
+    def masked(self, field=None):
+        """Returns data, or the values of field, as a numpy masked array hiding the values that are not valid, ready for
+        reductions such as masked('GPS_Alt').max(axis=0)"""
+        if field is None:
+            return np.ma.MaskedArray(self.data, mask=~self.valid)
+        values, valid = self.field(field)
+        return np.ma.MaskedArray(values, mask=~valid)
+
+    def sortie_index(self, sortie_number):
+        """Returns the position of the Sortie numbered sortie_number along the first axis of data"""
+        positions = np.flatnonzero(self.sortie_numbers == sortie_number)
+        if len(positions) == 0:
+            raise KeyError(sortie_number)
+        return int(positions[0])
+
+    def count_valid(self, field):
+        """Returns the number of Sorties with a valid value of field at each grid time"""
+        return self.field(field)[1].sum(axis=0)